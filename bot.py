@@ -1,11 +1,29 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 import os
 from dotenv import load_dotenv
 import config
 import sys
 import asyncio
-from collections import deque
+import base64
+import bisect
+import csv
+import functools
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
+import re
+import shlex
+import shutil
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
@@ -14,9 +32,14 @@ load_dotenv()
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
-intents.presences = True # Required for checking member status
+# Presences are only needed for the "presence" panel stats mode; see PANEL_STATS_MODE in config.py
+intents.presences = getattr(config, 'ENABLE_PRESENCES_INTENT', True)
 
-bot = commands.Bot(command_prefix=config.BOT_PREFIX, intents=intents)
+bot = commands.Bot(
+    command_prefix=config.BOT_PREFIX,
+    intents=intents,
+    enable_debug_events=getattr(config, 'GATEWAY_EVENT_STATS', False)  # Needed for :gateway event counters
+)
 
 # Professional Color Scheme
 class ProfessionalColors:
@@ -197,7 +220,60 @@ def access_level_required(level):
         return True
     return commands.check(predicate)
 
+# --- Single-Flight Target Locks ---
+class TargetFlights:
+    """One in-flight moderation or rank action per (guild, target).
+
+    Claiming is synchronous, so check-and-set cannot interleave on the event loop; a second
+    claim on a busy key is rejected immediately with the current holder. Keys are removed
+    on release, so the registry only ever holds actions that are actually running.
+    """
+
+    def __init__(self):
+        self._inflight = {}  # (guild_id, target_id) -> {"action", "actor", "started"}
+
+    def claim(self, guild_id: int, target_id: int, action: str, actor: discord.abc.User) -> Optional[dict]:
+        """Claim the key; returns None on success or the holder's info if it is already busy."""
+        key = (guild_id, target_id)
+        holder = self._inflight.get(key)
+        if holder is not None:
+            return holder
+        self._inflight[key] = {"action": action, "actor": getattr(actor, "display_name", str(actor)), "started": time.monotonic()}
+        return None
+
+    def release(self, guild_id: int, target_id: int):
+        self._inflight.pop((guild_id, target_id), None)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+TARGET_FLIGHTS = TargetFlights()
+
+def target_busy_message(holder: dict) -> str:
+    elapsed = int(time.monotonic() - holder["started"])
+    return f"**{holder['action'].title()}** by {holder['actor']} is already in progress for this user ({elapsed}s ago). Try again once it finishes."
+
+def single_flight(action: str):
+    """Command decorator: reject the command while another action targets the same member.
+
+    The wrapped command must take the target member as its first argument after ctx.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(ctx, member, *args, **kwargs):
+            holder = TARGET_FLIGHTS.claim(ctx.guild.id, member.id, action, ctx.author)
+            if holder is not None:
+                await ctx.send(embed=EmbedTemplates.warning("Action In Progress", target_busy_message(holder)))
+                return
+            try:
+                return await func(ctx, member, *args, **kwargs)
+            finally:
+                TARGET_FLIGHTS.release(ctx.guild.id, member.id)
+        return wrapper
+    return decorator
+
 # --- Logging Function ---
+# The log helpers return the sent log message (None if nothing was sent) so cases can reference it.
 async def log_action(ctx, action_description, color=ProfessionalColors.NEUTRAL):
     log_channel_id = config.CHANNEL_VARS.get("log-channel")
     if log_channel_id:
@@ -218,9 +294,11 @@ async def log_action(ctx, action_description, color=ProfessionalColors.NEUTRAL):
                 icon_url=ctx.guild.icon.url if ctx.guild.icon else None
             )
             try:
-                await log_channel.send(embed=embed)
+                return await log_channel.send(embed=embed)
             except discord.Forbidden:
                 print(f"Error: Bot does not have permissions to send messages in log channel {log_channel.name}")
+            except discord.HTTPException as e:
+                print(f"Error: Failed to send log message: {e}")
         else:
             print(f"Warning: Log channel with ID {log_channel_id} not found.")
     else:
@@ -252,9 +330,165 @@ async def log_action_interaction(interaction: discord.Interaction, action_descri
             icon_url=interaction.guild.icon.url if interaction.guild.icon else None
         )
     try:
-        await log_channel.send(embed=embed)
+        return await log_channel.send(embed=embed)
+    except discord.Forbidden:
+        print(f"Error: Bot does not have permissions to send messages in log channel {getattr(log_channel, 'name', log_channel_id)}")
+    except discord.HTTPException as e:
+        print(f"Error: Failed to send log message: {e}")
+
+# Log helper for automatic actions with no invoking user (lockdown resume, auto-moderation, etc.)
+async def log_system_event(guild: Optional[discord.Guild], action_description: str, color=ProfessionalColors.NEUTRAL):
+    log_channel_id = config.CHANNEL_VARS.get("log-channel")
+    if not log_channel_id:
+        print("Warning: 'log-channel' not configured in config.py.")
+        return
+    log_channel = bot.get_channel(log_channel_id)
+    if not log_channel:
+        print(f"Warning: Log channel with ID {log_channel_id} not found.")
+        return
+    embed = discord.Embed(
+        title="🤖 Automatic Action Log",
+        description=action_description,
+        color=color,
+        timestamp=discord.utils.utcnow()
+    )
+    if guild:
+        embed.set_footer(
+            text=f"System | Guild: {guild.name}",
+            icon_url=guild.icon.url if guild.icon else None
+        )
+    try:
+        return await log_channel.send(embed=embed)
     except discord.Forbidden:
         print(f"Error: Bot does not have permissions to send messages in log channel {getattr(log_channel, 'name', log_channel_id)}")
+    except discord.HTTPException as e:
+        print(f"Error: Failed to send log message: {e}")
+
+def build_warning_embed(member: discord.abc.User, reason: str, moderator: str) -> discord.Embed:
+    """The warning embed sent by :warn and by automatic warnings."""
+    embed = EmbedTemplates.warning(
+        title="⚠️ Member Warning",
+        description=f"**{member.display_name}** has been warned."
+    )
+    embed.add_field(name="📋 Reason", value=reason, inline=False)
+    embed.add_field(name="👮 Moderator", value=moderator, inline=False)
+    embed.set_thumbnail(url=member.avatar.url if member.avatar else None)
+    return embed
+
+def build_ban_dm_embed(reason: str, moderator_name: str) -> discord.Embed:
+    """The ban notice with the appeal link, sent by :ban and :massban."""
+    return EmbedTemplates.primary(
+        title="Ban Form",
+        description=(
+            "You got banned from Anime Card Realms\n"
+            f"Reason : {reason}\n"
+            f"Author : {moderator_name}\n\n"
+            "You can appeal your ban here - \n"
+            f"{config.APPEAL_SERVER_INVITE_LINK}\n"
+            "use *:appeal* to start it"
+        )
+    )
+
+def build_kick_dm_embed(guild: discord.Guild, reason: str, moderator_name: str) -> discord.Embed:
+    """The kick notice sent by :kick and :masskick."""
+    embed = EmbedTemplates.warning(
+        title="⚠️ You have been Kicked!",
+        description=f"You have been kicked from **{guild.name}**.\n\n**Reason:** {reason}\n\nIf you believe this was a mistake, please contact a staff member."
+    )
+    embed.set_footer(text=f"Kicked by {moderator_name}")
+    return embed
+
+# --- Persistent Data Helpers ---
+DATA_DIR = getattr(config, 'DATA_DIR', 'data')
+
+def data_path(filename: str) -> str:
+    """Return the path of a file inside the bot's data directory."""
+    return os.path.join(DATA_DIR, filename)
+
+def load_json_file(path: str, default):
+    """Read a JSON file, returning `default` if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read {path}: {e}")
+        return default
+
+def save_json_file(path: str, data):
+    """Write JSON atomically (temp file + rename) so a crash never leaves a torn file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+# --- Background Tasks ---
+BACKGROUND_TASKS = set()  # strong references so fire-and-forget tasks aren't garbage-collected mid-run
+
+def _background_task_done(task: asyncio.Task):
+    BACKGROUND_TASKS.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background task {task.get_coro().__qualname__} failed: {task.exception()!r}")
+
+def spawn_task(coro) -> asyncio.Task:
+    """Fire-and-forget asyncio.create_task that keeps the task alive and reports its failure."""
+    task = asyncio.create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_background_task_done)
+    return task
+
+# --- Message Pipeline ---
+class MessagePipeline:
+    """Ordered per-message stages run from a single on_message dispatch.
+
+    Stages are plain functions (sync or async) taking the message. Returning True
+    consumes the message and skips every later stage, e.g. an anti-spam stage that
+    deleted it. Each stage keeps call count, total/max time and stop counters.
+    """
+
+    def __init__(self):
+        self._stages = []  # (order, name, func, is_async, guild_only)
+        self.stats = {}    # name -> [calls, total_ns, max_ns, stops]
+
+    def stage(self, name: str, order: int = 100, guild_only: bool = True):
+        """Decorator registering a stage; lower `order` runs first. Bot messages never reach stages."""
+        def decorator(func):
+            self._stages.append((order, name, func, asyncio.iscoroutinefunction(func), guild_only))
+            self._stages.sort(key=lambda stage: stage[0])
+            self.stats[name] = [0, 0, 0, 0]
+            return func
+        return decorator
+
+    async def dispatch(self, message: discord.Message):
+        if message.author.bot:
+            return
+        in_guild = message.guild is not None
+        for _, name, func, is_async, guild_only in self._stages:
+            if guild_only and not in_guild:
+                continue
+            started = time.perf_counter_ns()
+            try:
+                stop = (await func(message)) if is_async else func(message)
+            except Exception as e:
+                stop = False
+                print(f"Warning: Message stage '{name}' failed: {e}")
+            elapsed = time.perf_counter_ns() - started
+            counters = self.stats[name]
+            counters[0] += 1
+            counters[1] += elapsed
+            if elapsed > counters[2]:
+                counters[2] = elapsed
+            if stop:
+                counters[3] += 1
+                return
+
+    def reset_stats(self):
+        for name in self.stats:
+            self.stats[name] = [0, 0, 0, 0]
+
+MESSAGE_PIPELINE = MessagePipeline()
 
 # --- Appeal System Classes and Views ---
 class AppealButtonView(discord.ui.View):
@@ -338,6 +572,10 @@ class AppealReviewView(discord.ui.View):
             await interaction.followup.send("Error: Main guild not found. Cannot unban. (Ensure bot is in main guild and main guild ID is configured if appeal server is different)", ephemeral=True)
             return
 
+        holder = TARGET_FLIGHTS.claim(main_guild.id, self.banned_user_id, "appeal approval", interaction.user)
+        if holder is not None:
+            await interaction.followup.send(target_busy_message(holder), ephemeral=True)
+            return
         try:
             banned_user = await bot.fetch_user(self.banned_user_id)
             await main_guild.unban(banned_user, reason=f"Appeal approved by {interaction.user.display_name}")
@@ -352,8 +590,10 @@ class AppealReviewView(discord.ui.View):
             await interaction.message.edit(content="Appeal Approved!", view=None)
             await interaction.followup.send(f"Successfully unbanned {banned_user.display_name} and notified them.", ephemeral=True)
             # Log action
+            case = await CASES.open(main_guild.id, "appeal-approve", self.banned_user_id, interaction.user.id, "Ban appeal approved")
             log_ctx = commands.Context(message=interaction.message, bot=bot, prefix=config.BOT_PREFIX, command=bot.get_command('approve_appeal'))
-            await log_action(log_ctx, f"Appeal for {banned_user.display_name} (ID: {self.banned_user_id}) approved by {interaction.user.display_name}.", discord.Color.green())
+            log_message = await log_action(log_ctx, f"**Case #{case.id}** — Appeal for {banned_user.display_name} (ID: {self.banned_user_id}) approved by {interaction.user.display_name}.", discord.Color.green())
+            await CASES.commit(case, log_message)
 
         except discord.NotFound:
             await interaction.followup.send(f"Error: Banned user with ID {self.banned_user_id} not found or already unbanned.", ephemeral=True)
@@ -361,10 +601,16 @@ class AppealReviewView(discord.ui.View):
             await interaction.followup.send("Error: I don\'t have permissions to unban members in the main guild.", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"An unexpected error occurred during approval: {e}", ephemeral=True)
+        finally:
+            TARGET_FLIGHTS.release(main_guild.id, self.banned_user_id)
 
     @discord.ui.button(label="❌ Decline", style=discord.ButtonStyle.red, custom_id="decline_appeal")
     async def decline_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(ephemeral=True)
+        holder = TARGET_FLIGHTS.claim(interaction.guild_id, self.banned_user_id, "appeal decline", interaction.user)
+        if holder is not None:
+            await interaction.followup.send(target_busy_message(holder), ephemeral=True)
+            return
         try:
             appealer = await bot.fetch_user(self.appealer_id)
             try:
@@ -375,13 +621,17 @@ class AppealReviewView(discord.ui.View):
             await interaction.message.edit(content="Appeal Declined.", view=None)
             await interaction.followup.send(f"Appeal declined and {appealer.display_name} notified.", ephemeral=True)
             # Log action
+            case = await CASES.open(interaction.guild_id, "appeal-decline", self.banned_user_id, interaction.user.id, "Ban appeal declined")
             log_ctx = commands.Context(message=interaction.message, bot=bot, prefix=config.BOT_PREFIX, command=bot.get_command('decline_appeal'))
-            await log_action(log_ctx, f"Appeal for user ID {self.banned_user_id} declined by {interaction.user.display_name}.", discord.Color.red())
+            log_message = await log_action(log_ctx, f"**Case #{case.id}** — Appeal for user ID {self.banned_user_id} declined by {interaction.user.display_name}.", discord.Color.red())
+            await CASES.commit(case, log_message)
 
         except discord.NotFound:
             await interaction.followup.send(f"Error: Appeller with ID {self.appealer_id} not found.", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"An unexpected error occurred during decline: {e}", ephemeral=True)
+        finally:
+            TARGET_FLIGHTS.release(interaction.guild_id, self.banned_user_id)
 
     @discord.ui.button(label="🔍 Review", style=discord.ButtonStyle.blurple, custom_id="review_appeal")
     async def review_button(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -421,10 +671,418 @@ class AppealReviewView(discord.ui.View):
         except Exception as e:
             await interaction.followup.send(f"An unexpected error occurred during review channel creation: {e}", ephemeral=True)
 
+# --- Background Job Runner ---
+def short_count(n: int) -> str:
+    """Compact number formatting: 950, 41k, 1.2M."""
+    if n >= 1_000_000:
+        return f"{n / 1_000_000:.1f}M"
+    if n >= 10_000:
+        return f"{n // 1000}k"
+    if n >= 1000:
+        return f"{n / 1000:.1f}k"
+    return str(n)
+
+class Job:
+    """A long-running action with a throttled progress message that can be cancelled."""
+
+    def __init__(self, runner: "JobRunner", job_id: int, name: str, owner: discord.abc.User, channel: discord.abc.Messageable):
+        self.runner = runner
+        self.id = job_id
+        self.name = name
+        self.owner = owner
+        self.channel = channel
+        self.guild_id = getattr(getattr(channel, "guild", None), "id", None)
+        self.status = "queued"
+        self.progress = "Waiting for a free worker..."
+        self.result = None
+        self.message = None
+        self.task = None
+        self.started_at = None
+        self._last_edit = 0.0
+        self._edit_task = None
+
+    def report(self, progress: str):
+        """Record progress; the message is edited at most once per progress interval."""
+        self.progress = progress
+        if self._edit_task is None or self._edit_task.done():
+            wait = self.runner.progress_interval - (time.monotonic() - self._last_edit)
+            self._edit_task = asyncio.create_task(self._flush(max(wait, 0)))
+
+    async def _flush(self, wait: float = 0):
+        if wait:
+            await asyncio.sleep(wait)
+        if not self.message:
+            return
+        self._last_edit = time.monotonic()
+        try:
+            await self.message.edit(embed=self.embed(), view=None if self.finished else self.message_view)
+        except discord.HTTPException:
+            pass
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def embed(self) -> discord.Embed:
+        titles = {
+            "queued": ("⏳", EmbedTemplates.info), "running": ("⚙️", EmbedTemplates.info),
+            "done": ("", EmbedTemplates.success), "failed": ("", EmbedTemplates.error),
+            "cancelled": ("", EmbedTemplates.warning),
+        }
+        icon, template = titles[self.status]
+        text = self.result if self.finished and self.result else self.progress
+        embed = template(f"{icon} Job #{self.id}: {self.name}".strip(), text)
+        embed.set_footer(text=f"Status: {self.status.title()} • Started by {getattr(self.owner, 'display_name', self.owner)}")
+        return embed
+
+class JobCancelView(discord.ui.View):
+    def __init__(self, job: Job):
+        super().__init__(timeout=None)
+        self.job = job
+
+    @discord.ui.button(label="⏹️ Cancel Job", style=discord.ButtonStyle.danger)
+    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.job.owner.id and not has_access_level(interaction, 4):
+            await interaction.response.send_message(embed=EmbedTemplates.error("Access Denied", "Only the job owner or **Access Level 4** can cancel this job."), ephemeral=True)
+            return
+        cancelled = JOB_RUNNER.cancel(self.job.id)
+        message = "Cancellation requested." if cancelled else "This job has already finished."
+        await interaction.response.send_message(message, ephemeral=True)
+
+class JobRunner:
+    """Runs panel/command jobs in the background under a concurrency cap.
+
+    `submit` posts a progress message with a Cancel button and returns immediately;
+    the job coroutine receives its Job, calls `job.report(...)` freely and returns a
+    summary string. Results are posted to the channel, so they never depend on an
+    interaction token that expires after 15 minutes. Emergency work (lockdowns) can pass
+    `bypass_limit=True` to start immediately instead of queueing behind the cap.
+    """
+
+    def __init__(self, max_concurrent: int = 2, progress_interval: float = 3.0):
+        self.progress_interval = progress_interval
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._next_id = 1
+        self.jobs = {}  # job_id -> Job (active and recently finished)
+
+    async def submit(self, name: str, owner: discord.abc.User, channel: discord.abc.Messageable, work,
+                     bypass_limit: bool = False) -> Job:
+        job = Job(self, self._next_id, name, owner, channel)
+        self._next_id += 1
+        self.jobs[job.id] = job
+        job.message_view = JobCancelView(job)
+        job.message = await channel.send(embed=job.embed(), view=job.message_view)
+        job.task = asyncio.create_task(self._run(job, work, bypass_limit))
+        return job
+
+    async def _execute(self, job: Job, work):
+        job.status = "running"
+        job.started_at = time.monotonic()
+        job.report("Starting...")
+        job.result = await work(job)
+        job.status = "done"
+
+    async def _run(self, job: Job, work, bypass_limit: bool = False):
+        try:
+            if bypass_limit:
+                await self._execute(job, work)
+            else:
+                async with self._semaphore:
+                    await self._execute(job, work)
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            job.result = f"Cancelled. Last progress: {job.progress}"
+        except Exception as e:
+            job.status = "failed"
+            job.result = f"Failed: {e}"
+            print(f"Job #{job.id} ({job.name}) failed: {e}")
+        finally:
+            if job._edit_task and not job._edit_task.done():
+                job._edit_task.cancel()
+            job.message_view.stop()
+            await job._flush()
+            self._prune()
+
+    def _prune(self, keep_finished: int = 20):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:-keep_finished]:
+            del self.jobs[job_id]
+
+    def cancel(self, job_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or job.finished or not job.task:
+            return False
+        job.task.cancel()
+        return True
+
+    def active(self, guild_id: Optional[int] = None) -> list:
+        return [job for job in self.jobs.values() if not job.finished and (guild_id is None or job.guild_id == guild_id)]
+
+JOB_RUNNER = JobRunner(
+    max_concurrent=getattr(config, 'JOB_MAX_CONCURRENT', 2),
+    progress_interval=getattr(config, 'JOB_PROGRESS_INTERVAL', 3),
+)
+
+class JobCancelSelect(discord.ui.Select):
+    def __init__(self, jobs: list):
+        options = [
+            discord.SelectOption(label=f"#{job.id} {job.name}"[:100], value=str(job.id), description=job.progress[:100])
+            for job in jobs[:25]
+        ]
+        super().__init__(placeholder="Select a job to cancel...", min_values=1, max_values=1, options=options)
+
+    async def callback(self, interaction: discord.Interaction):
+        job_id = int(self.values[0])
+        if JOB_RUNNER.cancel(job_id):
+            await interaction.response.send_message(embed=EmbedTemplates.warning("Job Cancelled", f"Cancellation requested for job **#{job_id}**."), ephemeral=True)
+            await log_action_interaction(interaction, f"Job #{job_id} cancelled by {interaction.user.display_name}.", ProfessionalColors.WARNING)
+        else:
+            await interaction.response.send_message("That job has already finished.", ephemeral=True)
+
+class JobCancelSelectView(discord.ui.View):
+    def __init__(self, jobs: list):
+        super().__init__(timeout=120)
+        self.add_item(JobCancelSelect(jobs))
+
+async def backup_channels_job(job: Job, guild: discord.Guild) -> str:
+    """Back up every configured channel's history to text files and post them."""
+    backup_dir = "backups"
+    os.makedirs(backup_dir, exist_ok=True)
+    channels = []
+    for channel_id in config.CHANNEL_VARS.values():
+        channel = guild.get_channel(channel_id) if channel_id else None
+        if isinstance(channel, discord.TextChannel) and channel not in channels:
+            channels.append(channel)
+    backup_paths, skipped, total = [], [], 0
+    for index, channel in enumerate(channels, start=1):
+        job.report(f"Channel {index}/{len(channels)} ({channel.mention}), {short_count(total)} messages")
+        filename = f"{backup_dir}/{guild.name}_{channel.name}_{discord.utils.utcnow().strftime('%Y%m%d_%H%M%S')}.txt"
+        try:
+            with open(filename, "w", encoding="utf-8") as f:
+                async for message in channel.history(limit=None, oldest_first=True):
+                    f.write(f"[{message.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {message.author.display_name}: {message.clean_content}\n")
+                    total += 1
+                    if total % 500 == 0:
+                        job.report(f"Channel {index}/{len(channels)} ({channel.mention}), {short_count(total)} messages")
+            backup_paths.append(filename)
+        except discord.Forbidden:
+            skipped.append(f"{channel.mention} (no permission)")
+        except discord.HTTPException as e:
+            skipped.append(f"{channel.mention} ({e})")
+    if not backup_paths:
+        raise RuntimeError("No channels were backed up." + (f" Skipped: {', '.join(skipped)}" if skipped else ""))
+    job.report(f"Uploading {len(backup_paths)} backup file(s)...")
+    for batch in group_files_for_upload(backup_paths, guild.filesize_limit):
+        await job.channel.send(f"💾 Channel backup (job #{job.id})", files=[discord.File(path) for path in batch])
+    summary = f"Backed up **{len(backup_paths)}** channel(s), **{short_count(total)}** messages."
+    if skipped:
+        summary += "\nSkipped: " + ", ".join(skipped)
+    return summary
+
 # --- Custom Panel Classes and Views ---
+STAFF_ROLE_IDS = frozenset(rid for level_roles in config.ACCESS_LEVELS.values() for rid in level_roles)
+STAFF_LAST_SEEN = {}  # member_id -> epoch of last message (staff only)
+APPROX_COUNTS_CACHE = {}  # guild_id -> (fetched_at monotonic, (presence_count, member_count))
+
+def panel_stats_mode() -> str:
+    """Return "presence" or "approximate"; without the presences intent only "approximate" works."""
+    mode = getattr(config, 'PANEL_STATS_MODE', 'presence')
+    if not bot.intents.presences:
+        return "approximate"
+    return mode if mode in ("presence", "approximate") else "presence"
+
+def is_staff_member(member) -> bool:
+    return any(role.id in STAFF_ROLE_IDS for role in getattr(member, "roles", ()))
+
+def estimate_active_staff(guild: discord.Guild) -> int:
+    """Staff who sent a message recently or are in a voice channel (no presence data needed)."""
+    window = getattr(config, 'STAFF_ACTIVE_WINDOW_MINUTES', 15) * 60
+    cutoff = datetime.now(timezone.utc).timestamp() - window
+    active = {member_id for member_id, seen in STAFF_LAST_SEEN.items() if seen >= cutoff}
+    for channel in guild.voice_channels:
+        active.update(member.id for member in channel.members if is_staff_member(member))
+    return len(active)
+
+async def fetch_approximate_counts(guild: discord.Guild) -> tuple:
+    """Fetch (approximate_presence_count, approximate_member_count) via REST, cached per guild."""
+    ttl = getattr(config, 'APPROX_COUNTS_TTL_SECONDS', 60)
+    cached = APPROX_COUNTS_CACHE.get(guild.id)
+    if cached and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    try:
+        fetched = await bot.fetch_guild(guild.id, with_counts=True)
+        counts = (fetched.approximate_presence_count or 0, fetched.approximate_member_count or guild.member_count or 0)
+    except discord.HTTPException as e:
+        print(f"Warning: Could not fetch approximate counts for {guild.name}: {e}")
+        counts = cached[1] if cached else (0, guild.member_count or 0)
+    APPROX_COUNTS_CACHE[guild.id] = (time.monotonic(), counts)
+    return counts
+
+def build_panel_embed(guild: discord.Guild, approx_counts: Optional[tuple] = None) -> discord.Embed:
+    """Compute the panel statistics embed for a guild.
+
+    `approx_counts` is (approximate_presence_count, approximate_member_count) when
+    the panel runs without the presences intent.
+    """
+    if approx_counts is None:
+        # Players Active (online/idle/dnd members)
+        active_players = sum(1 for member in guild.members if member.status != discord.Status.offline)
+
+        # Staff Active (members with configured staff roles who are online/idle/dnd)
+        active_staff = 0
+        for member in guild.members:
+            if member.status != discord.Status.offline:
+                for role in member.roles:
+                    if role.id in STAFF_ROLE_IDS:
+                        active_staff += 1
+                        break # Count once per member
+        players_label, staff_label = "👥 Online Players", "👨‍💼 Active Staff"
+    else:
+        active_players = approx_counts[0]
+        active_staff = estimate_active_staff(guild)
+        players_label, staff_label = "👥 Online Players (approx.)", "👨‍💼 Active Staff (recent)"
+
+    # Server Status
+    server_status_description = (
+        f"Total Members: {guild.member_count}\n"
+        f"Total Channels: {len(guild.channels)}\n"
+        f"Total Roles: {len(guild.roles)}\n"
+        f"Boost Level: {guild.premium_tier} (Boosts: {guild.premium_subscription_count})\n"
+        f"Verification Level: {guild.verification_level.name.replace('_', ' ').title()}"
+    )
+
+    # Activity stats from recent events
+    joins_24h, joins_7d = get_event_counts(JOIN_EVENTS, days_24h=1, days_7d=7)
+    msgs_24h, msgs_7d = get_event_counts(MESSAGE_EVENTS, days_24h=1, days_7d=7)
+    dau, wau, mau = ACTIVE_USERS.count(1), ACTIVE_USERS.count(7), ACTIVE_USERS.count(30)
+
+    embed = EmbedTemplates.primary(
+        title="📊 ACR - System Management Panel",
+        description="Welcome to the ACR System Management Panel. Here you can view server statistics and perform administrative actions."
+    )
+    embed.add_field(name=players_label, value=f"`{active_players}`", inline=True)
+    embed.add_field(name=staff_label, value=f"`{active_staff}`", inline=True)
+    embed.add_field(name="\u200b", value="\u200b", inline=True) # Empty field for spacing
+    embed.add_field(name="📈 Server Statistics", value=server_status_description, inline=False)
+    embed.add_field(name="📊 Activity (24h / 7d)", value=f"Joins: `{joins_24h}` / `{joins_7d}`\nMessages: `{msgs_24h}` / `{msgs_7d}`\nActive Users (DAU / WAU / MAU): `{dau}` / `{wau}` / `{mau}`", inline=False)
+    embed.add_field(name="🚪 Retention (7d)", value=format_retention_summary(7), inline=False)
+    embed.add_field(name="🏆 Top Chatters (24h / 7d)", value=format_top_entries(TOP_CHATTERS.top("24h", 10), "user", "7d", TOP_CHATTERS), inline=True)
+    embed.add_field(name="💬 Top Channels (24h / 7d)", value=format_top_entries(TOP_CHANNELS.top("24h", 10), "channel", "7d", TOP_CHANNELS), inline=True)
+
+    # Modern visuals (optional banner/led gif)
+    if getattr(config, 'PANEL_BANNER_URL', ''):
+        embed.set_image(url=config.PANEL_BANNER_URL)
+    if getattr(config, 'PANEL_LED_GIF_URL', ''):
+        embed.set_thumbnail(url=config.PANEL_LED_GIF_URL)
+    embed.set_footer(
+        text=f"Last updated: {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}",
+        icon_url=guild.icon.url if guild.icon else None
+    )
+
+    return embed
+
+def panel_embed_hash(embed: discord.Embed) -> str:
+    """Hash the embed content, ignoring the "Last updated" footer."""
+    data = embed.to_dict()
+    data.pop("footer", None)
+    data.pop("timestamp", None)
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+class PanelStateProducer:
+    """Shared panel state: stats are computed at most once per interval per guild.
+
+    Every open panel subscribes here. Edits are skipped when the embed hash is
+    unchanged and debounced per message, so spamming Refresh or several live
+    panels never cost more than one computation and one edit per message.
+    """
+
+    def __init__(self, min_interval: float, debounce: float):
+        self.min_interval = min_interval
+        self.debounce = debounce
+        self._states = {}       # guild_id -> (computed_at, embed, hash)
+        self._locks = {}        # guild_id -> asyncio.Lock
+        self.subscribers = {}   # message_id -> (message, view)
+        self._rendered = {}     # message_id -> hash last written
+        self._last_edit = {}    # message_id -> monotonic time of last edit
+        self._pending = {}      # message_id -> delayed edit task
+
+    async def get_state(self, guild: discord.Guild):
+        lock = self._locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            state = self._states.get(guild.id)
+            if state is None or time.monotonic() - state[0] >= self.min_interval:
+                approx_counts = await fetch_approximate_counts(guild) if panel_stats_mode() == "approximate" else None
+                embed = build_panel_embed(guild, approx_counts)
+                state = self._states[guild.id] = (time.monotonic(), embed, panel_embed_hash(embed))
+            return state
+
+    def subscribe(self, message: discord.Message, view: discord.ui.View):
+        self.subscribers[message.id] = (message, view)
+
+    def unsubscribe(self, message_id: int):
+        self.subscribers.pop(message_id, None)
+        self._rendered.pop(message_id, None)
+        self._last_edit.pop(message_id, None)
+        task = self._pending.pop(message_id, None)
+        if task:
+            task.cancel()
+
+    def unsubscribe_view(self, view: discord.ui.View):
+        for message_id, (_, subscribed_view) in list(self.subscribers.items()):
+            if subscribed_view is view:
+                self.unsubscribe(message_id)
+
+    async def push(self, message: discord.Message, force: bool = False) -> bool:
+        """Render the shared state into a panel message. Returns True if an edit was sent."""
+        if not message.guild:
+            return False
+        _, embed, embed_hash = await self.get_state(message.guild)
+        if self._rendered.get(message.id) == embed_hash:
+            return False
+        wait = self.debounce - (time.monotonic() - self._last_edit.get(message.id, 0))
+        if wait > 0 and not force:
+            if message.id not in self._pending:
+                self._pending[message.id] = asyncio.create_task(self._delayed_push(message, wait))
+            return False
+        self._rendered[message.id] = embed_hash
+        self._last_edit[message.id] = time.monotonic()
+        try:
+            await message.edit(embed=embed)
+        except discord.NotFound:
+            self.unsubscribe(message.id)
+            return False
+        except discord.HTTPException as e:
+            self._rendered.pop(message.id, None)
+            print(f"Warning: Could not refresh panel {message.id}: {e}")
+            return False
+        return True
+
+    async def _delayed_push(self, message: discord.Message, wait: float):
+        await asyncio.sleep(wait)
+        self._pending.pop(message.id, None)
+        if message.id in self.subscribers:
+            await self.push(message)
+
+    async def refresh_all(self):
+        for message, _ in list(self.subscribers.values()):
+            await self.push(message)
+
+PANEL_STATE = PanelStateProducer(
+    min_interval=getattr(config, 'PANEL_STATS_MIN_INTERVAL', 30),
+    debounce=getattr(config, 'PANEL_EDIT_DEBOUNCE', 5),
+)
+
+@tasks.loop(seconds=getattr(config, 'PANEL_REFRESH_SECONDS', 60))
+async def refresh_live_panels():
+    await PANEL_STATE.refresh_all()
+
+@refresh_live_panels.before_loop
+async def _before_live_panels():
+    await bot.wait_until_ready()
+
 class PanelView(discord.ui.View):
     def __init__(self, bot_instance):
-        super().__init__(timeout=300) # 5 minutes timeout
+        super().__init__(timeout=getattr(config, 'PANEL_TIMEOUT_SECONDS', 1800)) # Live panels stay usable longer
         self.bot_instance = bot_instance
 
     @discord.ui.button(label="❌ Close Panel", style=discord.ButtonStyle.secondary, custom_id="close_panel")
@@ -434,6 +1092,8 @@ class PanelView(discord.ui.View):
             await interaction.response.send_message(embed=embed, ephemeral=True)
             return
         await interaction.response.defer()
+        PANEL_STATE.unsubscribe(interaction.message.id)
+        self.stop()
         try:
             await interaction.message.delete()
         except discord.Forbidden:
@@ -444,8 +1104,10 @@ class PanelView(discord.ui.View):
     @discord.ui.button(label="🔄 Refresh Stats", style=discord.ButtonStyle.primary, custom_id="refresh_stats")
     async def refresh_stats_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer()
-        await self.update_panel_message(interaction.message)
-        embed = EmbedTemplates.success("Panel Refreshed", "Statistics have been successfully updated!")
+        # Shared state: repeated clicks reuse the latest computation and skip identical edits
+        PANEL_STATE.subscribe(interaction.message, self)
+        await PANEL_STATE.push(interaction.message)
+        embed = EmbedTemplates.success("Panel Refreshed", "Statistics are up to date. Live panels also refresh automatically.")
         await interaction.followup.send(embed=embed, ephemeral=True)
 
     @discord.ui.button(label="🔒 Lock Channel", style=discord.ButtonStyle.secondary, custom_id="lock_channel")
@@ -454,12 +1116,10 @@ class PanelView(discord.ui.View):
             await interaction.response.send_message(embed=EmbedTemplates.error("Access Denied", "Requires **Access Level 2**."), ephemeral=True)
             return
         # Build options now to avoid empty select error
-        text_channels = interaction.guild.text_channels if interaction.guild else []
-        if not text_channels:
+        if not interaction.guild or not get_channel_index(interaction.guild).channels:
             await interaction.response.send_message("No text channels found in this server.", ephemeral=True)
             return
-        options = [discord.SelectOption(label=f"#{ch.name}", value=str(ch.id)) for ch in text_channels[:25]]
-        view = ChannelLockUnlockSelectView(action="lock", options=options)
+        view = ChannelLockUnlockSelectView(action="lock", guild=interaction.guild)
         await interaction.response.send_message("Select a channel to lock:", view=view, ephemeral=True)
 
     @discord.ui.button(label="🔓 Unlock Channel", style=discord.ButtonStyle.secondary, custom_id="unlock_channel")
@@ -467,12 +1127,10 @@ class PanelView(discord.ui.View):
         if not has_access_level(interaction, 2):
             await interaction.response.send_message(embed=EmbedTemplates.error("Access Denied", "Requires **Access Level 2**."), ephemeral=True)
             return
-        text_channels = interaction.guild.text_channels if interaction.guild else []
-        if not text_channels:
+        if not interaction.guild or not get_channel_index(interaction.guild).channels:
             await interaction.response.send_message("No text channels found in this server.", ephemeral=True)
             return
-        options = [discord.SelectOption(label=f"#{ch.name}", value=str(ch.id)) for ch in text_channels[:25]]
-        view = ChannelLockUnlockSelectView(action="unlock", options=options)
+        view = ChannelLockUnlockSelectView(action="unlock", guild=interaction.guild)
         await interaction.response.send_message("Select a channel to unlock:", view=view, ephemeral=True)
 
     @discord.ui.button(label="🔄 Restart Bot", style=discord.ButtonStyle.red, custom_id="restart_bot")
@@ -487,6 +1145,8 @@ class PanelView(discord.ui.View):
         await interaction.response.send_message(embed=embed, ephemeral=True)
         # Log the restart action
         await log_action_interaction(interaction, f"Bot restart initiated by {interaction.user.display_name}.", discord.Color.red())
+        # Flush activity stats so the restart doesn't lose the last few minutes
+        await save_activity_stats()
 
         # Gracefully close the bot and restart the process using current interpreter and args
         await self.bot_instance.close()
@@ -501,86 +1161,371 @@ class PanelView(discord.ui.View):
             return
 
         await interaction.response.defer(ephemeral=True)
-        backup_dir = "backups"
-        os.makedirs(backup_dir, exist_ok=True)
         guild = interaction.guild
-        backup_files = []
 
-        for channel_var, channel_id in config.CHANNEL_VARS.items():
-            if channel_id:
-                channel = guild.get_channel(channel_id)
-                if isinstance(channel, discord.TextChannel):
-                    filename = f"{backup_dir}/{guild.name}_{channel.name}_{discord.utils.utcnow().strftime('%Y%m%d_%H%M%S')}.txt"
-                    try:
-                        with open(filename, "w", encoding="utf-8") as f:
-                            async for message in channel.history(limit=None, oldest_first=True):
-                                f.write(f"[{message.created_at.strftime('%Y-%m-%d %H:%M:%S')}] {message.author.display_name}: {message.clean_content}\n")
-                        backup_files.append(discord.File(filename))
-                    except discord.Forbidden:
-                        await interaction.followup.send(f"Warning: I don\'t have permissions to read messages in {channel.mention}. Skipping backup for this channel.", ephemeral=True)
-                    except Exception as e:
-                        await interaction.followup.send(f"Error backing up {channel.mention}: {e}", ephemeral=True)
-
-        if backup_files:
-            await interaction.followup.send("Channel backups completed!", files=backup_files, ephemeral=True)
-            await log_action_interaction(interaction, f"Channel backup initiated by {interaction.user.display_name}. {len(backup_files)} channels backed up.", discord.Color.blurple())
-        else:
-            await interaction.followup.send("No channels were backed up or an error occurred.", ephemeral=True)
+        async def work(job: Job) -> str:
+            summary = await backup_channels_job(job, guild)
+            await log_action_interaction(interaction, f"Channel backup (job #{job.id}) by {interaction.user.display_name}: {summary}", discord.Color.blurple())
+            return summary
+
+        # Runs in the background: the panel stays responsive and progress is posted in this channel
+        job = await JOB_RUNNER.submit("Channel Backup", interaction.user, interaction.channel, work)
+        await interaction.followup.send(embed=EmbedTemplates.info("Backup Started", f"Backup is running as job **#{job.id}**. Progress is shown in this channel."), ephemeral=True)
+
+    @discord.ui.button(label="📋 Jobs", style=discord.ButtonStyle.secondary, custom_id="background_jobs")
+    async def jobs_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if not has_access_level(interaction, 2):
+            await interaction.response.send_message(embed=EmbedTemplates.error("Access Denied", "Requires **Access Level 2**."), ephemeral=True)
+            return
+        jobs = JOB_RUNNER.active(interaction.guild.id if interaction.guild else None)
+        if not jobs:
+            await interaction.response.send_message(embed=EmbedTemplates.info("Background Jobs", "No jobs are running."), ephemeral=True)
+            return
+        lines = [f"**#{job.id} {job.name}** ({job.status}) by {job.owner.mention}\n{job.progress}" for job in jobs]
+        embed = EmbedTemplates.info("Background Jobs", "\n\n".join(lines)[:4000])
+        view = JobCancelSelectView(jobs) if has_access_level(interaction, 4) else None
+        await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
 
     async def update_panel_message(self, message: discord.Message):
-        guild = message.guild
-        if not guild: return
+        await PANEL_STATE.push(message, force=True)
 
-        # Players Active (online/idle/dnd members)
-        active_players = sum(1 for member in guild.members if member.status != discord.Status.offline)
+    async def on_timeout(self):
+        PANEL_STATE.unsubscribe_view(self)
 
-        # Staff Active (members with configured staff roles who are online/idle/dnd)
-        staff_roles_ids = set()
-        for level_roles in config.ACCESS_LEVELS.values():
-            staff_roles_ids.update(level_roles)
+# --- Channel Index ---
+CHANNEL_KEY_PREFIX = re.compile(r"^[\W_]+")
 
-        active_staff = 0
-        for member in guild.members:
-            if member.status != discord.Status.offline:
-                for role in member.roles:
-                    if role.id in staff_roles_ids:
-                        active_staff += 1
-                        break # Count once per member
+def channel_search_key(name: str) -> str:
+    """Searchable form of a channel name: `︱👀︱𝑠𝑛𝑒𝑎𝑘-𝑝𝑒𝑎𝑘𝑠` -> `sneak-peaks`."""
+    return CHANNEL_KEY_PREFIX.sub("", normalize_for_filter(name))
 
-        # Server Status
-        server_status_description = (
-            f"Total Members: {guild.member_count}\n"
-            f"Total Channels: {len(guild.channels)}\n"
-            f"Total Roles: {len(guild.roles)}\n"
-            f"Boost Level: {guild.premium_tier} (Boosts: {guild.premium_subscription_count})\n"
-            f"Verification Level: {guild.verification_level.name.replace('_', ' ').title()}"
-        )
+class GuildChannelIndex:
+    """Text channels of one guild, kept current from channel events.
 
-        # Activity stats from recent events
-        joins_24h, joins_7d = get_event_counts(JOIN_EVENTS, days_24h=1, days_7d=7)
-        msgs_24h, msgs_7d = get_event_counts(MESSAGE_EVENTS, days_24h=1, days_7d=7)
+    Display order (grouped by category) is recomputed only after a change, and a
+    sorted list of normalized names (see channel_search_key) answers prefix searches
+    with bisect instead of scanning.
+    """
 
-        embed = EmbedTemplates.primary(
-            title="📊 ACR - System Management Panel",
-            description="Welcome to the ACR System Management Panel. Here you can view server statistics and perform administrative actions."
-        )
-        embed.add_field(name="👥 Online Players", value=f"`{active_players}`", inline=True)
-        embed.add_field(name="👨‍💼 Active Staff", value=f"`{active_staff}`", inline=True)
-        embed.add_field(name="\u200b", value="\u200b", inline=True) # Empty field for spacing
-        embed.add_field(name="📈 Server Statistics", value=server_status_description, inline=False)
-        embed.add_field(name="📊 Activity (24h / 7d)", value=f"Joins: `{joins_24h}` / `{joins_7d}`\nMessages: `{msgs_24h}` / `{msgs_7d}`", inline=False)
-
-        # Modern visuals (optional banner/led gif)
-        if getattr(config, 'PANEL_BANNER_URL', ''):
-            embed.set_image(url=config.PANEL_BANNER_URL)
-        if getattr(config, 'PANEL_LED_GIF_URL', ''):
-            embed.set_thumbnail(url=config.PANEL_LED_GIF_URL)
-        embed.set_footer(
-            text=f"Last updated: {discord.utils.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}",
-            icon_url=guild.icon.url if guild.icon else None
-        )
+    def __init__(self):
+        self.channels = {}    # channel_id -> (name, category_id, position)
+        self.categories = {}  # category_id -> (name, position)
+        self._names = []      # sorted (search key, channel_id)
+        self._ordered = None  # cached channel ids in display order
+
+    def upsert(self, channel):
+        if isinstance(channel, discord.CategoryChannel):
+            self.categories[channel.id] = (channel.name, channel.position)
+            self._ordered = None
+        elif isinstance(channel, discord.TextChannel):
+            old = self.channels.get(channel.id)
+            if old and old[0] != channel.name:
+                self._remove_name(old[0], channel.id)
+            if not old or old[0] != channel.name:
+                bisect.insort(self._names, (channel_search_key(channel.name), channel.id))
+            self.channels[channel.id] = (channel.name, channel.category_id, channel.position)
+            self._ordered = None
+
+    def remove(self, channel):
+        if channel.id in self.categories:
+            del self.categories[channel.id]
+            self._ordered = None
+        old = self.channels.pop(channel.id, None)
+        if old:
+            self._remove_name(old[0], channel.id)
+            self._ordered = None
+
+    def _remove_name(self, name: str, channel_id: int):
+        key = channel_search_key(name)
+        i = bisect.bisect_left(self._names, (key, channel_id))
+        if i < len(self._names) and self._names[i] == (key, channel_id):
+            del self._names[i]
+
+    def ordered(self) -> list:
+        if self._ordered is None:
+            def sort_key(channel_id):
+                name, category_id, position = self.channels[channel_id]
+                category = self.categories.get(category_id)
+                return (category[1] if category else -1, category_id or 0, position, channel_id)
+            self._ordered = sorted(self.channels, key=sort_key)
+        return self._ordered
+
+    def page(self, page: int, size: int = 25) -> list:
+        ordered = self.ordered()
+        return ordered[page * size:(page + 1) * size]
+
+    def page_count(self, size: int = 25) -> int:
+        return max(1, math.ceil(len(self.channels) / size))
+
+    def category_name(self, channel_id: int) -> str:
+        category = self.categories.get(self.channels[channel_id][1])
+        return category[0] if category else "No category"
+
+    def search(self, prefix: str, limit: int = 25) -> list:
+        """Channel ids whose name starts with `prefix`, ignoring case, styled letters and emoji/separator prefixes."""
+        prefix = channel_search_key(prefix.strip().replace(" ", "-"))
+        if not prefix:
+            return []
+        results = []
+        i = bisect.bisect_left(self._names, (prefix,))
+        while i < len(self._names) and self._names[i][0].startswith(prefix) and len(results) < limit:
+            results.append(self._names[i][1])
+            i += 1
+        return results
+
+CHANNEL_INDEX = {}  # guild_id -> GuildChannelIndex
+
+def get_channel_index(guild: discord.Guild) -> GuildChannelIndex:
+    index = CHANNEL_INDEX.get(guild.id)
+    if index is None:
+        index = GuildChannelIndex()
+        for channel in guild.channels:
+            index.upsert(channel)
+        CHANNEL_INDEX[guild.id] = index
+    return index
+
+class ChannelSearchModal(discord.ui.Modal, title="🔍 Find Channel"):
+    prefix = discord.ui.TextInput(label="Channel name starts with", placeholder="e.g., gen, support-", max_length=100, required=True)
+
+    def __init__(self, action: str):
+        super().__init__()
+        self.action = action
+
+    async def on_submit(self, interaction: discord.Interaction):
+        matches = get_channel_index(interaction.guild).search(self.prefix.value)
+        if not matches:
+            await interaction.response.send_message(embed=EmbedTemplates.warning("No Matches", f"No text channel starts with `{self.prefix.value}`."), ephemeral=True)
+            return
+        view = ChannelLockUnlockSelectView(self.action, interaction.guild, channel_ids=matches)
+        await interaction.response.send_message(f"Channels starting with `{self.prefix.value}`:", view=view, ephemeral=True)
+
+# --- Channel Locks ---
+CHANNEL_LOCKS_FILE = data_path("channel_locks.json")
+CHANNEL_LOCK_SNAPSHOTS = {}  # str(channel_id) -> overwrites saved before the lock
+CHANNEL_LOCKS_LOCK = asyncio.Lock()
+
+def serialize_overwrites(overwrites: dict) -> list:
+    """Overwrites as [target_id, is_role, allow, deny] rows for JSON storage."""
+    rows = []
+    for target, overwrite in overwrites.items():
+        allow, deny = overwrite.pair()
+        is_role = isinstance(target, discord.Role) or getattr(target, "type", None) is discord.Role
+        rows.append([target.id, is_role, allow.value, deny.value])
+    return rows
+
+def deserialize_overwrites(guild: discord.Guild, rows: list) -> dict:
+    overwrites = {}
+    for target_id, is_role, allow, deny in rows:
+        target = guild.get_role(target_id) if is_role else guild.get_member(target_id)
+        if target is None:
+            target = discord.Object(id=target_id, type=discord.Role if is_role else discord.Member)
+        overwrites[target] = discord.PermissionOverwrite.from_pair(discord.Permissions(allow), discord.Permissions(deny))
+    return overwrites
+
+def build_lock_overwrites(channel: discord.TextChannel) -> dict:
+    """The channel's full overwrite map with @everyone muted and staff roles allowed to speak."""
+    overwrites = dict(channel.overwrites)
+    guild = channel.guild
+    targets = [(guild.default_role, False)]
+    for level_roles in config.ACCESS_LEVELS.values():
+        for role_id in level_roles:
+            role = guild.get_role(role_id)
+            if role:
+                targets.append((role, True))
+    for target, allowed in targets:
+        overwrite = overwrites.get(target, discord.PermissionOverwrite())
+        overwrite = discord.PermissionOverwrite.from_pair(*overwrite.pair())  # copy, don't mutate the cache
+        overwrite.send_messages = allowed
+        overwrites[target] = overwrite
+    return overwrites
+
+def load_channel_locks():
+    CHANNEL_LOCK_SNAPSHOTS.update(load_json_file(CHANNEL_LOCKS_FILE, {}))
+
+async def _save_channel_locks():
+    await asyncio.to_thread(save_json_file, CHANNEL_LOCKS_FILE, dict(CHANNEL_LOCK_SNAPSHOTS))
+
+def is_channel_locked(channel: discord.abc.GuildChannel) -> bool:
+    return str(channel.id) in CHANNEL_LOCK_SNAPSHOTS
+
+async def lock_channel(channel: discord.TextChannel, reason: str = None):
+    """Lock a channel with a single overwrite edit, saving the previous overwrites first.
+
+    Re-locking a locked channel keeps the original snapshot so unlock still restores
+    the pre-lock state.
+    """
+    async with CHANNEL_LOCKS_LOCK:
+        key = str(channel.id)
+        if key not in CHANNEL_LOCK_SNAPSHOTS:
+            CHANNEL_LOCK_SNAPSHOTS[key] = serialize_overwrites(channel.overwrites)
+            await _save_channel_locks()
+    await channel.edit(overwrites=build_lock_overwrites(channel), reason=reason)
 
-        await message.edit(embed=embed, view=self)
+async def unlock_channel(channel: discord.TextChannel, reason: str = None) -> bool:
+    """Restore the overwrites saved at lock time. Returns False if none were saved.
+
+    Channels locked before snapshots existed fall back to clearing @everyone's send_messages.
+    """
+    rows = CHANNEL_LOCK_SNAPSHOTS.get(str(channel.id))
+    if rows is None:
+        overwrites = dict(channel.overwrites)
+        everyone = channel.guild.default_role
+        if everyone in overwrites:
+            overwrite = discord.PermissionOverwrite.from_pair(*overwrites[everyone].pair())
+            overwrite.send_messages = None
+            overwrites[everyone] = overwrite
+        await channel.edit(overwrites=overwrites, reason=reason)
+        return False
+    await channel.edit(overwrites=deserialize_overwrites(channel.guild, rows), reason=reason)
+    async with CHANNEL_LOCKS_LOCK:
+        CHANNEL_LOCK_SNAPSHOTS.pop(str(channel.id), None)
+        await _save_channel_locks()
+    return True
+
+# --- Server Lockdown ---
+LOCKDOWN_FILE = data_path("lockdown.json")
+LOCKDOWN_STATE = {}  # str(guild_id) -> {"action", "channels", "done", "channel_id", "reason"}
+LOCKDOWN_JOBS = {}   # guild_id -> Job currently applying or lifting the lockdown
+LOCKDOWN_SAVE_LOCK = asyncio.Lock()
+
+def lockdown_targets(guild: discord.Guild) -> list:
+    """Public text channels: ones @everyone can currently see and talk in."""
+    excluded = set(getattr(config, 'LOCKDOWN_EXCLUDED_CHANNEL_IDS', []))
+    everyone = guild.default_role
+    targets = []
+    for channel in guild.text_channels:
+        if channel.id in excluded:
+            continue
+        perms = channel.permissions_for(everyone)
+        if perms.view_channel and perms.send_messages:
+            targets.append(channel)
+    return targets
+
+def load_lockdown_state():
+    LOCKDOWN_STATE.update(load_json_file(LOCKDOWN_FILE, {}))
+
+async def _save_lockdown_state():
+    # Workers save after every channel; serialize writes so they don't share the temp file
+    async with LOCKDOWN_SAVE_LOCK:
+        snapshot = json.loads(json.dumps(LOCKDOWN_STATE))
+        await asyncio.to_thread(save_json_file, LOCKDOWN_FILE, snapshot)
+
+async def _run_lockdown(job: Job, guild: discord.Guild) -> str:
+    """Apply or lift the guild's pending lockdown step; resumable from the saved state."""
+    state = LOCKDOWN_STATE[str(guild.id)]
+    action = state["action"]
+    done = set(state["done"])
+    pending = [cid for cid in state["channels"] if cid not in done]
+    total = len(state["channels"])
+    failed = []
+    queue = asyncio.Queue()
+    for channel_id in pending:
+        queue.put_nowait(channel_id)
+
+    async def worker():
+        while True:
+            try:
+                channel_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            channel = guild.get_channel(channel_id)
+            try:
+                if isinstance(channel, discord.TextChannel):
+                    reason = f"Lockdown: {state.get('reason') or 'no reason given'}"
+                    if action == "lock":
+                        await lock_channel(channel, reason=reason)
+                    else:
+                        await unlock_channel(channel, reason=reason)
+            except discord.HTTPException as e:
+                failed.append(f"<#{channel_id}> ({e.status})")
+            except Exception as e:
+                # Keep the other workers going; one bad channel must not abort the whole lockdown
+                failed.append(f"<#{channel_id}> ({type(e).__name__})")
+                print(f"Lockdown {action} failed for channel {channel_id}: {e!r}")
+            done.add(channel_id)
+            state["done"].append(channel_id)
+            try:
+                await _save_lockdown_state()
+            except OSError as e:
+                print(f"Failed to save lockdown state: {e}")
+            verb = "Locked" if action == "lock" else "Restored"
+            job.report(f"{verb} {len(done)}/{total} channels" + (f", {len(failed)} failed" if failed else ""))
+
+    # Channel edits share a per-channel rate-limit bucket, so a small pool of workers
+    # runs in parallel without queueing behind itself; discord.py handles 429s.
+    workers = max(1, getattr(config, 'LOCKDOWN_CONCURRENCY', 4))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+    if action == "lock":
+        state["action"] = "locked"
+        state["done"] = []
+    else:
+        LOCKDOWN_STATE.pop(str(guild.id), None)
+    await _save_lockdown_state()
+    verb = "Locked" if action == "lock" else "Lifted lockdown on"
+    summary = f"{verb} **{total - len(failed)}/{total}** channel(s)."
+    if failed:
+        summary += "\nFailed: " + ", ".join(failed[:20])
+    await log_system_event(guild, f"🚨 Lockdown {'applied' if action == 'lock' else 'lifted'}: {summary}", ProfessionalColors.WARNING if action == "lock" else ProfessionalColors.SUCCESS)
+    return summary
+
+async def _submit_lockdown_job(guild: discord.Guild, owner: discord.abc.User, channel: discord.abc.Messageable) -> Job:
+    name = "Server Lockdown" if LOCKDOWN_STATE[str(guild.id)]["action"] == "lock" else "Lift Lockdown"
+    # Lockdowns skip the job cap: they must not wait behind backups, exports or purges mid-incident
+    job = await JOB_RUNNER.submit(name, owner, channel, lambda job: _run_lockdown(job, guild), bypass_limit=True)
+    LOCKDOWN_JOBS[guild.id] = job
+
+    def _clear(_task):
+        # A done callback also fires for jobs cancelled before their work started
+        if LOCKDOWN_JOBS.get(guild.id) is job:
+            del LOCKDOWN_JOBS[guild.id]
+
+    job.task.add_done_callback(_clear)
+    return job
+
+async def start_lockdown(guild: discord.Guild, owner: discord.abc.User, channel: discord.abc.Messageable, reason: str = None) -> Optional[Job]:
+    """Snapshot every public channel's overwrites to disk, then lock them all. None if already locked down."""
+    if str(guild.id) in LOCKDOWN_STATE:
+        return None
+    targets = lockdown_targets(guild)
+    async with CHANNEL_LOCKS_LOCK:
+        for target in targets:
+            CHANNEL_LOCK_SNAPSHOTS.setdefault(str(target.id), serialize_overwrites(target.overwrites))
+        await _save_channel_locks()
+    LOCKDOWN_STATE[str(guild.id)] = {
+        "action": "lock", "channels": [t.id for t in targets], "done": [],
+        "channel_id": getattr(channel, "id", None), "reason": reason,
+    }
+    await _save_lockdown_state()
+    return await _submit_lockdown_job(guild, owner, channel)
+
+async def lift_lockdown(guild: discord.Guild, owner: discord.abc.User, channel: discord.abc.Messageable) -> Optional[Job]:
+    """Restore the overwrites snapshotted at lockdown time. None if there is no lockdown."""
+    state = LOCKDOWN_STATE.get(str(guild.id))
+    if not state:
+        return None
+    running = LOCKDOWN_JOBS.get(guild.id)
+    if running and not running.finished:
+        # Every target was snapshotted up front, so lifting mid-lock is safe
+        JOB_RUNNER.cancel(running.id)
+        try:
+            await running.task
+        except asyncio.CancelledError:
+            pass
+    state.update(action="lift", done=[], channel_id=getattr(channel, "id", None))
+    await _save_lockdown_state()
+    return await _submit_lockdown_job(guild, owner, channel)
+
+async def resume_lockdowns():
+    """Continue lockdowns that were interrupted by a restart."""
+    for guild_id, state in list(LOCKDOWN_STATE.items()):
+        guild = bot.get_guild(int(guild_id))
+        if not guild or state["action"] not in ("lock", "lift") or int(guild_id) in LOCKDOWN_JOBS:
+            continue
+        channel = guild.get_channel(state.get("channel_id") or 0) or bot.get_channel(config.CHANNEL_VARS.get("log-channel") or 0)
+        if channel:
+            print(f"Resuming interrupted lockdown ({state['action']}) in {guild.name}")
+            await _submit_lockdown_job(guild, bot.user, channel)
 
 class ChannelLockUnlockSelect(discord.ui.Select):
     def __init__(self, action: str, options: list[discord.SelectOption]):
@@ -616,18 +1561,13 @@ class ChannelLockUnlockSelect(discord.ui.Select):
                 await channel.send(cmd)
             # Apply native permission change as a reliable fallback
             try:
-                everyone = interaction.guild.default_role
+                reason = f"Panel {self.action} by {interaction.user}"
                 if self.action == "lock":
-                    # Disallow @everyone sending; allow staff roles to keep speaking
-                    await channel.set_permissions(everyone, send_messages=False)
-                    for level_roles in config.ACCESS_LEVELS.values():
-                        for rid in level_roles:
-                            role = interaction.guild.get_role(rid)
-                            if role:
-                                await channel.set_permissions(role, send_messages=True)
+                    # One overwrite edit: @everyone muted, staff roles allowed; previous overwrites saved
+                    await lock_channel(channel, reason=reason)
                 else:
-                    # Restore @everyone to default (unset)
-                    await channel.set_permissions(everyone, send_messages=None)
+                    # Restore the overwrites saved at lock time
+                    await unlock_channel(channel, reason=reason)
                 # Post a lightweight confirmation in the target channel
                 if self.action == "lock":
                     await channel.send(embed=EmbedTemplates.warning("Channel Locked", "Channel has been locked via panel."))
@@ -655,12 +1595,43 @@ class ChannelLockUnlockSelect(discord.ui.Select):
             )
 
 class ChannelLockUnlockSelectView(discord.ui.View):
-    def __init__(self, action: str, options: list[discord.SelectOption]):
+    """Channel picker over the cached index: one page of 25 at a time, plus prefix search."""
+
+    def __init__(self, action: str, guild: discord.Guild, page: int = 0, channel_ids: Optional[list] = None):
         super().__init__(timeout=120)
         self.action = action
+        self.guild = guild
+        self.page = page
+        self.searching = channel_ids is not None
+        index = get_channel_index(guild)
+        ids = channel_ids if self.searching else index.page(page)
+        options = [
+            discord.SelectOption(label=f"#{index.channels[cid][0]}"[:100], value=str(cid), description=index.category_name(cid)[:100])
+            for cid in ids if cid in index.channels
+        ]
         self.select = ChannelLockUnlockSelect(action, options)
+        if not self.searching:
+            pages = index.page_count()
+            self.select.placeholder = f"Choose a text channel... (page {page + 1}/{pages})"
+            self.previous_page.disabled = page <= 0
+            self.next_page.disabled = page >= pages - 1
+        else:
+            self.remove_item(self.previous_page)
+            self.remove_item(self.next_page)
         self.add_item(self.select)
 
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary, row=1)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(view=ChannelLockUnlockSelectView(self.action, self.guild, self.page - 1))
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary, row=1)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(view=ChannelLockUnlockSelectView(self.action, self.guild, self.page + 1))
+
+    @discord.ui.button(label="🔍 Search", style=discord.ButtonStyle.primary, row=1)
+    async def search_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(ChannelSearchModal(self.action))
+
 # --- Bot Events and Commands ---
 @bot.event
 async def on_ready():
@@ -672,6 +1643,13 @@ async def on_ready():
         status=discord.Status.online
     )
     # Optionally, load persistent views here if needed for AppealReviewView
+    # Pick up lockdowns interrupted by a restart (no-op for ones already running)
+    await resume_lockdowns()
+    if getattr(config, 'ALT_DETECTION_ENABLED', True):
+        for guild in bot.guilds:
+            if guild.id not in BAN_INDEX_SYNCED and guild.me.guild_permissions.ban_members:
+                BAN_INDEX_SYNCED.add(guild.id)
+                spawn_task(sync_ban_index(guild))
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -742,81 +1720,2770 @@ def get_event_counts(store: deque, days_24h: int = 1, days_7d: int = 7):
                 c24 += 1
     return c24, c7
 
-@bot.event
-async def on_member_join(member: discord.Member):
-    JOIN_EVENTS.append(datetime.now(timezone.utc))
+# --- Heavy-Hitter Tracking (Top Chatters / Channels) ---
+class SpaceSavingCounter:
+    """Bounded top-k counter using the Space-Saving algorithm (Metwally et al.).
 
-@bot.event
-async def on_message(message: discord.Message):
-    if message.guild and not message.author.bot:
-        MESSAGE_EVENTS.append(datetime.now(timezone.utc))
-    await bot.process_commands(message)
+    Keeps at most `capacity` keys. Counts are grouped into buckets by value so
+    `offer` is O(1): incrementing a key moves it to the next bucket, and when the
+    table is full the new key replaces one from the minimum bucket and inherits
+    that count as its error.
 
-@bot.command()
-@access_level_required(1)
-async def ping(ctx):
-    """Check the bot's latency and response time."""
-    embed = EmbedTemplates.success(
-        "🏓 Pong!",
-        f"**Latency:** `{round(bot.latency * 1000)}ms`\n"
-        f"**Status:** Online and Ready"
-    )
-    embed.set_footer(text=f"Requested by {ctx.author.display_name}")
-    await ctx.send(embed=embed)
-    await log_action(ctx, f"User {ctx.author.display_name} used the `ping` command.", ProfessionalColors.SUCCESS)
+    Error bounds (N = total offers, k = capacity):
+    • every reported count overestimates the true count by at most `error <= N / k`
+    • any key whose true count exceeds N / k is guaranteed to be tracked
+    """
 
-@bot.command()
-@access_level_required(2)
-async def test_access(ctx):
-    """Test your current access level."""
-    embed = EmbedTemplates.success(
-        f"Hello {ctx.author.display_name}!",
-        "You have at least **Access Level 2** permissions.\n\n"
-        "✅ **Access Level 2:** Admin Team\n"
-        "🔧 You can use admin commands and announcements."
-    )
-    await ctx.send(embed=embed)
-    await log_action(ctx, f"User {ctx.author.display_name} used the `test_access` command.", ProfessionalColors.SUCCESS)
+    __slots__ = ("capacity", "total", "_counts", "_errors", "_buckets", "_min")
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = max(1, int(capacity))
+        self.total = 0
+        self._counts = {}   # key -> estimated count
+        self._errors = {}   # key -> overestimation bound
+        self._buckets = {}  # count -> set of keys with that count
+        self._min = 0
+
+    def __len__(self):
+        return len(self._counts)
+
+    def offer(self, key):
+        self.total += 1
+        counts = self._counts
+        count = counts.get(key)
+        if count is None:
+            if len(counts) < self.capacity:
+                count, error = 0, 0
+            else:
+                # Replace a key from the minimum bucket; it inherits that count as error
+                victims = self._buckets[self._min]
+                victim = victims.pop()
+                count = error = counts.pop(victim)
+                self._errors.pop(victim, None)
+                if not victims:
+                    del self._buckets[count]
+            self._errors[key] = error
+        else:
+            bucket = self._buckets[count]
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[count]
+        count += 1
+        counts[key] = count
+        self._buckets.setdefault(count, set()).add(key)
+        if count == 1 or self._min not in self._buckets:
+            self._min = count
+
+    def count(self, key) -> int:
+        return self._counts.get(key, 0)
+
+    def items(self):
+        """Yield (key, count, error) for every tracked key."""
+        errors = self._errors
+        for key, count in self._counts.items():
+            yield key, count, errors.get(key, 0)
+
+    def dump(self) -> dict:
+        return {"total": self.total, "items": [[k, c, e] for k, c, e in self.items()]}
+
+    @classmethod
+    def load(cls, capacity: int, data: dict) -> "SpaceSavingCounter":
+        sketch = cls(capacity)
+        sketch.total = int(data.get("total", 0))
+        entries = sorted(data.get("items", []), key=lambda item: item[1], reverse=True)
+        for key, count, error in entries[:sketch.capacity]:
+            sketch._counts[key] = count
+            sketch._errors[key] = error
+            sketch._buckets.setdefault(count, set()).add(key)
+        if sketch._buckets:
+            sketch._min = min(sketch._buckets)
+        return sketch
+
+class WindowedTopK:
+    """Top-k over rolling 24h/7d windows with a fixed memory budget.
+
+    Offers go to the current hourly sketch and the current daily sketch (two O(1)
+    updates). Queries merge the last 24 hourly sketches or the last 7 daily ones,
+    so memory is capped at `capacity * (24 + 7)` tracked keys. Merged error is at
+    most the sum of per-sketch errors, i.e. N_window / capacity.
+    """
 
-@bot.command(name='commands')
-@access_level_required(1)
-async def commands_list(ctx, *, command_name: str = None):
-    """Display available commands with interactive help system."""
-    
-    if command_name:
-        # Show help for specific command
-        command = bot.get_command(command_name)
-        if not command:
-            embed = EmbedTemplates.error("Command Not Found", f"No command named `{command_name}` was found.")
-            await ctx.send(embed=embed)
-            return
-        
-        embed = EmbedTemplates.info(
-            f"📖 {command.name}",
-            command.help or "No description available."
-        )
-        
-        # Add usage information
-        usage = f"`{ctx.prefix}{command.name}"
-        if command.signature:
-            usage += f" {command.signature}"
-        usage += "`"
-        
-        embed.add_field(name="Usage", value=usage, inline=False)
-        
-        # Add simple examples for key commands
-        examples = {
-            'promote': f"`{ctx.prefix}promote @user Moderator`",
-            'demote': f"`{ctx.prefix}demote @user Moderator`",
-            'ban': f"`{ctx.prefix}ban @user Breaking rules`",
-            'kick': f"`{ctx.prefix}kick @user Spamming`",
-            'warn': f"`{ctx.prefix}warn @user Bad language`",
-            'announcement': f"`{ctx.prefix}announcement ann-main Message`",
-            'appeal': f"`{ctx.prefix}appeal 123456789`",
-            'panel': f"`{ctx.prefix}panel`"
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self._hours = {}  # epoch hour -> SpaceSavingCounter
+        self._days = {}   # epoch day  -> SpaceSavingCounter
+
+    def _sketch(self, store: dict, slot: int, keep: int) -> SpaceSavingCounter:
+        sketch = store.get(slot)
+        if sketch is None:
+            sketch = store[slot] = SpaceSavingCounter(self.capacity)
+            for old in [s for s in store if s <= slot - keep]:
+                del store[old]
+        return sketch
+
+    def offer(self, key, now: Optional[float] = None):
+        ts = int(now if now is not None else datetime.now(timezone.utc).timestamp())
+        self._sketch(self._hours, ts // 3600, 24).offer(key)
+        self._sketch(self._days, ts // 86400, 7).offer(key)
+
+    def _window(self, window: str, now: Optional[float]):
+        """Return the live sketches covering '24h' or '7d'."""
+        ts = int(now if now is not None else datetime.now(timezone.utc).timestamp())
+        if window == "7d":
+            current, store, keep = ts // 86400, self._days, 7
+        else:
+            current, store, keep = ts // 3600, self._hours, 24
+        return [sketch for slot, sketch in store.items() if slot > current - keep]
+
+    def top(self, window: str = "24h", n: int = 10, now: Optional[float] = None):
+        """Return [(key, count, error)] sorted by estimated count for '24h' or '7d'."""
+        merged = {}
+        for sketch in self._window(window, now):
+            for key, count, error in sketch.items():
+                c, e = merged.get(key, (0, 0))
+                merged[key] = (c + count, e + error)
+        ranked = heapq.nlargest(n, merged.items(), key=lambda kv: kv[1][0])
+        return [(key, count, error) for key, (count, error) in ranked]
+
+    def estimate(self, key, window: str = "24h", now: Optional[float] = None) -> int:
+        """Estimated count for a single key (0 if untracked) over the window."""
+        return sum(sketch.count(key) for sketch in self._window(window, now))
+
+    def dump(self) -> dict:
+        return {
+            "hours": {str(slot): sketch.dump() for slot, sketch in self._hours.items()},
+            "days": {str(slot): sketch.dump() for slot, sketch in self._days.items()},
         }
-        
-        if command.name in examples:
+
+    def load(self, data: dict):
+        for name, store in (("hours", self._hours), ("days", self._days)):
+            for slot, sketch in data.get(name, {}).items():
+                store[int(slot)] = SpaceSavingCounter.load(self.capacity, sketch)
+
+TOP_CHATTERS = WindowedTopK(capacity=getattr(config, 'TOPK_CAPACITY', 100))
+TOP_CHANNELS = WindowedTopK(capacity=getattr(config, 'TOPK_CAPACITY', 100))
+
+def format_top_entries(entries, kind: str, window_other: Optional[str] = None, tracker: Optional[WindowedTopK] = None) -> str:
+    """Render top-k entries as mention lines; optionally append the other window's count."""
+    if not entries:
+        return "`No activity yet`"
+    lines = []
+    for i, (key, count, error) in enumerate(entries, start=1):
+        mention = f"<@{key}>" if kind == "user" else f"<#{key}>"
+        line = f"`{i}.` {mention} • `{count}`"
+        if error:
+            line += f" (±{error})"
+        if window_other and tracker:
+            line += f" / `{tracker.estimate(key, window_other)}`"
+        lines.append(line)
+    return "\n".join(lines)
+
+# --- Distinct Active Users (HyperLogLog) ---
+_U64 = (1 << 64) - 1
+
+def _hash64(value: int) -> int:
+    """SplitMix64 finalizer: cheap, well-mixed 64-bit hash for integer IDs."""
+    x = (value + 0x9E3779B97F4A7C15) & _U64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _U64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _U64
+    return x ^ (x >> 31)
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2^p one-byte registers.
+
+    p=13 uses 8 KB and has a standard error of 1.04/sqrt(2^13) ≈ 1.15%.
+    Registers merge by element-wise max, so per-day counters combine into
+    rolling windows without double counting users active on several days.
+    """
+
+    __slots__ = ("p", "m", "registers")
+
+    def __init__(self, p: int = 13, registers: Optional[bytes] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = bytearray(registers) if registers else bytearray(self.m)
+
+    def add(self, value: int):
+        h = _hash64(value)
+        index = h >> (64 - self.p)
+        w = h & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - w.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        """Return a new counter holding the union of both."""
+        return HyperLogLog(self.p, bytes(map(max, self.registers, other.registers)))
+
+    def count(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(_HLL_INV_POW2[r] for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+_HLL_INV_POW2 = [2.0 ** -r for r in range(65)]
+
+class DailyActiveUsers:
+    """Per-UTC-day HyperLogLog registers for DAU / WAU / MAU.
+
+    Memory is constant: one 8 KB register set per day for `keep_days` days.
+    Days before today never change, so their union is cached until the date rolls.
+    """
+
+    def __init__(self, keep_days: int = 30, p: int = 13):
+        self.keep_days = keep_days
+        self.p = p
+        self._days = {}  # epoch day -> HyperLogLog
+        self._past_cache = {}  # window days -> (today, merged HyperLogLog of previous days)
+
+    def add(self, user_id: int, now: Optional[float] = None):
+        day = int(now if now is not None else datetime.now(timezone.utc).timestamp()) // 86400
+        hll = self._days.get(day)
+        if hll is None:
+            hll = self._days[day] = HyperLogLog(self.p)
+            for old in [d for d in self._days if d <= day - self.keep_days]:
+                del self._days[old]
+        hll.add(user_id)
+
+    def count(self, window_days: int = 1, now: Optional[float] = None) -> int:
+        """Distinct users over the last `window_days` UTC days (including today)."""
+        today = int(now if now is not None else datetime.now(timezone.utc).timestamp()) // 86400
+        cached = self._past_cache.get(window_days)
+        if not cached or cached[0] != today:
+            past = HyperLogLog(self.p)
+            for day, hll in self._days.items():
+                if today - window_days < day < today:
+                    past = past.merge(hll)
+            cached = self._past_cache[window_days] = (today, past)
+        current = self._days.get(today)
+        return (cached[1].merge(current) if current else cached[1]).count()
+
+    def dump(self) -> dict:
+        return {str(day): base64.b64encode(bytes(hll.registers)).decode("ascii") for day, hll in self._days.items()}
+
+    def load(self, data: dict):
+        for day, registers in data.items():
+            self._days[int(day)] = HyperLogLog(self.p, base64.b64decode(registers))
+        self._past_cache.clear()
+
+ACTIVE_USERS = DailyActiveUsers(keep_days=30)
+
+# --- Join / Leave Retention ---
+LEAVE_BUCKETS = (("<10m", 600), ("<1h", 3600), ("<1d", 86400), ("<7d", 7 * 86400))
+
+class MemberFlowTracker:
+    """Compact per-day join/leave counters plus early-leave buckets.
+
+    `recent_joins` is an insertion-ordered map of member ID -> join epoch covering
+    at most the last 7 days (and `max_recent` entries), so a leave can be bucketed
+    by time since join even when the member was never cached.
+    """
+
+    def __init__(self, keep_days: int = 90, max_recent: int = 50000):
+        self.keep_days = keep_days
+        self.max_recent = max_recent
+        self.joins = {}         # epoch day -> joins
+        self.leaves = {}        # epoch day -> leaves
+        self.early_leaves = {}  # epoch day -> [count per LEAVE_BUCKETS entry]
+        self.recent_joins = OrderedDict()
+
+    def _prune(self, today: int):
+        for store in (self.joins, self.leaves, self.early_leaves):
+            if len(store) > self.keep_days:
+                for day in [d for d in store if d <= today - self.keep_days]:
+                    del store[day]
+
+    def record_join(self, member_id: int, now: Optional[float] = None):
+        now = now if now is not None else datetime.now(timezone.utc).timestamp()
+        day = int(now) // 86400
+        self.joins[day] = self.joins.get(day, 0) + 1
+        self.recent_joins.pop(member_id, None)
+        self.recent_joins[member_id] = now
+        horizon = now - LEAVE_BUCKETS[-1][1]
+        while self.recent_joins:
+            oldest_ts = next(iter(self.recent_joins.values()))
+            if oldest_ts >= horizon and len(self.recent_joins) <= self.max_recent:
+                break
+            self.recent_joins.popitem(last=False)
+        self._prune(day)
+
+    def record_leave(self, member_id: int, joined_at: Optional[datetime] = None, now: Optional[float] = None) -> Optional[str]:
+        """Count a leave; return the time-since-join bucket label if it was an early leave."""
+        now = now if now is not None else datetime.now(timezone.utc).timestamp()
+        day = int(now) // 86400
+        self.leaves[day] = self.leaves.get(day, 0) + 1
+        joined_ts = self.recent_joins.pop(member_id, None)
+        if joined_ts is None and joined_at is not None:
+            joined_ts = joined_at.timestamp()
+        self._prune(day)
+        if joined_ts is None:
+            return None
+        stayed = now - joined_ts
+        for index, (label, limit) in enumerate(LEAVE_BUCKETS):
+            if stayed < limit:
+                counts = self.early_leaves.setdefault(day, [0] * len(LEAVE_BUCKETS))
+                counts[index] += 1
+                return label
+        return None
+
+    def _sum(self, store: dict, days: int, today: int) -> int:
+        return sum(count for day, count in store.items() if day > today - days)
+
+    def totals(self, days: int, now: Optional[float] = None):
+        """Return (joins, leaves) over the last `days` UTC days."""
+        today = int(now if now is not None else datetime.now(timezone.utc).timestamp()) // 86400
+        return self._sum(self.joins, days, today), self._sum(self.leaves, days, today)
+
+    def retention(self, days: int = 7, now: Optional[float] = None):
+        """Return (joins, [(label, % of joiners who left within that time)]) for the window.
+
+        Buckets are cumulative: "<1h" includes leaves that happened within 10 minutes.
+        """
+        today = int(now if now is not None else datetime.now(timezone.utc).timestamp()) // 86400
+        joins = self._sum(self.joins, days, today)
+        per_bucket = [0] * len(LEAVE_BUCKETS)
+        for day, counts in self.early_leaves.items():
+            if day > today - days:
+                for index, count in enumerate(counts):
+                    per_bucket[index] += count
+        result, running = [], 0
+        for (label, _), count in zip(LEAVE_BUCKETS, per_bucket):
+            running += count
+            result.append((label, (running / joins * 100) if joins else 0.0))
+        return joins, result
+
+    def net_series(self, days: int, now: Optional[float] = None):
+        """Net growth (joins - leaves) per day, oldest first."""
+        today = int(now if now is not None else datetime.now(timezone.utc).timestamp()) // 86400
+        return [self.joins.get(day, 0) - self.leaves.get(day, 0) for day in range(today - days + 1, today + 1)]
+
+    def dump(self) -> dict:
+        return {
+            "joins": {str(d): c for d, c in self.joins.items()},
+            "leaves": {str(d): c for d, c in self.leaves.items()},
+            "early_leaves": {str(d): c for d, c in self.early_leaves.items()},
+            "recent_joins": [[member_id, ts] for member_id, ts in self.recent_joins.items()],
+        }
+
+    def load(self, data: dict):
+        self.joins.update({int(d): c for d, c in data.get("joins", {}).items()})
+        self.leaves.update({int(d): c for d, c in data.get("leaves", {}).items()})
+        self.early_leaves.update({int(d): c for d, c in data.get("early_leaves", {}).items()})
+        for member_id, ts in data.get("recent_joins", []):
+            self.recent_joins[member_id] = ts
+
+MEMBER_FLOW = MemberFlowTracker()
+
+SPARKLINE_BLOCKS = "▁▂▃▄▅▆▇█"
+
+def render_sparkline(values) -> str:
+    """Render a list of numbers as a unicode sparkline scaled between min and max."""
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    top = len(SPARKLINE_BLOCKS) - 1
+    return "".join(SPARKLINE_BLOCKS[round((v - low) / span * top)] for v in values)
+
+def format_retention_summary(days: int = 7) -> str:
+    joins, buckets = MEMBER_FLOW.retention(days)
+    _, leaves = MEMBER_FLOW.totals(days)
+    left_within = " • ".join(f"{label}: `{pct:.1f}%`" for label, pct in buckets)
+    retained = 100 - buckets[-1][1] if joins else 100.0
+    return (
+        f"Joins: `{joins}` • Leaves: `{leaves}` • Net: `{joins - leaves:+d}`\n"
+        f"Left within {left_within}\n"
+        f"Retained after 7d: `{retained:.1f}%`"
+    )
+
+# --- Daily Activity History ---
+# Only the current UTC day is held in memory. When the day rolls over, the finished
+# day becomes one JSON line appended to ACTIVITY_HISTORY_FILE, which exports stream from.
+ACTIVITY_HISTORY_FILE = data_path("activity_history.jsonl")
+MODERATION_ACTIONS = ("ban", "kick", "warn")
+
+class DailyActivityLog:
+    """Current-day message totals, per-channel hourly heatmap and moderation counts."""
+
+    def __init__(self):
+        self.day = int(datetime.now(timezone.utc).timestamp()) // 86400
+        self.messages = 0
+        self.heatmap = {}  # channel_id -> [24 hourly message counts]
+        self.moderation = {}  # action -> count
+        self.pending_rows = []  # finished days not yet appended to the history file
+
+    def _roll(self, now: float):
+        day = int(now) // 86400
+        if day != self.day:
+            self.pending_rows.append(self.build_row())
+            self.day, self.messages, self.heatmap, self.moderation = day, 0, {}, {}
+
+    def record_message(self, channel_id: int, now: Optional[float] = None):
+        now = now if now is not None else datetime.now(timezone.utc).timestamp()
+        self._roll(now)
+        self.messages += 1
+        hours = self.heatmap.get(channel_id)
+        if hours is None:
+            hours = self.heatmap[channel_id] = [0] * 24
+        hours[int(now) % 86400 // 3600] += 1
+
+    def record_moderation(self, action: str, now: Optional[float] = None):
+        self._roll(now if now is not None else datetime.now(timezone.utc).timestamp())
+        self.moderation[action] = self.moderation.get(action, 0) + 1
+
+    def build_row(self) -> dict:
+        """Snapshot the current day as a history row, pulling joins/leaves/DAU from their trackers."""
+        day = self.day
+        dau_hll = ACTIVE_USERS._days.get(day)
+        return {
+            "day": day,
+            "date": datetime.fromtimestamp(day * 86400, timezone.utc).strftime("%Y-%m-%d"),
+            "joins": MEMBER_FLOW.joins.get(day, 0),
+            "leaves": MEMBER_FLOW.leaves.get(day, 0),
+            "early_leaves": list(MEMBER_FLOW.early_leaves.get(day, [0] * len(LEAVE_BUCKETS))),
+            "messages": self.messages,
+            "active_users": dau_hll.count() if dau_hll else 0,
+            "moderation": dict(self.moderation),
+            "channels": {str(cid): list(hours) for cid, hours in self.heatmap.items()},
+        }
+
+    def take_pending(self) -> list:
+        self._roll(datetime.now(timezone.utc).timestamp())
+        rows, self.pending_rows = self.pending_rows, []
+        return rows
+
+    def dump(self) -> dict:
+        return {
+            "day": self.day,
+            "messages": self.messages,
+            "heatmap": {str(cid): hours for cid, hours in self.heatmap.items()},
+            "moderation": self.moderation,
+            "pending_rows": self.pending_rows,
+        }
+
+    def load(self, data: dict):
+        self.pending_rows = data.get("pending_rows", []) + self.pending_rows
+        if data.get("day") == self.day:
+            self.messages += data.get("messages", 0)
+            for cid, hours in data.get("heatmap", {}).items():
+                current = self.heatmap.setdefault(int(cid), [0] * 24)
+                for hour, count in enumerate(hours):
+                    current[hour] += count
+            for action, count in data.get("moderation", {}).items():
+                self.moderation[action] = self.moderation.get(action, 0) + count
+        elif "day" in data:
+            # The saved day already finished while the bot was offline
+            saved = DailyActivityLog()
+            saved.day = data["day"]
+            saved.messages = data.get("messages", 0)
+            saved.heatmap = {int(cid): hours for cid, hours in data.get("heatmap", {}).items()}
+            saved.moderation = data.get("moderation", {})
+            self.pending_rows.append(saved.build_row())
+
+DAILY_ACTIVITY = DailyActivityLog()
+
+def record_moderation_action(action: str):
+    DAILY_ACTIVITY.record_moderation(action)
+
+def _append_history_rows(path: str, rows: list):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, separators=(",", ":")) + "\n")
+
+async def flush_activity_history():
+    rows = DAILY_ACTIVITY.take_pending()
+    if not rows:
+        return
+    try:
+        await asyncio.to_thread(_append_history_rows, ACTIVITY_HISTORY_FILE, rows)
+    except OSError as e:
+        DAILY_ACTIVITY.pending_rows[:0] = rows
+        print(f"Error: Could not append activity history: {e}")
+
+# --- Stats Export ---
+EXPORT_DIR = "exports"
+DAILY_EXPORT_COLUMNS = (
+    ["date", "joins", "leaves", "net", "messages", "active_users"]
+    + [f"left_{label.strip('<')}" for label, _ in LEAVE_BUCKETS]
+    + [f"{action}s" for action in MODERATION_ACTIONS]
+)
+
+class _SplitGzipWriter:
+    """Write text lines to gzip parts, starting a new part before `max_bytes` is reached.
+
+    Compressed size is read from the underlying file, which lags the compressor by
+    its internal buffer, so parts are cut at 90% of the limit.
+    """
+
+    def __init__(self, directory: str, stem: str, suffix: str, max_bytes: int, header: Optional[str] = None):
+        self.directory = directory
+        self.stem = stem
+        self.suffix = suffix
+        self.cutoff = int(max_bytes * 0.9)
+        self.header = header
+        self.paths = []
+        self._raw = None
+        self._gz = None
+
+    def _open(self):
+        path = os.path.join(self.directory, f"{self.stem}.part{len(self.paths) + 1}{self.suffix}.gz")
+        self.paths.append(path)
+        self._raw = open(path, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        if self.header:
+            self._gz.write((self.header + "\n").encode("utf-8"))
+
+    def write(self, line: str):
+        if self._gz is None:
+            self._open()
+        elif self._raw.tell() >= self.cutoff:
+            self.close()
+            self._open()
+        self._gz.write((line + "\n").encode("utf-8"))
+
+    def close(self):
+        if self._gz is not None:
+            self._gz.close()
+            self._raw.close()
+            self._gz = self._raw = None
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(values)
+    return buffer.getvalue()
+
+def _iter_history_rows(path: str, since_day: int):
+    """Lazily yield history rows newer than `since_day` from the JSONL file."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if row.get("day", 0) >= since_day:
+                    yield row
+    except FileNotFoundError:
+        return
+
+def write_stats_export(out_dir: str, history_path: str, since_day: int, extra_rows: list, max_bytes: int,
+                       cancel: Optional[threading.Event] = None) -> list:
+    """Stream history rows into split gzip CSV/JSONL files. Runs in a worker thread.
+
+    Stops early (returning no paths) once `cancel` is set, since the thread itself cannot be cancelled.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    daily_csv = _SplitGzipWriter(out_dir, "daily", ".csv", max_bytes, header=_csv_line(DAILY_EXPORT_COLUMNS))
+    heatmap_csv = _SplitGzipWriter(out_dir, "channel_heatmap", ".csv", max_bytes, header=_csv_line(["date", "channel_id"] + [f"h{h:02d}" for h in range(24)]))
+    rows_jsonl = _SplitGzipWriter(out_dir, "daily", ".jsonl", max_bytes)
+    writers = (daily_csv, heatmap_csv, rows_jsonl)
+    try:
+        rows = itertools.chain(_iter_history_rows(history_path, since_day), extra_rows)
+        for row in rows:
+            if cancel is not None and cancel.is_set():
+                return []
+            early = row.get("early_leaves") or [0] * len(LEAVE_BUCKETS)
+            moderation = row.get("moderation", {})
+            daily_csv.write(_csv_line(
+                [row.get("date"), row.get("joins", 0), row.get("leaves", 0), row.get("joins", 0) - row.get("leaves", 0),
+                 row.get("messages", 0), row.get("active_users", 0)]
+                + list(early) + [moderation.get(action, 0) for action in MODERATION_ACTIONS]
+            ))
+            for channel_id, hours in row.get("channels", {}).items():
+                heatmap_csv.write(_csv_line([row.get("date"), channel_id] + list(hours)))
+            rows_jsonl.write(json.dumps(row, separators=(",", ":")))
+    finally:
+        for writer in writers:
+            writer.close()
+    return [path for writer in writers for path in writer.paths]
+
+def group_files_for_upload(paths: list, max_bytes: int, max_files: int = 10) -> list:
+    """Group file paths into batches that fit one message (size and attachment count)."""
+    batches, batch, batch_size = [], [], 0
+    for path in paths:
+        size = os.path.getsize(path)
+        if batch and (batch_size + size > max_bytes or len(batch) >= max_files):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(path)
+        batch_size += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+# --- Columnar Member Snapshot ---
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400, "y": 365 * 86400}
+
+def parse_duration(text: str) -> Optional[int]:
+    """Parse durations like `30d`, `12h` or `1d12h` into seconds (None if invalid)."""
+    total, number = 0, ""
+    for ch in text.strip().lower():
+        if ch.isdigit():
+            number += ch
+        elif ch in DURATION_UNITS and number:
+            total += int(number) * DURATION_UNITS[ch]
+            number = ""
+        else:
+            return None
+    if number or total <= 0:
+        return None
+    return total
+
+def tracked_role_ids() -> list:
+    """Unique role IDs referenced in config (access levels, teams, ranks), max 64 for the bitmask."""
+    ordered = []
+    for role_ids in config.ACCESS_LEVELS.values():
+        ordered.extend(role_ids)
+    ordered.extend(getattr(config, 'TEAM_ROLE_IDS', {}).values())
+    for rank_cfg in getattr(config, 'RANKS', {}).values():
+        ordered.extend(rank_cfg.values())
+    unique = list(dict.fromkeys(rid for rid in ordered if rid))
+    if len(unique) > 64:
+        print(f"Warning: {len(unique)} roles configured; member snapshots only track the first 64.")
+    return unique[:64]
+
+class MemberSnapshot:
+    """Column-oriented copy of a guild's members in stdlib arrays.
+
+    Columns: member ID, joined_at / created_at epochs, a bitmask over `tracked_role_ids()`,
+    total role count (excluding @everyone) and a bot flag. A 100k-member guild fits in
+    roughly 3 MB and can be scanned in a worker thread without touching discord objects.
+    """
+
+    def __init__(self, guild_id: int, role_ids: list):
+        self.guild_id = guild_id
+        self.role_bits = {rid: 1 << index for index, rid in enumerate(role_ids)}
+        self.ids = array('Q')
+        self.joined = array('q')
+        self.created = array('q')
+        self.roles = array('Q')
+        self.role_counts = array('H')
+        self.bots = array('B')
+        self.taken_at = datetime.now(timezone.utc)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    async def build(cls, guild: discord.Guild, chunk_size: int = 2000) -> "MemberSnapshot":
+        """Copy guild.members into columns, yielding to the event loop between chunks."""
+        snapshot = cls(guild.id, tracked_role_ids())
+        role_bits = snapshot.role_bits
+        for index, member in enumerate(list(guild.members), start=1):
+            mask = 0
+            for role in member.roles:
+                bit = role_bits.get(role.id)
+                if bit:
+                    mask |= bit
+            snapshot.ids.append(member.id)
+            snapshot.joined.append(int(member.joined_at.timestamp()) if member.joined_at else 0)
+            snapshot.created.append(int(member.created_at.timestamp()))
+            snapshot.roles.append(mask)
+            snapshot.role_counts.append(min(len(member.roles) - 1, 65535))
+            snapshot.bots.append(1 if member.bot else 0)
+            if index % chunk_size == 0:
+                await asyncio.sleep(0)
+        return snapshot
+
+    def mask_for(self, role_ids) -> int:
+        mask = 0
+        for rid in role_ids:
+            mask |= self.role_bits.get(rid, 0)
+        return mask
+
+    def query(self, conditions: list, group_masks: Optional[dict] = None):
+        """Count members matching every condition; optionally bucket matches by group mask.
+
+        `conditions` are callables taking (joined, created, roles, role_count, bot).
+        Returns (count, {group: count}). Pure Python over arrays; run via asyncio.to_thread.
+        """
+        count = 0
+        groups = {name: 0 for name in (group_masks or {})}
+        group_items = list((group_masks or {}).items())
+        for row in zip(self.joined, self.created, self.roles, self.role_counts, self.bots):
+            if all(condition(*row) for condition in conditions):
+                count += 1
+                for name, mask in group_items:
+                    if row[2] & mask:
+                        groups[name] += 1
+        return count, groups
+
+    def select_ids(self, conditions: list) -> list:
+        """IDs of members matching every condition (same callables as `query`)."""
+        return [
+            member_id
+            for member_id, row in zip(self.ids, zip(self.joined, self.created, self.roles, self.role_counts, self.bots))
+            if all(condition(*row) for condition in conditions)
+        ]
+
+MEMBER_SNAPSHOTS = {}  # guild_id -> MemberSnapshot
+MEMBER_AGE_FILTER = re.compile(r"(joined|created)([<>])(\w+)")
+
+async def refresh_member_snapshot(guild: discord.Guild) -> MemberSnapshot:
+    snapshot = await MemberSnapshot.build(guild)
+    MEMBER_SNAPSHOTS[guild.id] = snapshot
+    return snapshot
+
+@tasks.loop(minutes=getattr(config, 'MEMBER_SNAPSHOT_MINUTES', 30))
+async def refresh_member_snapshots():
+    for guild in bot.guilds:
+        try:
+            await refresh_member_snapshot(guild)
+        except Exception as e:
+            print(f"Warning: Member snapshot failed for {guild.name}: {e}")
+
+@refresh_member_snapshots.before_loop
+async def _before_member_snapshots():
+    await bot.wait_until_ready()
+
+def parse_member_filters(tokens: list, snapshot: MemberSnapshot, now: Optional[float] = None):
+    """Translate filter tokens into query conditions.
+
+    Supported: joined<30d, joined>30d, created<7d, created>1y, noroles, hasroles,
+    bots, humans, role:<team name | rank name | role ID>. Returns (conditions, labels).
+    Raises ValueError with a user-facing message on an unknown token.
+    """
+    now = int(now if now is not None else datetime.now(timezone.utc).timestamp())
+    conditions, labels = [], []
+    for token in tokens:
+        lowered = token.lower()
+        age_match = MEMBER_AGE_FILTER.fullmatch(lowered)
+        if age_match:
+            field, op, amount = age_match.groups()
+            seconds = parse_duration(amount)
+            if seconds is None:
+                raise ValueError(f"Invalid duration in `{token}`.")
+            cutoff = now - seconds
+            column = 0 if field == "joined" else 1
+            if op == "<":
+                conditions.append(lambda *row, c=column, t=cutoff: row[c] >= t)
+                labels.append(f"{field} within {amount}")
+            else:
+                conditions.append(lambda *row, c=column, t=cutoff: 0 < row[c] < t)
+                labels.append(f"{field} over {amount} ago")
+        elif lowered == "noroles":
+            conditions.append(lambda *row: row[3] == 0)
+            labels.append("no roles")
+        elif lowered == "hasroles":
+            conditions.append(lambda *row: row[3] > 0)
+            labels.append("has roles")
+        elif lowered in ("bots", "humans"):
+            want = 1 if lowered == "bots" else 0
+            conditions.append(lambda *row, w=want: row[4] == w)
+            labels.append(lowered)
+        elif lowered.startswith("role:"):
+            name = token[5:].strip()
+            team_ids = {key.lower(): rid for key, rid in getattr(config, 'TEAM_ROLE_IDS', {}).items()}
+            rank = next((cfg for rank_name, cfg in config.RANKS.items() if rank_name.lower() == name.lower()), None)
+            if name.lower() in team_ids:
+                role_ids = [team_ids[name.lower()]]
+            elif rank:
+                role_ids = [rank.get("display_role")]
+            elif name.isdigit():
+                role_ids = [int(name)]
+            else:
+                raise ValueError(f"Unknown role `{name}`. Use a team name, rank name or role ID.")
+            mask = snapshot.mask_for(role_ids)
+            if not mask:
+                raise ValueError(f"Role `{name}` is not tracked in the member snapshot.")
+            conditions.append(lambda *row, m=mask: row[2] & m)
+            labels.append(f"role {name}")
+        else:
+            raise ValueError(f"Unknown filter `{token}`.")
+    return conditions, labels
+
+# --- Adaptive Slowmode ---
+class AdaptiveSlowmode:
+    """Raises and lowers a channel's slowmode from its recent message rate.
+
+    The rate is the number of messages in the last `window` seconds. A channel steps
+    up to the highest level whose threshold it reaches and steps down only once the
+    rate falls below `release_ratio` of the current level's threshold (hysteresis).
+    Edits to one channel are spaced at least `min_interval` seconds apart. Only
+    channels the controller raised itself are ever lowered, and a manual slowmode
+    change hands the channel back to staff: it is left alone for at least
+    `manual_cooldown` seconds and until its rate drops below the lowest level.
+    """
+
+    def __init__(self, window: float, levels: list, release_ratio: float = 0.5, min_interval: float = 60,
+                 manual_cooldown: float = 900):
+        self.window = window
+        self.levels = sorted(levels)  # [(messages per window, slowmode seconds)], ascending
+        self.release_ratio = release_ratio
+        self.min_interval = min_interval
+        self.manual_cooldown = manual_cooldown
+        self._events = {}   # channel_id -> deque of message timestamps inside the window
+        self._managed = {}  # channel_id -> {"level", "original", "applied", "changed_at"}
+        self._manual = {}   # channel_id -> earliest time the controller may adopt it again
+        self._pending = set()
+
+    def _trim(self, channel_id: int, now: float) -> int:
+        events = self._events.get(channel_id)
+        if events is None:
+            return 0
+        cutoff = now - self.window
+        while events and events[0] <= cutoff:
+            events.popleft()
+        return len(events)
+
+    def _target_level(self, channel_id: int, now: float) -> int:
+        rate = self._trim(channel_id, now)
+        current = self._managed.get(channel_id, {}).get("level", -1)
+        level = -1
+        for i, (threshold, _) in enumerate(self.levels):
+            if rate >= threshold:
+                level = i
+        if level >= current:
+            return level
+        while current >= 0 and rate < self.levels[current][0] * self.release_ratio:
+            current -= 1
+        return current
+
+    def _hands_off(self, channel_id: int, now: float) -> bool:
+        """True while staff own the channel's slowmode after a manual change."""
+        until = self._manual.get(channel_id)
+        if until is None:
+            return False
+        if now < until or self._trim(channel_id, now) >= self.levels[0][0]:
+            return True
+        del self._manual[channel_id]
+        return False
+
+    def _due(self, channel_id: int, now: float) -> bool:
+        state = self._managed.get(channel_id)
+        if channel_id in self._pending or self._hands_off(channel_id, now):
+            return False
+        if state and now - state["changed_at"] < self.min_interval:
+            return False
+        return self._target_level(channel_id, now) != (state["level"] if state else -1)
+
+    def record(self, channel: discord.abc.GuildChannel, now: Optional[float] = None):
+        """Count a message; schedules a slowmode edit only when the level should change."""
+        if not isinstance(channel, discord.TextChannel):
+            return
+        now = now if now is not None else time.monotonic()
+        self._events.setdefault(channel.id, deque()).append(now)
+        if self._due(channel.id, now):
+            self._pending.add(channel.id)
+            spawn_task(self._apply(channel, now))
+
+    async def _apply(self, channel: discord.TextChannel, now: float):
+        try:
+            state = self._managed.get(channel.id)
+            if state and channel.slowmode_delay != state["applied"]:
+                # Someone changed slowmode by hand; leave the channel to staff for a while
+                del self._managed[channel.id]
+                self._manual[channel.id] = now + self.manual_cooldown
+                return
+            level = self._target_level(channel.id, now)
+            original = state["original"] if state else channel.slowmode_delay
+            if level >= 0:
+                delay = max(self.levels[level][1], original)
+            else:
+                delay = original
+            if delay == channel.slowmode_delay:
+                if level < 0:
+                    self._managed.pop(channel.id, None)
+                return
+            rate = len(self._events.get(channel.id, ()))
+            await channel.edit(slowmode_delay=delay, reason=f"Adaptive slowmode: {rate} messages in {self.window:g}s")
+            if level >= 0:
+                self._managed[channel.id] = {"level": level, "original": original, "applied": delay, "changed_at": now}
+            else:
+                self._managed.pop(channel.id, None)
+            verb = "raised" if not state or delay > state["applied"] else "lowered"
+            await log_system_event(
+                channel.guild,
+                f"🐢 Slowmode {verb} in {channel.mention}: **{delay}s** ({rate} messages in the last {self.window:g}s).",
+                ProfessionalColors.WARNING if verb == "raised" else ProfessionalColors.INFO
+            )
+        except discord.HTTPException as e:
+            print(f"Warning: Could not update slowmode in #{channel.name}: {e}")
+        finally:
+            self._pending.discard(channel.id)
+
+    async def sweep(self):
+        """Step quiet channels back down (no messages means no record() calls) and drop idle windows."""
+        now = time.monotonic()
+        for channel_id in list(self._manual):
+            self._hands_off(channel_id, now)
+        for channel_id in list(self._events):
+            if not self._trim(channel_id, now) and channel_id not in self._managed and channel_id not in self._manual:
+                del self._events[channel_id]
+        for channel_id in list(self._managed):
+            channel = bot.get_channel(channel_id)
+            if channel is None:
+                self._managed.pop(channel_id, None)
+            elif self._due(channel_id, now):
+                self._pending.add(channel_id)
+                await self._apply(channel, now)
+
+SLOWMODE_ENABLED = getattr(config, 'SLOWMODE_AUTO_ENABLED', False)
+SLOWMODE_EXCLUDED = set(getattr(config, 'SLOWMODE_EXCLUDED_CHANNEL_IDS', []))
+SLOWMODE = AdaptiveSlowmode(
+    window=getattr(config, 'SLOWMODE_WINDOW_SECONDS', 10),
+    levels=getattr(config, 'SLOWMODE_LEVELS', [(20, 5), (40, 15), (80, 30)]),
+    release_ratio=getattr(config, 'SLOWMODE_RELEASE_RATIO', 0.5),
+    min_interval=getattr(config, 'SLOWMODE_MIN_EDIT_INTERVAL', 60),
+    manual_cooldown=getattr(config, 'SLOWMODE_MANUAL_COOLDOWN_SECONDS', 900),
+)
+
+@tasks.loop(seconds=15)
+async def sweep_adaptive_slowmode():
+    await SLOWMODE.sweep()
+
+@sweep_adaptive_slowmode.before_loop
+async def _before_slowmode_sweep():
+    await bot.wait_until_ready()
+
+# --- Anti-Spam ---
+class _SpamState:
+    __slots__ = ("tokens", "updated", "hashes", "strikes", "strike_at")
+
+    def __init__(self, capacity: float, now: float, history: int):
+        self.tokens = capacity
+        self.updated = now
+        self.hashes = deque(maxlen=history)
+        self.strikes = 0
+        self.strike_at = 0.0
+
+class AntiSpam:
+    """Per-user message-rate and duplicate-content detector with a fixed memory bound.
+
+    Each user gets a token bucket (`rate` messages/second, bursts up to `capacity`)
+    and the hashes of their last `history` messages. A message that finds the bucket
+    empty, or repeats content already seen `duplicate_limit - 1` times, is a strike;
+    strikes within `strike_window` seconds accumulate and pick the action tier.
+    Users live in an LRU OrderedDict capped at `max_users`, so idle users are evicted
+    first and memory stays flat no matter how many people talk.
+    """
+
+    def __init__(self, rate: float, capacity: float, duplicate_limit: int = 3, history: int = 8,
+                 strike_window: float = 300, max_users: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.duplicate_limit = duplicate_limit
+        self.history = history
+        self.strike_window = strike_window
+        self.max_users = max_users
+        self._users = OrderedDict()
+
+    def check(self, user_id: int, content: str, now: Optional[float] = None):
+        """Record a message. Returns (strikes, reason) for a violation, else None."""
+        now = now if now is not None else time.monotonic()
+        state = self._users.get(user_id)
+        if state is None:
+            state = _SpamState(self.capacity, now, self.history)
+            self._users[user_id] = state
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+            state.tokens = min(self.capacity, state.tokens + (now - state.updated) * self.rate)
+            state.updated = now
+
+        reason = None
+        state.tokens -= 1
+        if state.tokens < 0:
+            state.tokens = 0
+            reason = "sending messages too fast"
+        normalized = " ".join(content.casefold().split())
+        if normalized:
+            digest = hash(normalized)
+            if state.hashes.count(digest) >= self.duplicate_limit - 1:
+                reason = reason or "repeating the same message"
+            state.hashes.append(digest)
+        if reason is None:
+            return None
+        if now - state.strike_at > self.strike_window:
+            state.strikes = 0
+        state.strikes += 1
+        state.strike_at = now
+        return state.strikes, reason
+
+    def forget(self, user_id: int):
+        self._users.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._users)
+
+ANTISPAM_ENABLED = getattr(config, 'ANTISPAM_ENABLED', True)
+ANTISPAM = AntiSpam(
+    rate=getattr(config, 'ANTISPAM_RATE', 1.0),
+    capacity=getattr(config, 'ANTISPAM_BURST', 8),
+    duplicate_limit=getattr(config, 'ANTISPAM_DUPLICATE_LIMIT', 3),
+    history=getattr(config, 'ANTISPAM_HISTORY', 8),
+    strike_window=getattr(config, 'ANTISPAM_STRIKE_WINDOW', 300),
+    max_users=getattr(config, 'ANTISPAM_MAX_TRACKED_USERS', 10000),
+)
+ANTISPAM_TIERS = ("delete", "timeout", "escalate")
+ANTISPAM_THRESHOLDS = getattr(config, 'ANTISPAM_ACTIONS', {"delete": 1, "timeout": 3, "escalate": 5})
+
+def antispam_action(strikes: int) -> Optional[str]:
+    """The highest tier whose strike threshold has been reached."""
+    action = None
+    for tier in ANTISPAM_TIERS:
+        if tier in ANTISPAM_THRESHOLDS and strikes >= ANTISPAM_THRESHOLDS[tier]:
+            action = tier
+    return action
+
+async def apply_antispam_action(message: discord.Message, action: str, strikes: int, reason: str):
+    """Tiers are cumulative: timeout also deletes, escalate also times out and alerts staff."""
+    member = message.author
+    try:
+        await message.delete()
+    except (discord.NotFound, discord.Forbidden):
+        pass
+    if action == "delete":
+        return
+    minutes = getattr(config, 'ANTISPAM_TIMEOUT_MINUTES', 10)
+    if isinstance(member, discord.Member) and not member.is_timed_out():
+        try:
+            await member.timeout(timedelta(minutes=minutes), reason=f"Anti-spam: {reason}")
+        except discord.HTTPException as e:
+            print(f"Warning: Anti-spam could not time out {member}: {e}")
+            return
+        await log_system_event(
+            message.guild,
+            f"🛡️ Anti-spam timed out {member.mention} ({member.id}) for {minutes} min in {message.channel.mention}: {reason} ({strikes} strikes).",
+            ProfessionalColors.WARNING
+        )
+    if action == "escalate" and strikes == ANTISPAM_THRESHOLDS["escalate"]:
+        # Alert once per strike window; later strikes are only deleted
+        await log_system_event(
+            message.guild,
+            f"🚨 **Anti-spam escalation:** {member.mention} ({member.id}) keeps {reason} in {message.channel.mention} "
+            f"after a timeout ({strikes} strikes). Staff review needed.",
+            ProfessionalColors.ERROR
+        )
+
+@MESSAGE_PIPELINE.stage("antispam", order=5)
+def check_spam(message: discord.Message):
+    if not ANTISPAM_ENABLED or is_staff_member(message.author):
+        return False
+    verdict = ANTISPAM.check(message.author.id, message.content)
+    if verdict is None:
+        return False
+    strikes, reason = verdict
+    action = antispam_action(strikes)
+    if action is None:
+        return False
+    spawn_task(apply_antispam_action(message, action, strikes, reason))
+    # The message is being removed: skip stats and command handling for it
+    return True
+
+# --- Banned Phrase Filter ---
+ZERO_WIDTH_CHARS = "\u00ad\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff"
+# Look-alikes NFKC leaves alone (Cyrillic/Greek homoglyphs) plus common leetspeak, mapped to Latin.
+# Sentence punctuation like ! and | is left alone so it still counts as a word boundary.
+CONFUSABLE_CHARS = {
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p",
+    "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ї": "i", "ј": "j", "ѕ": "s", "ԁ": "d",
+    "ɡ": "g", "α": "a", "β": "b", "ε": "e", "ι": "i", "κ": "k", "ν": "v", "ο": "o", "ρ": "p",
+    "τ": "t", "υ": "u", "χ": "x",
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b", "9": "g",
+    "@": "a", "$": "s",
+}
+NORMALIZE_TABLE = str.maketrans({**CONFUSABLE_CHARS, **{ch: None for ch in ZERO_WIDTH_CHARS}})
+
+def normalize_for_filter(text: str) -> str:
+    """NFKC (fullwidth/fancy letters) + casefold + one translate for homoglyphs, leetspeak and zero-width chars."""
+    return unicodedata.normalize("NFKC", text).casefold().translate(NORMALIZE_TABLE)
+
+class PhraseMatcher:
+    """Aho–Corasick automaton over normalized phrases: one pass per message, whatever the list size."""
+
+    def __init__(self, phrases, whole_word: bool = True):
+        self.whole_word = whole_word
+        self.phrases = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        seen = set()
+        for phrase in phrases:
+            normalized = " ".join(normalize_for_filter(phrase).split())
+            if not normalized or normalized in seen:
+                continue
+            seen.add(normalized)
+            self._add(normalized, len(self.phrases))
+            self.phrases.append(phrase)
+        self._build_failure_links()
+
+    def _add(self, pattern: str, pattern_id: int):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + ((pattern_id, len(pattern)),)
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Merge outputs so matches ending here via a shorter suffix are reported too
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str, limit: int = 5) -> list:
+        """Return up to `limit` original phrases found in `text`."""
+        if not self.phrases:
+            return []
+        text = " ".join(normalize_for_filter(text).split())
+        goto, fail, out = self._goto, self._fail, self._out
+        found = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for pattern_id, length in out[state]:
+                    if self.whole_word:
+                        start = i - length + 1
+                        if (start > 0 and text[start - 1].isalnum()) or (i + 1 < len(text) and text[i + 1].isalnum()):
+                            continue
+                    if self.phrases[pattern_id] not in found:
+                        found.append(self.phrases[pattern_id])
+                        if len(found) >= limit:
+                            return found
+        return found
+
+FILTER_LISTS_FILE = data_path("filter_lists.json")
+
+def load_filter_lists(strict: bool = False) -> dict:
+    """Runtime additions to the config lists, re-read by :filter reload (config.py is only read at startup).
+
+    Format: {"phrases": [...], "blocked_domains": [...], "allowed_domains": [...]}.
+    With strict=True a malformed file raises instead of being treated as empty.
+    """
+    if not strict:
+        lists = load_json_file(FILTER_LISTS_FILE, {})
+        return lists if isinstance(lists, dict) else {}
+    try:
+        with open(FILTER_LISTS_FILE, "r", encoding="utf-8") as f:
+            lists = json.load(f)
+    except FileNotFoundError:
+        return {}
+    if not isinstance(lists, dict):
+        raise ValueError(f"{FILTER_LISTS_FILE} must contain a JSON object")
+    return lists
+
+def load_banned_phrases(lists: Optional[dict] = None) -> list:
+    """Phrases from config.BANNED_PHRASES, config.BANNED_PHRASES_FILE (one per line) and the filter lists file."""
+    phrases = list(getattr(config, 'BANNED_PHRASES', []))
+    phrases.extend((lists if lists is not None else load_filter_lists()).get("phrases", []))
+    path = getattr(config, 'BANNED_PHRASES_FILE', "")
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                phrases.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+        except OSError as e:
+            print(f"Warning: Could not read banned phrases file {path}: {e}")
+    return phrases
+
+def build_phrase_matcher(lists: Optional[dict] = None) -> PhraseMatcher:
+    return PhraseMatcher(load_banned_phrases(lists), whole_word=getattr(config, 'BANNED_PHRASES_WHOLE_WORD', True))
+
+PHRASE_FILTER = build_phrase_matcher()
+
+async def handle_banned_phrase(message: discord.Message, matches: list):
+    try:
+        await message.delete()
+    except (discord.NotFound, discord.Forbidden):
+        pass
+    try:
+        embed = EmbedTemplates.warning(
+            "Message Removed",
+            f"Your message in **{message.guild.name}** was removed because it contained a banned word or phrase."
+        )
+        await message.author.send(embed=embed)
+    except (discord.Forbidden, discord.HTTPException):
+        pass
+    await log_system_event(
+        message.guild,
+        f"🚫 Removed a message from {message.author.mention} ({message.author.id}) in {message.channel.mention}. "
+        f"Matched: {', '.join(f'||{m}||' for m in matches)}",
+        ProfessionalColors.WARNING
+    )
+
+@MESSAGE_PIPELINE.stage("phrase_filter", order=8)
+def check_banned_phrases(message: discord.Message):
+    if not message.content or is_staff_member(message.author):
+        return False
+    matches = PHRASE_FILTER.find(message.content)
+    if not matches:
+        return False
+    spawn_task(handle_banned_phrase(message, matches))
+    return True
+
+# --- Link & Invite Scanner ---
+URL_PATTERN = re.compile(r"(?:https?://|\bwww\.)([^\s/<>?#\"']+)", re.IGNORECASE)
+INVITE_PATTERN = re.compile(r"(?:discord(?:app)?\.com/invite|discord\.gg|discord\.me|dsc\.gg)/([A-Za-z0-9-]{2,32})", re.IGNORECASE)
+
+class DomainTrie:
+    """Domain rules keyed by reversed labels: com -> example -> cdn.
+
+    A rule for example.com covers every subdomain; the most specific rule wins, so an
+    allowed cdn.example.com can sit under a denied example.com. Lookup is O(labels).
+    """
+
+    _RULE = "\0rule"
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, domain: str, verdict: str):
+        node = self._root
+        for label in reversed(domain.lower().strip(".").split(".")):
+            node = node.setdefault(label, {})
+        node[self._RULE] = verdict
+
+    def lookup(self, host: str) -> Optional[str]:
+        node = self._root
+        verdict = None
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                break
+            verdict = node.get(self._RULE, verdict)
+        return verdict
+
+def build_domain_rules(lists: Optional[dict] = None) -> DomainTrie:
+    lists = lists if lists is not None else load_filter_lists()
+    trie = DomainTrie()
+    for domain in [*getattr(config, 'LINK_BLOCKED_DOMAINS', []), *lists.get("blocked_domains", [])]:
+        trie.add(domain, "deny")
+    for domain in [*getattr(config, 'LINK_ALLOWED_DOMAINS', []), *lists.get("allowed_domains", [])]:
+        trie.add(domain, "allow")
+    return trie
+
+DOMAIN_RULES = build_domain_rules()
+
+def extract_hosts(content: str) -> set:
+    hosts = set()
+    for match in URL_PATTERN.finditer(content):
+        host = match.group(1).rsplit("@", 1)[-1].split(":", 1)[0].strip(".").lower()
+        if host.startswith("www."):
+            host = host[4:]
+        if "." in host:
+            hosts.add(host)
+    return hosts
+
+class InviteResolver:
+    """Resolves invite codes to guild IDs through a TTL cache.
+
+    Concurrent lookups of the same code share one request (single-flight), and both
+    hits and dead invites are cached, so each code costs at most one fetch per TTL.
+    """
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 5000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # code -> (expires_at, guild_id or None)
+        self._inflight = {}
+        self.hits = 0
+        self.fetches = 0
+
+    async def guild_id(self, code: str) -> Optional[int]:
+        now = time.monotonic()
+        cached = self._cache.get(code)
+        if cached and cached[0] > now:
+            self.hits += 1
+            return cached[1]
+        inflight = self._inflight.get(code)
+        if inflight:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[code] = future
+        try:
+            self.fetches += 1
+            try:
+                invite = await bot.fetch_invite(code, with_counts=False, with_expiration=False)
+                result = invite.guild.id if invite.guild else None
+            except discord.NotFound:
+                result = None
+            self._cache[code] = (now + self.ttl, result)
+            self._cache.move_to_end(code)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            # Transient errors aren't cached; waiters see the same failure
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[code]
+
+INVITE_RESOLVER = InviteResolver(ttl=getattr(config, 'INVITE_CACHE_TTL_SECONDS', 3600))
+
+async def find_link_violation(message: discord.Message) -> Optional[str]:
+    """Describe the first blocked link or foreign invite in the message, if any."""
+    content = message.content
+    block_unlisted = getattr(config, 'LINK_BLOCK_UNLISTED', False)
+    for host in extract_hosts(content):
+        verdict = DOMAIN_RULES.lookup(host)
+        if verdict == "deny" or (verdict is None and block_unlisted):
+            return f"Posting a blocked link (`{host}`)"
+    if getattr(config, 'BLOCK_FOREIGN_INVITES', True):
+        allowed_guilds = {message.guild.id, *getattr(config, 'INVITE_ALLOWED_GUILD_IDS', [])}
+        for code in {m.group(1) for m in INVITE_PATTERN.finditer(content)}:
+            try:
+                guild_id = await INVITE_RESOLVER.guild_id(code)
+            except discord.HTTPException:
+                continue
+            if guild_id is not None and guild_id not in allowed_guilds:
+                return f"Advertising another Discord server (`discord.gg/{code}`)"
+    return None
+
+async def handle_link_violation(message: discord.Message, reason: str):
+    try:
+        await message.delete()
+    except (discord.NotFound, discord.Forbidden):
+        pass
+    dm_sent = True
+    try:
+        await message.author.send(embed=build_warning_embed(message.author, reason, "🤖 Auto-moderation"))
+    except (discord.Forbidden, discord.HTTPException):
+        dm_sent = False
+    record_moderation_action("warn")
+    case = await CASES.open(message.guild.id, "warn", message.author.id, bot.user.id, reason)
+    await issue_warning(message.guild, message.author, bot.user, reason)
+    log_message = await log_system_event(
+        message.guild,
+        f"**Case #{case.id}** — 🔗 Auto-warned {message.author.mention} ({message.author.id}) in {message.channel.mention} for: {reason}."
+        + ("" if dm_sent else " (DM failed)"),
+        ProfessionalColors.WARNING
+    )
+    await CASES.commit(case, log_message)
+
+@MESSAGE_PIPELINE.stage("link_scanner", order=9)
+async def scan_links(message: discord.Message):
+    if "." not in message.content or is_staff_member(message.author):
+        return False
+    reason = await find_link_violation(message)
+    if reason is None:
+        return False
+    spawn_task(handle_link_violation(message, reason))
+    return True
+
+# --- Raid Detection ---
+RAID_COHORTS_FILE = data_path("raid_cohorts.json")
+NAME_SKELETON_STRIP = re.compile(r"[^a-z]+")
+NAME_NUMBER_AFFIX = re.compile(r"^[\d\W_]+|[\d\W_]+$")
+
+def name_skeleton(name: str) -> str:
+    """Letters-only normalized name, so raider_01 / R4IDER-22 / ｒａｉｄｅｒ collapse together.
+
+    Leading/trailing number runs are dropped before leetspeak mapping; digits inside
+    the name still map to letters.
+    """
+    name = NAME_NUMBER_AFFIX.sub("", unicodedata.normalize("NFKC", name))
+    return NAME_SKELETON_STRIP.sub("", normalize_for_filter(name))
+
+class RaidDetector:
+    """Sliding window over recent joins with running sums, so each join costs O(1).
+
+    The burst score is: joins in the window + young_weight * young accounts
+    + avatar_weight * default avatars + name_weight * size of the largest group of
+    joins sharing a name skeleton (once it reaches 3). Crossing `threshold` starts a
+    raid; joins while it's active join its cohort. The raid ends once the score has
+    stayed under half the threshold for a full window.
+
+    With the defaults, a burst of young, default-avatar accounts sharing a name
+    skeleton scores 3.5 per join from the 3rd on (24.5 at the 7th), so it starts a
+    raid on the 8th join.
+    """
+
+    def __init__(self, window: float = 60, threshold: float = 25, young_days: int = 7,
+                 young_weight: float = 1.0, avatar_weight: float = 0.5, name_weight: float = 1.0,
+                 max_tracked: int = 5000):
+        self.window = window
+        self.threshold = threshold
+        self.young_seconds = young_days * 86400
+        self.young_weight = young_weight
+        self.avatar_weight = avatar_weight
+        self.name_weight = name_weight
+        self.max_tracked = max_tracked
+        self._joins = deque()  # (monotonic ts, member_id, young, default_avatar, skeleton)
+        self.young = 0
+        self.default_avatars = 0
+        self._names = {}       # skeleton -> count in window
+        self._name_freq = {}   # count -> number of skeletons with that count
+        self._top_name = 0
+        self.active = None     # current cohort dict while a raid is in progress
+        self._calm_since = None
+
+    def _name_add(self, skeleton: str):
+        count = self._names.get(skeleton, 0) + 1
+        self._names[skeleton] = count
+        if count > 1:
+            self._name_freq[count - 1] -= 1
+        self._name_freq[count] = self._name_freq.get(count, 0) + 1
+        if count > self._top_name:
+            self._top_name = count
+
+    def _name_remove(self, skeleton: str):
+        count = self._names[skeleton]
+        self._name_freq[count] -= 1
+        if count == self._top_name and not self._name_freq[count]:
+            self._top_name -= 1
+        if count == 1:
+            del self._names[skeleton]
+        else:
+            self._names[skeleton] = count - 1
+            self._name_freq[count - 1] = self._name_freq.get(count - 1, 0) + 1
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        while self._joins and (self._joins[0][0] <= cutoff or len(self._joins) > self.max_tracked):
+            _, _, young, default_avatar, skeleton = self._joins.popleft()
+            self.young -= young
+            self.default_avatars -= default_avatar
+            if skeleton:
+                self._name_remove(skeleton)
+
+    def score(self) -> float:
+        similar = self._top_name if self._top_name >= 3 else 0
+        return (len(self._joins) + self.young_weight * self.young
+                + self.avatar_weight * self.default_avatars + self.name_weight * similar)
+
+    def record(self, member: discord.Member, now: Optional[float] = None):
+        """Add a join. Returns "start" when a raid begins, "end" when one finishes, else None."""
+        now = now if now is not None else time.monotonic()
+        age = (discord.utils.utcnow() - member.created_at).total_seconds()
+        young = age < self.young_seconds
+        default_avatar = member.avatar is None
+        skeleton = name_skeleton(member.name)
+        self._joins.append((now, member.id, young, default_avatar, skeleton))
+        self.young += young
+        self.default_avatars += default_avatar
+        if skeleton:
+            self._name_add(skeleton)
+        self._expire(now)
+        score = self.score()
+
+        if self.active is None:
+            if score >= self.threshold:
+                self.active = {
+                    "id": None, "guild_id": member.guild.id,  # numbered by on_raid_started
+                    "started_at": discord.utils.utcnow().isoformat(), "ended_at": None,
+                    "peak_score": score, "member_ids": [entry[1] for entry in self._joins],
+                }
+                self._calm_since = None
+                return "start"
+            return None
+        self.active["member_ids"].append(member.id)
+        self.active["peak_score"] = max(self.active["peak_score"], score)
+        return self._check_calm(score, now)
+
+    def _check_calm(self, score: float, now: float):
+        if score >= self.threshold / 2:
+            self._calm_since = None
+        elif self._calm_since is None:
+            self._calm_since = now
+        elif now - self._calm_since >= self.window:
+            self.active["ended_at"] = discord.utils.utcnow().isoformat()
+            return "end"
+        return None
+
+    def tick(self, now: Optional[float] = None):
+        """End an active raid once joins have stopped; called periodically."""
+        if self.active is None:
+            return None
+        now = now if now is not None else time.monotonic()
+        self._expire(now)
+        return self._check_calm(self.score(), now)
+
+    def finish(self) -> Optional[dict]:
+        cohort, self.active = self.active, None
+        self._calm_since = None
+        return cohort
+
+RAID_DETECTORS = {}  # guild_id -> RaidDetector
+RAID_COHORTS = []    # recent cohorts, newest last
+RAID_COHORT_COUNTER = {"next_id": 1}  # persisted with the cohorts so IDs never repeat
+RAID_COHORTS_LOCK = asyncio.Lock()
+
+def get_raid_detector(guild_id: int) -> RaidDetector:
+    detector = RAID_DETECTORS.get(guild_id)
+    if detector is None:
+        detector = RaidDetector(
+            window=getattr(config, 'RAID_WINDOW_SECONDS', 60),
+            threshold=getattr(config, 'RAID_SCORE_THRESHOLD', 25),
+            young_days=getattr(config, 'RAID_YOUNG_ACCOUNT_DAYS', 7),
+            young_weight=getattr(config, 'RAID_YOUNG_ACCOUNT_WEIGHT', 1.0),
+            avatar_weight=getattr(config, 'RAID_DEFAULT_AVATAR_WEIGHT', 0.5),
+            name_weight=getattr(config, 'RAID_SIMILAR_NAME_WEIGHT', 1.0),
+        )
+        RAID_DETECTORS[guild_id] = detector
+    return detector
+
+def load_raid_cohorts():
+    """Load saved cohorts; any still open when the bot stopped is closed, since its detector state is gone."""
+    data = load_json_file(RAID_COHORTS_FILE, {})
+    if isinstance(data, list):  # older files stored just the cohort list
+        data = {"cohorts": data}
+    RAID_COHORTS[:] = data.get("cohorts", [])
+    RAID_COHORT_COUNTER["next_id"] = max(
+        [data.get("next_id", 1)] + [cohort["id"] + 1 for cohort in RAID_COHORTS if isinstance(cohort.get("id"), int)]
+    )
+    interrupted = [cohort for cohort in RAID_COHORTS if cohort.get("ended_at") is None]
+    for cohort in interrupted:
+        cohort["ended_at"] = discord.utils.utcnow().isoformat()
+        cohort["interrupted"] = True
+    if interrupted:
+        save_json_file(RAID_COHORTS_FILE, {"next_id": RAID_COHORT_COUNTER["next_id"], "cohorts": RAID_COHORTS})
+
+def next_raid_cohort_id() -> int:
+    cohort_id = RAID_COHORT_COUNTER["next_id"]
+    RAID_COHORT_COUNTER["next_id"] += 1
+    return cohort_id
+
+async def save_raid_cohorts():
+    async with RAID_COHORTS_LOCK:
+        keep = getattr(config, 'RAID_COHORTS_KEPT', 20)
+        del RAID_COHORTS[:-keep]
+        snapshot = json.loads(json.dumps({"next_id": RAID_COHORT_COUNTER["next_id"], "cohorts": RAID_COHORTS}))
+        await asyncio.to_thread(save_json_file, RAID_COHORTS_FILE, snapshot)
+
+def find_raid_cohort(cohort_id: int) -> Optional[dict]:
+    for cohort in RAID_COHORTS:
+        if cohort["id"] == cohort_id:
+            return cohort
+    return None
+
+async def on_raid_started(guild: discord.Guild, detector: RaidDetector):
+    cohort = detector.active
+    cohort["id"] = next_raid_cohort_id()
+    RAID_COHORTS.append(cohort)
+    await save_raid_cohorts()
+    actions = []
+    if getattr(config, 'RAID_RAISE_VERIFICATION', False) and guild.verification_level < discord.VerificationLevel.high:
+        try:
+            await guild.edit(verification_level=discord.VerificationLevel.high, reason="Raid detected")
+            actions.append("verification level raised to **High**")
+        except discord.HTTPException as e:
+            actions.append(f"could not raise verification level ({e.status})")
+    if getattr(config, 'RAID_AUTO_LOCKDOWN', False):
+        log_channel = bot.get_channel(config.CHANNEL_VARS.get("log-channel") or 0)
+        if log_channel and await start_lockdown(guild, bot.user, log_channel, "Raid detected"):
+            actions.append("server lockdown started")
+    role_id = getattr(config, 'RAID_ALERT_ROLE_ID', 0)
+    await log_system_event(
+        guild,
+        (f"<@&{role_id}> " if role_id else "")
+        + f"🚨 **Possible raid detected** (cohort `{cohort['id']}`)\n"
+        f"Joins in the last {detector.window:g}s: **{len(detector._joins)}** • young accounts: **{detector.young}** • "
+        f"default avatars: **{detector.default_avatars}** • largest same-name group: **{detector._top_name}** • "
+        f"score **{cohort['peak_score']:.0f}** / {detector.threshold:g}\n"
+        + (f"Actions: {', '.join(actions)}\n" if actions else "")
+        + f"Further joins are added to the cohort; use `{config.BOT_PREFIX}raid` to review it.",
+        ProfessionalColors.ERROR
+    )
+
+async def on_raid_ended(guild: discord.Guild, detector: RaidDetector):
+    cohort = detector.finish()
+    await save_raid_cohorts()
+    await log_system_event(
+        guild,
+        f"✅ Raid cohort `{cohort['id']}` closed: **{len(cohort['member_ids'])}** member(s), peak score **{cohort['peak_score']:.0f}**.",
+        ProfessionalColors.SUCCESS
+    )
+
+@tasks.loop(seconds=30)
+async def close_finished_raids():
+    for guild_id, detector in list(RAID_DETECTORS.items()):
+        if detector.tick() == "end":
+            guild = bot.get_guild(guild_id)
+            if guild:
+                await on_raid_ended(guild, detector)
+            else:
+                detector.finish()
+
+@close_finished_raids.before_loop
+async def _before_close_raids():
+    await bot.wait_until_ready()
+
+# --- Alt Account Detection ---
+BAN_INDEX_FILE = data_path("ban_index.json")
+NAME_GRAM_STRIP = re.compile(r"[^a-z0-9]+")
+
+def name_trigrams(*names: str) -> set:
+    """Padded character trigrams of the normalized names."""
+    grams = set()
+    for name in names:
+        if not name:
+            continue
+        text = f"${NAME_GRAM_STRIP.sub('', normalize_for_filter(name))}$"
+        if len(text) < 4:
+            continue
+        grams.update(text[i:i + 3] for i in range(len(text) - 2))
+    return grams
+
+class BanHistoryIndex:
+    """Previously banned users, indexed for instant look-alike checks on join.
+
+    Names go into a trigram inverted index (Dice similarity) and avatars into an exact
+    asset-hash map; account creation proximity then boosts those candidates. Everything
+    is in memory, so matching a join needs no REST calls.
+    """
+
+    __slots__ = ("records", "_by_user", "_grams", "_avatars", "max_posting")
+
+    def __init__(self, max_posting: int = 2000):
+        self.records = []      # dicts; None once unbanned
+        self._by_user = {}     # user_id -> record index
+        self._grams = {}       # trigram -> list of record indexes
+        self._avatars = {}     # avatar hash -> record index
+        self.max_posting = max_posting
+
+    def __len__(self):
+        return len(self._by_user)
+
+    def add(self, user_id: int, name: str, display_name: Optional[str], avatar: Optional[str],
+            created_ts: int, reason: Optional[str] = None, source: str = "banlist"):
+        if user_id in self._by_user:
+            record = self.records[self._by_user[user_id]]
+            if reason:
+                record["reason"], record["source"] = reason, source
+            return
+        index = len(self.records)
+        grams = name_trigrams(name, display_name)
+        self.records.append({
+            "id": user_id, "name": name, "display_name": display_name, "avatar": avatar,
+            "created": created_ts, "reason": reason, "source": source, "grams": len(grams),
+        })
+        self._by_user[user_id] = index
+        for gram in grams:
+            self._grams.setdefault(gram, []).append(index)
+        if avatar:
+            self._avatars[avatar] = index
+
+    def add_user(self, user: discord.abc.User, reason: Optional[str] = None, source: str = "banlist"):
+        self.add(
+            user.id, user.name, getattr(user, "global_name", None),
+            user.avatar.key if user.avatar else None,
+            int(user.created_at.timestamp()), reason, source,
+        )
+
+    def remove(self, user_id: int):
+        index = self._by_user.pop(user_id, None)
+        if index is not None:
+            record = self.records[index]
+            if record["avatar"] and self._avatars.get(record["avatar"]) == index:
+                del self._avatars[record["avatar"]]
+            self.records[index] = None  # postings are skipped lazily
+
+    def match(self, member: discord.abc.User, limit: int = 3) -> list:
+        """Score banned users resembling `member`. Returns [(score, record, reasons)], best first."""
+        weights = getattr(config, 'ALT_MATCH_WEIGHTS', {"name": 0.7, "avatar": 0.6, "created": 0.2})
+        window = getattr(config, 'ALT_CREATION_WINDOW_HOURS', 24) * 3600
+        grams = name_trigrams(member.name, getattr(member, "global_name", None))
+        shared = {}
+        for gram in grams:
+            postings = self._grams.get(gram)
+            if postings and len(postings) <= self.max_posting:  # skip near-universal grams
+                for index in postings:
+                    shared[index] = shared.get(index, 0) + 1
+        candidates = {}
+        for index, count in shared.items():
+            record = self.records[index]
+            if record:
+                similarity = 2 * count / (len(grams) + record["grams"])
+                if similarity >= 0.5:
+                    candidates[index] = [weights["name"] * similarity, [f"name {similarity:.0%} similar"]]
+        avatar = member.avatar.key if member.avatar else None
+        if avatar and avatar in self._avatars:
+            entry = candidates.setdefault(self._avatars[avatar], [0.0, []])
+            entry[0] += weights["avatar"]
+            entry[1].append("same avatar")
+        # Creation proximity only strengthens a name/avatar lookalike, never flags on its own
+        created = member.created_at.timestamp()
+        for index, entry in candidates.items():
+            record = self.records[index]
+            gap = abs(created - record["created"]) if record else window
+            if gap < window:
+                entry[0] += weights["created"] * (1 - gap / window)
+                entry[1].append(f"created {gap / 3600:.1f}h apart")
+        results = [
+            (min(score, 1.0), self.records[index], reasons)
+            for index, (score, reasons) in candidates.items()
+            if self.records[index] and self.records[index]["id"] != member.id
+        ]
+        results.sort(key=lambda r: r[0], reverse=True)
+        return results[:limit]
+
+    def dump(self) -> list:
+        return [record for record in self.records if record]
+
+    @classmethod
+    def load(cls, rows: list) -> "BanHistoryIndex":
+        index = cls()
+        for row in rows:
+            index.add(row["id"], row["name"], row.get("display_name"), row.get("avatar"),
+                      row["created"], row.get("reason"), row.get("source", "banlist"))
+        return index
+
+BAN_INDEXES = {}  # guild_id -> BanHistoryIndex
+_ban_index_save_task = None
+
+def get_ban_index(guild_id: int) -> BanHistoryIndex:
+    index = BAN_INDEXES.get(guild_id)
+    if index is None:
+        index = BAN_INDEXES[guild_id] = BanHistoryIndex()
+    return index
+
+def load_ban_indexes():
+    for guild_id, rows in load_json_file(BAN_INDEX_FILE, {}).items():
+        BAN_INDEXES[int(guild_id)] = BanHistoryIndex.load(rows)
+
+async def save_ban_indexes():
+    snapshot = {str(guild_id): index.dump() for guild_id, index in BAN_INDEXES.items()}
+    await asyncio.to_thread(save_json_file, BAN_INDEX_FILE, snapshot)
+
+def schedule_ban_index_save(delay: float = 10):
+    """Coalesce bursts of bans (mass bans, ban-list sync) into one write."""
+    global _ban_index_save_task
+    if _ban_index_save_task and not _ban_index_save_task.done():
+        return
+
+    async def _save_later():
+        await asyncio.sleep(delay)
+        await save_ban_indexes()
+
+    _ban_index_save_task = asyncio.create_task(_save_later())
+
+def record_ban(guild: discord.Guild, user: discord.abc.User, reason: Optional[str] = None, source: str = "command"):
+    get_ban_index(guild.id).add_user(user, reason, source)
+    schedule_ban_index_save()
+
+async def sync_ban_index(guild: discord.Guild):
+    """Reconcile the index with the guild's ban list (background, once per start)."""
+    index = get_ban_index(guild.id)
+    banned = set()
+    try:
+        async for entry in guild.bans(limit=None):
+            banned.add(entry.user.id)
+            index.add_user(entry.user, entry.reason, "banlist")
+            if len(banned) % 1000 == 0:
+                await asyncio.sleep(0)
+    except discord.HTTPException as e:
+        print(f"Warning: Could not read the ban list of {guild.name}: {e}")
+        return
+    for record in index.dump():
+        if record["id"] not in banned:
+            index.remove(record["id"])
+    await save_ban_indexes()
+    print(f"Ban index for {guild.name}: {len(index)} banned users")
+
+BAN_INDEX_SYNCED = set()
+
+async def check_alt_account(member: discord.Member):
+    index = BAN_INDEXES.get(member.guild.id)
+    if not index:
+        return
+    started = time.perf_counter_ns()
+    matches = index.match(member)
+    elapsed_us = (time.perf_counter_ns() - started) / 1000
+    threshold = getattr(config, 'ALT_MATCH_THRESHOLD', 0.6)
+    matches = [m for m in matches if m[0] >= threshold]
+    if not matches:
+        return
+    lines = [
+        f"• **{score:.0%}** <@{record['id']}> (`{record['name']}`, {record['id']}): {', '.join(reasons)}"
+        + (f"\n  Ban reason: {record['reason'][:150]}" if record.get("reason") else "")
+        for score, record, reasons in matches
+    ]
+    await log_system_event(
+        member.guild,
+        f"🕵️ **Possible alt account:** {member.mention} (`{member.name}`, {member.id}, created "
+        f"{discord.utils.format_dt(member.created_at, 'R')}) resembles banned users:\n" + "\n".join(lines)
+        + f"\n-# Checked {len(index)} bans in {elapsed_us:.0f} µs",
+        ProfessionalColors.WARNING
+    )
+
+# --- Join Queue ---
+class JoinQueue:
+    """Per-join side effects (welcome post, auto-roles) processed off on_member_join.
+
+    Welcomes are buffered and posted as one combined message per batch. Role grants go
+    through a single worker paced at `role_rate` grants/second so a join flood never
+    eats the REST budget moderation needs. Under load the queue sheds work: welcomes
+    are skipped while a raid is active or the role backlog passes `shed_depth`, and
+    the oldest grants are dropped beyond `max_depth`.
+    """
+
+    def __init__(self, batch_seconds: float = 5, batch_size: int = 20, role_rate: float = 2,
+                 shed_depth: int = 200, max_depth: int = 2000):
+        self.batch_seconds = batch_seconds
+        self.batch_size = batch_size
+        self.role_rate = role_rate
+        self.shed_depth = shed_depth
+        self.max_depth = max_depth
+        self._welcomes = {}      # guild_id -> list of member ids waiting for a post
+        self._welcome_tasks = {}
+        self._roles = deque()    # (enqueued monotonic, guild_id, member_id)
+        self._role_event = asyncio.Event()
+        self._worker = None
+        self.metrics = {
+            "enqueued": 0, "welcomed": 0, "welcome_posts": 0, "roles_granted": 0,
+            "welcomes_shed": 0, "roles_dropped": 0, "errors": 0, "lag_total": 0.0, "lag_max": 0.0,
+        }
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._role_worker())
+
+    def enqueue(self, member: discord.Member, under_raid: bool = False):
+        self.metrics["enqueued"] += 1
+        now = time.monotonic()
+        if getattr(config, 'AUTO_ROLE_IDS', []):
+            self._roles.append((now, member.guild.id, member.id))
+            while len(self._roles) > self.max_depth:
+                self._roles.popleft()
+                self.metrics["roles_dropped"] += 1
+            self._role_event.set()
+        if not getattr(config, 'WELCOME_CHANNEL_ID', 0):
+            return
+        if under_raid or len(self._roles) > self.shed_depth:
+            self.metrics["welcomes_shed"] += 1
+            return
+        pending = self._welcomes.setdefault(member.guild.id, [])
+        pending.append(member.id)
+        if len(pending) >= self.batch_size:
+            spawn_task(self._post_welcome(member.guild.id, self._welcomes.pop(member.guild.id)))
+        elif member.guild.id not in self._welcome_tasks:
+            self._welcome_tasks[member.guild.id] = asyncio.create_task(self._flush_welcomes_later(member.guild.id))
+
+    async def _flush_welcomes_later(self, guild_id: int):
+        await asyncio.sleep(self.batch_seconds)
+        self._welcome_tasks.pop(guild_id, None)
+        await self._post_welcome(guild_id, self._welcomes.pop(guild_id, []))
+
+    async def _post_welcome(self, guild_id: int, member_ids: list):
+        guild = bot.get_guild(guild_id)
+        channel = guild.get_channel(getattr(config, 'WELCOME_CHANNEL_ID', 0)) if guild else None
+        members = [m for m in (guild.get_member(mid) for mid in member_ids) if m] if guild else []
+        if not channel or not members:
+            return
+        template = getattr(config, 'WELCOME_MESSAGE', "Welcome to **{guild}**, {mentions}!")
+        try:
+            await channel.send(
+                template.format(guild=guild.name, mentions=", ".join(m.mention for m in members), count=len(members)),
+                allowed_mentions=discord.AllowedMentions(users=True, roles=False, everyone=False)
+            )
+            self.metrics["welcomed"] += len(members)
+            self.metrics["welcome_posts"] += 1
+        except discord.HTTPException as e:
+            self.metrics["errors"] += 1
+            print(f"Warning: Could not post welcome message: {e}")
+
+    async def _role_worker(self):
+        while True:
+            if not self._roles:
+                self._role_event.clear()
+                await self._role_event.wait()
+                continue
+            enqueued, guild_id, member_id = self._roles.popleft()
+            guild = bot.get_guild(guild_id)
+            member = guild.get_member(member_id) if guild else None
+            if member is None:
+                continue  # left (or was removed) before we got to them
+            roles = [r for r in (guild.get_role(rid) for rid in getattr(config, 'AUTO_ROLE_IDS', [])) if r and r not in member.roles]
+            if roles:
+                try:
+                    await member.add_roles(*roles, reason="Auto-role on join")
+                    self.metrics["roles_granted"] += 1
+                except discord.HTTPException as e:
+                    self.metrics["errors"] += 1
+                    print(f"Warning: Could not grant join roles to {member}: {e}")
+                lag = time.monotonic() - enqueued
+                self.metrics["lag_total"] += lag
+                self.metrics["lag_max"] = max(self.metrics["lag_max"], lag)
+                await asyncio.sleep(1 / self.role_rate)
+
+    def depth(self) -> int:
+        return len(self._roles) + sum(len(ids) for ids in self._welcomes.values())
+
+    def current_lag(self) -> float:
+        return time.monotonic() - self._roles[0][0] if self._roles else 0.0
+
+JOIN_QUEUE = JoinQueue(
+    batch_seconds=getattr(config, 'WELCOME_BATCH_SECONDS', 5),
+    batch_size=getattr(config, 'WELCOME_BATCH_SIZE', 20),
+    role_rate=getattr(config, 'JOIN_ROLE_GRANTS_PER_SECOND', 2),
+    shed_depth=getattr(config, 'JOIN_QUEUE_SHED_DEPTH', 200),
+    max_depth=getattr(config, 'JOIN_QUEUE_MAX_DEPTH', 2000),
+)
+
+# --- Timed Punishments ---
+PUNISHMENTS_FILE = data_path("punishments.jsonl")
+MAX_TIMEOUT_SECONDS = 28 * 86400 - 60  # Discord caps a single timeout at 28 days
+
+class PunishmentScheduler:
+    """Expiring punishments (tempbans, long mutes) behind one wake-up task.
+
+    Entries sit in a min-heap keyed by their next wake time; cancelled or replaced
+    entries are skipped lazily via a sequence number. Changes are appended to a JSONL
+    journal that is replayed on start and compacted once it holds mostly dead lines.
+    Whatever expired during downtime is handled on start in batches.
+    """
+
+    def __init__(self, path: str, batch_size: int = 50):
+        self.path = path
+        self.batch_size = batch_size
+        self.active = {}    # (kind, guild_id, user_id) -> entry dict
+        self._heap = []     # (wake_at, seq, key)
+        self._seq = 0
+        self._journal_lines = 0
+        self._wakeup = asyncio.Event()
+        self._io_lock = asyncio.Lock()
+        self._task = None
+
+    # Journal
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    self._journal_lines += 1
+                    key = (record["kind"], record["guild_id"], record["user_id"])
+                    if record["op"] == "add":
+                        self._seq = max(self._seq, record["seq"])
+                        self.active[key] = record
+                    elif self.active.get(key, {}).get("seq") == record["seq"]:
+                        del self.active[key]
+        except FileNotFoundError:
+            pass
+        for key, entry in self.active.items():
+            heapq.heappush(self._heap, (entry["wake_at"], entry["seq"], key))
+
+    async def _journal(self, records: list):
+        lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        async with self._io_lock:
+            await asyncio.to_thread(self._append, lines)
+            self._journal_lines += len(records)
+            if self._journal_lines > 2 * len(self.active) + 1000:
+                snapshot = [dict(entry, op="add") for entry in self.active.values()]
+                await asyncio.to_thread(self._rewrite, snapshot)
+                self._journal_lines = len(snapshot)
+
+    def _append(self, lines: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def _rewrite(self, records: list):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+
+    # Scheduling
+    async def schedule(self, kind: str, guild_id: int, user_id: int, expires_at: float,
+                       wake_at: Optional[float] = None, reason: str = "", moderator_id: int = 0):
+        self._seq += 1
+        key = (kind, guild_id, user_id)
+        entry = {
+            "op": "add", "seq": self._seq, "kind": kind, "guild_id": guild_id, "user_id": user_id,
+            "expires_at": expires_at, "wake_at": wake_at or expires_at, "reason": reason, "moderator_id": moderator_id,
+        }
+        self.active[key] = entry
+        heapq.heappush(self._heap, (entry["wake_at"], entry["seq"], key))
+        if self._heap[0][1] == entry["seq"]:
+            self._wakeup.set()  # new earliest deadline
+        await self._journal([entry])
+
+    async def cancel(self, kind: str, guild_id: int, user_id: int) -> bool:
+        entry = self.active.pop((kind, guild_id, user_id), None)
+        if entry is None:
+            return False
+        await self._journal([{"op": "done", "seq": entry["seq"], "kind": kind, "guild_id": guild_id, "user_id": user_id}])
+        return True
+
+    def get(self, kind: str, guild_id: int, user_id: int) -> Optional[dict]:
+        return self.active.get((kind, guild_id, user_id))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        await bot.wait_until_ready()
+        while True:
+            try:
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    _, seq, key = heapq.heappop(self._heap)
+                    entry = self.active.get(key)
+                    if entry and entry["seq"] == seq:
+                        due.append(entry)
+                if due:
+                    await self._process(due)
+                    continue
+                self._wakeup.clear()
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+            except Exception as e:
+                # This is the only wake-up task; never let one bad batch or journal write stop it
+                print(f"Error in punishment scheduler: {e!r}")
+                await asyncio.sleep(5)
+
+    def _is_current(self, entry: dict) -> bool:
+        """False once the entry was cancelled or replaced while we were awaiting."""
+        return self.active.get((entry["kind"], entry["guild_id"], entry["user_id"])) is entry
+
+    async def _process(self, due: list):
+        done, rescheduled = [], []
+        for entry in due:
+            if not self._is_current(entry):
+                continue
+            try:
+                if await self._expire(entry):
+                    done.append(entry)
+                else:
+                    rescheduled.append(entry)
+            except discord.HTTPException as e:
+                print(f"Warning: {entry['kind']} expiry for {entry['user_id']} failed, retrying in 5 minutes: {e}")
+                entry["wake_at"] = time.time() + 300
+                rescheduled.append(entry)
+            except Exception as e:
+                # Dropping the entry would turn a tempban permanent or end a long mute early
+                print(f"Warning: Could not process {entry['kind']} expiry for {entry['user_id']}, retrying in 5 minutes: {e!r}")
+                await log_system_event(
+                    bot.get_guild(entry["guild_id"]),
+                    f"⚠️ Could not process the {entry['kind']} expiry for <@{entry['user_id']}> (`{e!r}`). Retrying in 5 minutes.",
+                    ProfessionalColors.ERROR,
+                )
+                entry["wake_at"] = time.time() + 300
+                rescheduled.append(entry)
+        # :unmute, :mute or :tempban may have cancelled or replaced entries during the awaits above
+        done = [entry for entry in done if self._is_current(entry)]
+        for entry in done:
+            del self.active[(entry["kind"], entry["guild_id"], entry["user_id"])]
+        if done:
+            await self._journal([
+                {"op": "done", "seq": e["seq"], "kind": e["kind"], "guild_id": e["guild_id"], "user_id": e["user_id"]}
+                for e in done
+            ])
+        for entry in rescheduled:
+            if not self._is_current(entry):
+                continue
+            await self.schedule(entry["kind"], entry["guild_id"], entry["user_id"], entry["expires_at"],
+                                entry["wake_at"], entry["reason"], entry["moderator_id"])
+
+    async def _expire(self, entry: dict) -> bool:
+        """Handle a due entry. Returns False if it was re-armed (long mute), True when finished."""
+        guild = bot.get_guild(entry["guild_id"])
+        if guild is None:
+            return True
+        if entry["kind"] == "tempban":
+            try:
+                await guild.unban(discord.Object(id=entry["user_id"]), reason="Temporary ban expired")
+            except discord.NotFound:
+                return True  # already unbanned by hand
+            await log_system_event(guild, f"⏰ Temporary ban of <@{entry['user_id']}> ({entry['user_id']}) expired; user unbanned.", ProfessionalColors.SUCCESS)
+            return True
+        # Mute longer than Discord's 28-day cap: apply the next slice of the timeout
+        remaining = entry["expires_at"] - time.time()
+        member = guild.get_member(entry["user_id"])
+        if remaining <= 60 or member is None:
+            return True
+        until = discord.utils.utcnow() + timedelta(seconds=min(remaining, MAX_TIMEOUT_SECONDS))
+        await member.timeout(until, reason=f"Mute continues: {entry['reason']}"[:512])
+        entry["wake_at"] = until.timestamp()
+        return False
+
+PUNISHMENTS = PunishmentScheduler(PUNISHMENTS_FILE, batch_size=getattr(config, 'PUNISHMENT_BATCH_SIZE', 50))
+
+# --- Warning Ledger ---
+WARNINGS_FILE = data_path("warnings.jsonl")
+
+class WarningLedger:
+    """Append-only JSONL ledger of warnings with per-user rolling-window counts.
+
+    Each user has their warnings plus one timestamp deque per configured window; a deque
+    only loses entries from the left as they age out, so counts are O(1) amortized.
+    """
+
+    def __init__(self, path: str, windows: dict):
+        self.path = path
+        self.windows = windows          # label -> seconds
+        self._users = {}                # (guild_id, user_id) -> {"warnings": [...], "windows": {label: deque}}
+        self._seen_ids = set()          # every warning id applied, including cleared ones
+        self._next_id = 1
+        self._lines = 0
+        self._live = 0
+        self._lock = asyncio.Lock()
+
+    def _user(self, guild_id: int, user_id: int) -> dict:
+        key = (guild_id, user_id)
+        state = self._users.get(key)
+        if state is None:
+            state = self._users[key] = {"warnings": [], "windows": {label: deque() for label in self.windows}}
+        return state
+
+    def _apply(self, record: dict):
+        if record["op"] == "warn":
+            # A compaction can snapshot a warning before its own line is appended; replay it once
+            if record["id"] in self._seen_ids:
+                return
+            self._seen_ids.add(record["id"])
+            state = self._user(record["guild_id"], record["user_id"])
+            state["warnings"].append(record)
+            for label, window in state["windows"].items():
+                window.append(record["ts"])
+            self._next_id = max(self._next_id, record["id"] + 1)
+            self._live += 1
+        elif record["op"] == "clear":
+            state = self._users.get((record["guild_id"], record["user_id"]))
+            if not state:
+                return
+            warning_id = record.get("warning_id")
+            kept = [w for w in state["warnings"] if warning_id is not None and w["id"] != warning_id]
+            self._live -= len(state["warnings"]) - len(kept)
+            state["warnings"] = kept
+            for label in state["windows"]:
+                state["windows"][label] = deque(sorted(w["ts"] for w in kept))
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                        self._lines += 1
+                    except (ValueError, KeyError):
+                        continue
+        except FileNotFoundError:
+            pass
+
+    async def _write(self, record: dict):
+        async with self._lock:
+            line = json.dumps(record, separators=(",", ":")) + "\n"
+            await asyncio.to_thread(self._append, line)
+            self._lines += 1
+            if self._lines > 2 * self._live + 500:
+                records = [w for state in self._users.values() for w in state["warnings"]]
+                records.sort(key=lambda w: w["id"])
+                await asyncio.to_thread(self._rewrite, records)
+                self._lines = len(records)
+
+    def _append(self, line: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _rewrite(self, records: list):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+
+    async def add(self, guild_id: int, user_id: int, moderator_id: int, reason: str) -> dict:
+        record = {
+            "op": "warn", "id": self._next_id, "guild_id": guild_id, "user_id": user_id,
+            "moderator_id": moderator_id, "reason": reason, "ts": int(time.time()),
+        }
+        self._apply(record)
+        await self._write(record)
+        return record
+
+    async def clear(self, guild_id: int, user_id: int, warning_id: Optional[int] = None) -> int:
+        """Remove one warning (by ID) or all of a user's warnings. Returns how many were removed."""
+        state = self._users.get((guild_id, user_id))
+        before = len(state["warnings"]) if state else 0
+        record = {"op": "clear", "guild_id": guild_id, "user_id": user_id, "warning_id": warning_id, "ts": int(time.time())}
+        self._apply(record)
+        removed = before - len(state["warnings"]) if state else 0
+        if removed:
+            await self._write(record)
+        return removed
+
+    def count(self, guild_id: int, user_id: int, label: str, now: Optional[float] = None) -> int:
+        state = self._users.get((guild_id, user_id))
+        if not state:
+            return 0
+        window = state["windows"][label]
+        cutoff = (now if now is not None else time.time()) - self.windows[label]
+        while window and window[0] < cutoff:
+            window.popleft()
+        return len(window)
+
+    def warnings(self, guild_id: int, user_id: int) -> list:
+        state = self._users.get((guild_id, user_id))
+        return list(state["warnings"]) if state else []
+
+def _warning_windows() -> dict:
+    windows = {}
+    for label in getattr(config, 'WARN_WINDOWS', ["24h", "7d", "30d"]):
+        seconds = parse_duration(label)
+        if seconds:
+            windows[label] = seconds
+    escalation_window = getattr(config, 'WARN_ESCALATION_WINDOW', "30d")
+    windows.setdefault(escalation_window, parse_duration(escalation_window) or 30 * 86400)
+    return windows
+
+WARNINGS = WarningLedger(WARNINGS_FILE, _warning_windows())
+
+async def issue_warning(guild: discord.Guild, member: discord.abc.User, moderator: discord.abc.User, reason: str):
+    """Record a warning and apply the configured escalation.
+
+    Returns (warning record, count in the escalation window, escalation description or None).
+    Escalation fires when the count lands exactly on a threshold, so it runs once per step.
+    """
+    record = await WARNINGS.add(guild.id, member.id, moderator.id, reason)
+    window = getattr(config, 'WARN_ESCALATION_WINDOW', "30d")
+    count = WARNINGS.count(guild.id, member.id, window)
+    step = getattr(config, 'WARN_ESCALATION', {3: ("timeout", "1h"), 5: ("kick", None)}).get(count)
+    if not step or not isinstance(member, discord.Member):
+        return record, count, None
+    action, duration = step
+    escalation_reason = f"{count} warnings within {window} (latest: {reason})"[:512]
+    try:
+        if action == "timeout":
+            seconds = min(parse_duration(duration or "1h") or 3600, MAX_TIMEOUT_SECONDS)
+            ends_at = time.time() + seconds
+            # Never shorten a longer :mute (including a >28-day one whose current slice may end sooner)
+            current_until = member.timed_out_until.timestamp() if member.timed_out_until else 0
+            scheduled = PUNISHMENTS.get("mute", guild.id, member.id)
+            longest = max(current_until, scheduled["expires_at"] if scheduled else 0)
+            if longest >= ends_at:
+                await log_system_event(
+                    guild,
+                    f"📈 {member.mention} ({member.id}) reached **{count}** warnings within {window}; "
+                    f"already muted until <t:{int(longest)}:f>, so the escalation timeout was skipped.",
+                    ProfessionalColors.WARNING
+                )
+                return record, count, None
+            await member.timeout(timedelta(seconds=seconds), reason=escalation_reason)
+            description = f"timed out for {format_duration(seconds)}"
+        elif action == "kick":
+            try:
+                await member.send(embed=build_kick_dm_embed(guild, escalation_reason, "Automatic escalation"))
+            except discord.HTTPException:
+                pass
+            await member.kick(reason=escalation_reason)
+            record_moderation_action("kick")
+            description = "kicked"
+        elif action == "ban":
+            try:
+                await member.send(embed=build_ban_dm_embed(escalation_reason, "Automatic escalation"))
+            except discord.HTTPException:
+                pass
+            await member.ban(reason=escalation_reason)
+            record_moderation_action("ban")
+            description = "banned"
+        else:
+            return record, count, None
+    except discord.HTTPException as e:
+        description = f"escalation to {action} failed ({e.status})"
+        await log_system_event(
+            guild,
+            f"📈 {member.mention} ({member.id}) reached **{count}** warnings within {window} but {description}.",
+            ProfessionalColors.ERROR
+        )
+        return record, count, description
+    case = await CASES.open(guild.id, action, member.id, bot.user.id, escalation_reason)
+    log_message = await log_system_event(
+        guild,
+        f"**Case #{case.id}** — 📈 {member.mention} ({member.id}) reached **{count}** warnings within {window} and was **{description}**.",
+        ProfessionalColors.ERROR
+    )
+    await CASES.commit(case, log_message)
+    return record, count, description
+
+# --- Moderation Cases ---
+CASES_FILE = data_path("cases.jsonl")
+
+class Case:
+    __slots__ = (
+        "id", "guild_id", "action", "target_id", "moderator_id", "reason", "created_at",
+        "log_channel_id", "log_message_id", "edited_by", "edited_at",
+    )
+
+    def __init__(self, id: int, guild_id: int, action: str, target_id: int, moderator_id: int, reason: str,
+                 created_at: int, log_channel_id: Optional[int] = None, log_message_id: Optional[int] = None,
+                 edited_by: Optional[int] = None, edited_at: Optional[int] = None):
+        self.id = id
+        self.guild_id = guild_id
+        self.action = action
+        self.target_id = target_id
+        self.moderator_id = moderator_id
+        self.reason = reason
+        self.created_at = created_at
+        self.log_channel_id = log_channel_id
+        self.log_message_id = log_message_id
+        self.edited_by = edited_by
+        self.edited_at = edited_at
+
+    def to_record(self) -> dict:
+        record = {"op": "case"}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is not None:
+                record[name] = value
+        return record
+
+    @property
+    def log_url(self) -> Optional[str]:
+        if not self.log_message_id:
+            return None
+        return f"https://discord.com/channels/{self.guild_id}/{self.log_channel_id}/{self.log_message_id}"
+
+class CaseStore:
+    """Numbered moderation cases in an append-only JSONL file.
+
+    Cases live in a dict keyed by ID; per-guild target and moderator indexes hold case IDs in
+    creation order. open() writes the case before the log embed is sent so the embed can carry
+    the number, and commit() appends the log message link once it exists. When a case ID
+    appears more than once, the later record wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cases = {}
+        self._by_target = {}            # (guild_id, target_id) -> [case ids]
+        self._by_moderator = {}         # (guild_id, moderator_id) -> [case ids]
+        self._next_id = 1
+        self._lines = 0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cases)
+
+    def _index(self, case: Case):
+        self._cases[case.id] = case
+        self._by_target.setdefault((case.guild_id, case.target_id), []).append(case.id)
+        self._by_moderator.setdefault((case.guild_id, case.moderator_id), []).append(case.id)
+        self._next_id = max(self._next_id, case.id + 1)
+
+    def _apply(self, record: dict):
+        op = record.pop("op")
+        if op == "case":
+            case = self._cases.get(record["id"])
+            if case is None:
+                self._index(Case(**record))
+            else:
+                for name, value in record.items():
+                    if name not in ("guild_id", "target_id", "moderator_id"):
+                        setattr(case, name, value)
+        elif op == "log":
+            case = self._cases.get(record["id"])
+            if case:
+                case.log_channel_id = record["log_channel_id"]
+                case.log_message_id = record["log_message_id"]
+        elif op == "reason":
+            case = self._cases.get(record["id"])
+            if case:
+                case.reason = record["reason"]
+                case.edited_by = record.get("edited_by")
+                case.edited_at = record.get("edited_at")
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                        self._lines += 1
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            pass
+        for ids in (*self._by_target.values(), *self._by_moderator.values()):
+            ids.sort()
+
+    async def _write(self, *records: dict):
+        async with self._lock:
+            lines = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records)
+            await asyncio.to_thread(self._append, lines)
+            self._lines += len(records)
+            # Reason edits add lines; fold them back in once they make up a third of the file.
+            if self._lines > len(self._cases) * 3 // 2 + 500:
+                records = [self._cases[case_id].to_record() for case_id in sorted(self._cases)]
+                await asyncio.to_thread(self._rewrite, records)
+                self._lines = len(records)
+
+    def _append(self, line: str):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    def _rewrite(self, records: list):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+
+    async def open(self, guild_id: int, action: str, target_id: int, moderator_id: int, reason: str) -> Case:
+        case = Case(self._next_id, guild_id, action, target_id, moderator_id, reason, int(time.time()))
+        self._index(case)
+        await self._write(case.to_record())
+        return case
+
+    async def open_many(self, guild_id: int, action: str, target_ids: list, moderator_id: int, reason: str) -> list:
+        """Open one case per target with consecutive IDs, written in a single append."""
+        now = int(time.time())
+        cases = []
+        for target_id in target_ids:
+            case = Case(self._next_id, guild_id, action, target_id, moderator_id, reason, now)
+            self._index(case)
+            cases.append(case)
+        if cases:
+            await self._write(*(case.to_record() for case in cases))
+        return cases
+
+    async def commit(self, case: Case, log_message: Optional[discord.Message] = None):
+        """Link the case to its log message (nothing to write if logging failed)."""
+        await self.commit_many([case], log_message)
+
+    async def commit_many(self, cases: list, log_message: Optional[discord.Message] = None):
+        if log_message is None or not cases:
+            return
+        for case in cases:
+            case.log_channel_id = log_message.channel.id
+            case.log_message_id = log_message.id
+        await self._write(*(
+            {"op": "log", "id": case.id, "log_channel_id": case.log_channel_id, "log_message_id": case.log_message_id}
+            for case in cases
+        ))
+
+    async def set_reason(self, case: Case, reason: str, editor_id: int):
+        case.reason = reason
+        case.edited_by = editor_id
+        case.edited_at = int(time.time())
+        await self._write({"op": "reason", "id": case.id, "reason": reason, "edited_by": editor_id, "edited_at": case.edited_at})
+
+    def get(self, case_id: int) -> Optional[Case]:
+        return self._cases.get(case_id)
+
+    def shares_log(self, case: Case) -> bool:
+        """True if the case's log message also covers other cases (a mass action's summary)."""
+        if case.log_message_id is None:
+            return False
+        # open_many() hands out consecutive IDs, so a shared log always has a neighbour on it
+        for neighbour_id in (case.id - 1, case.id + 1):
+            other = self._cases.get(neighbour_id)
+            if other is not None and other.log_message_id == case.log_message_id:
+                return True
+        return False
+
+    def for_target(self, guild_id: int, target_id: int) -> list:
+        return [self._cases[case_id] for case_id in self._by_target.get((guild_id, target_id), ())]
+
+    def for_moderator(self, guild_id: int, moderator_id: int) -> list:
+        return [self._cases[case_id] for case_id in self._by_moderator.get((guild_id, moderator_id), ())]
+
+CASES = CaseStore(CASES_FILE)
+
+CASE_ACTION_ICONS = {
+    "ban": "🔨", "tempban": "⏳", "kick": "👢", "warn": "⚠️", "mute": "🔇", "timeout": "🔇",
+    "appeal-approve": "✅", "appeal-decline": "❌",
+}
+
+def case_label(case: Case) -> str:
+    return f"{CASE_ACTION_ICONS.get(case.action, '📁')} Case #{case.id} • {case.action}"
+
+# --- Activity Stats Persistence ---
+# Each tracker registers a (dump, load) pair; all sections share one JSON file.
+ACTIVITY_STATS_FILE = data_path("activity_stats.json")
+ACTIVITY_SECTIONS = {}
+
+def register_activity_section(name: str, dump, load):
+    ACTIVITY_SECTIONS[name] = (dump, load)
+
+def load_activity_stats():
+    data = load_json_file(ACTIVITY_STATS_FILE, {})
+    for name, (_, load) in ACTIVITY_SECTIONS.items():
+        if name in data:
+            try:
+                load(data[name])
+            except Exception as e:
+                print(f"Warning: Could not restore activity section '{name}': {e}")
+
+async def save_activity_stats():
+    # Append finished days first so a crash can't leave them both saved and pending
+    await flush_activity_history()
+    # Snapshot on the loop (cheap), serialize and write in a worker thread
+    snapshot = {name: dump() for name, (dump, _) in ACTIVITY_SECTIONS.items()}
+    try:
+        await asyncio.to_thread(save_json_file, ACTIVITY_STATS_FILE, snapshot)
+    except OSError as e:
+        print(f"Error: Could not save activity stats: {e}")
+
+@tasks.loop(minutes=getattr(config, 'ACTIVITY_PERSIST_MINUTES', 5))
+async def persist_activity_stats():
+    await save_activity_stats()
+
+def _dump_event_store(store: deque):
+    return [int(ts.timestamp()) for ts in store]
+
+def _load_event_store(store: deque, data):
+    store.extend(datetime.fromtimestamp(ts, timezone.utc) for ts in sorted(data))
+
+register_activity_section("join_events", lambda: _dump_event_store(JOIN_EVENTS), lambda data: _load_event_store(JOIN_EVENTS, data))
+register_activity_section("message_events", lambda: _dump_event_store(MESSAGE_EVENTS), lambda data: _load_event_store(MESSAGE_EVENTS, data))
+register_activity_section("top_chatters", TOP_CHATTERS.dump, TOP_CHATTERS.load)
+register_activity_section("top_channels", TOP_CHANNELS.dump, TOP_CHANNELS.load)
+register_activity_section("active_users", ACTIVE_USERS.dump, ACTIVE_USERS.load)
+register_activity_section("member_flow", MEMBER_FLOW.dump, MEMBER_FLOW.load)
+register_activity_section("daily_activity", DAILY_ACTIVITY.dump, DAILY_ACTIVITY.load)
+
+@bot.event
+async def setup_hook():
+    load_activity_stats()
+    load_channel_locks()
+    load_lockdown_state()
+    load_raid_cohorts()
+    load_ban_indexes()
+    PUNISHMENTS.load()
+    WARNINGS.load()
+    CASES.load()
+    PUNISHMENTS.start()
+    if not persist_activity_stats.is_running():
+        persist_activity_stats.start()
+    if not refresh_member_snapshots.is_running():
+        refresh_member_snapshots.start()
+    if not refresh_live_panels.is_running():
+        refresh_live_panels.start()
+    JOIN_QUEUE.start()
+    if not close_finished_raids.is_running():
+        close_finished_raids.start()
+    if SLOWMODE_ENABLED and not sweep_adaptive_slowmode.is_running():
+        sweep_adaptive_slowmode.start()
+
+@bot.event
+async def on_guild_channel_create(channel: discord.abc.GuildChannel):
+    index = CHANNEL_INDEX.get(channel.guild.id)
+    if index:
+        index.upsert(channel)
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    index = CHANNEL_INDEX.get(channel.guild.id)
+    if index:
+        index.remove(channel)
+
+@bot.event
+async def on_guild_channel_update(before: discord.abc.GuildChannel, after: discord.abc.GuildChannel):
+    index = CHANNEL_INDEX.get(after.guild.id)
+    if index:
+        index.upsert(after)
+
+@bot.event
+async def on_guild_remove(guild: discord.Guild):
+    CHANNEL_INDEX.pop(guild.id, None)
+
+@bot.event
+async def on_member_join(member: discord.Member):
+    JOIN_EVENTS.append(datetime.now(timezone.utc))
+    MEMBER_FLOW.record_join(member.id)
+    # Record and queue the join before anything awaits, so detector timestamps stay true to
+    # arrival order and welcome shedding sees a raid as soon as it starts.
+    detector, transition = None, None
+    if getattr(config, 'RAID_DETECTION_ENABLED', True):
+        detector = get_raid_detector(member.guild.id)
+        transition = detector.record(member)
+    raid_active = bool(detector and detector.active) and transition != "end"
+    JOIN_QUEUE.enqueue(member, under_raid=raid_active)
+    if getattr(config, 'ALT_DETECTION_ENABLED', True):
+        spawn_task(check_alt_account(member))
+    if transition == "start":
+        await on_raid_started(member.guild, detector)
+    elif transition == "end":
+        await on_raid_ended(member.guild, detector)
+    elif detector and detector.active and len(detector.active["member_ids"]) % 25 == 0:
+        await save_raid_cohorts()
+
+@bot.event
+async def on_member_ban(guild: discord.Guild, user: discord.abc.User):
+    record_ban(guild, user, source="banlist")
+
+@bot.event
+async def on_member_unban(guild: discord.Guild, user: discord.abc.User):
+    index = BAN_INDEXES.get(guild.id)
+    if index:
+        index.remove(user.id)
+        schedule_ban_index_save()
+    # An early manual unban ends the temporary ban
+    await PUNISHMENTS.cancel("tempban", guild.id, user.id)
+
+@bot.event
+async def on_member_remove(member: discord.Member):
+    MEMBER_FLOW.record_leave(member.id, member.joined_at)
+
+# Gateway dispatch counters (only populated when GATEWAY_EVENT_STATS enables debug events)
+GATEWAY_EVENT_COUNTS = {}
+GATEWAY_STATS_STARTED = time.monotonic()
+
+@bot.event
+async def on_socket_event_type(event_type: str):
+    GATEWAY_EVENT_COUNTS[event_type] = GATEWAY_EVENT_COUNTS.get(event_type, 0) + 1
+
+def process_memory_mb() -> Optional[float]:
+    """Current resident set size in MB (Linux), falling back to peak RSS where available."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+# Core message stages; feature sections register their own with MESSAGE_PIPELINE.stage
+@MESSAGE_PIPELINE.stage("activity", order=10)
+def record_message_activity(message: discord.Message):
+    MESSAGE_EVENTS.append(datetime.now(timezone.utc))
+    TOP_CHATTERS.offer(message.author.id)
+    TOP_CHANNELS.offer(message.channel.id)
+    ACTIVE_USERS.add(message.author.id)
+    DAILY_ACTIVITY.record_message(message.channel.id)
+
+@MESSAGE_PIPELINE.stage("slowmode", order=20)
+def record_slowmode_rate(message: discord.Message):
+    if SLOWMODE_ENABLED and message.channel.id not in SLOWMODE_EXCLUDED:
+        SLOWMODE.record(message.channel)
+
+@MESSAGE_PIPELINE.stage("staff_activity", order=30)
+def record_staff_activity(message: discord.Message):
+    if is_staff_member(message.author):
+        STAFF_LAST_SEEN[message.author.id] = datetime.now(timezone.utc).timestamp()
+
+COMMAND_PRECHECK_SKIPPED = 0
+
+@MESSAGE_PIPELINE.stage("commands", order=1000, guild_only=False)
+async def dispatch_commands(message: discord.Message):
+    global COMMAND_PRECHECK_SKIPPED
+    # Cheap prefix check first: most messages aren't commands and never need a Context
+    if message.content.startswith(config.BOT_PREFIX):
+        await bot.process_commands(message)
+    else:
+        COMMAND_PRECHECK_SKIPPED += 1
+
+@bot.event
+async def on_message(message: discord.Message):
+    await MESSAGE_PIPELINE.dispatch(message)
+
+@bot.command()
+@access_level_required(1)
+async def ping(ctx):
+    """Check the bot's latency and response time."""
+    embed = EmbedTemplates.success(
+        "🏓 Pong!",
+        f"**Latency:** `{round(bot.latency * 1000)}ms`\n"
+        f"**Status:** Online and Ready"
+    )
+    embed.set_footer(text=f"Requested by {ctx.author.display_name}")
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} used the `ping` command.", ProfessionalColors.SUCCESS)
+
+@bot.command()
+@access_level_required(2)
+async def test_access(ctx):
+    """Test your current access level."""
+    embed = EmbedTemplates.success(
+        f"Hello {ctx.author.display_name}!",
+        "You have at least **Access Level 2** permissions.\n\n"
+        "✅ **Access Level 2:** Admin Team\n"
+        "🔧 You can use admin commands and announcements."
+    )
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} used the `test_access` command.", ProfessionalColors.SUCCESS)
+
+@bot.command(name='commands')
+@access_level_required(1)
+async def commands_list(ctx, *, command_name: str = None):
+    """Display available commands with interactive help system."""
+    
+    if command_name:
+        # Show help for specific command
+        command = bot.get_command(command_name)
+        if not command:
+            embed = EmbedTemplates.error("Command Not Found", f"No command named `{command_name}` was found.")
+            await ctx.send(embed=embed)
+            return
+        
+        embed = EmbedTemplates.info(
+            f"📖 {command.name}",
+            command.help or "No description available."
+        )
+        
+        # Add usage information
+        usage = f"`{ctx.prefix}{command.name}"
+        if command.signature:
+            usage += f" {command.signature}"
+        usage += "`"
+        
+        embed.add_field(name="Usage", value=usage, inline=False)
+        
+        # Add simple examples for key commands
+        examples = {
+            'promote': f"`{ctx.prefix}promote @user Moderator`",
+            'demote': f"`{ctx.prefix}demote @user Moderator`",
+            'ban': f"`{ctx.prefix}ban @user Breaking rules`",
+            'kick': f"`{ctx.prefix}kick @user Spamming`",
+            'warn': f"`{ctx.prefix}warn @user Bad language`",
+            'announcement': f"`{ctx.prefix}announcement ann-main Message`",
+            'appeal': f"`{ctx.prefix}appeal 123456789`",
+            'panel': f"`{ctx.prefix}panel`",
+            'top': f"`{ctx.prefix}top 7d`",
+            'growth': f"`{ctx.prefix}growth`",
+            'stats': f"`{ctx.prefix}stats export 90`",
+            'query': f"`{ctx.prefix}query count joined<30d noroles`",
+            'lockdown': f"`{ctx.prefix}lockdown Raid in progress`",
+            'pipeline': f"`{ctx.prefix}pipeline reset`",
+            'filter': f"`{ctx.prefix}filter test some message`",
+            'raid': f"`{ctx.prefix}raid`",
+            'joinqueue': f"`{ctx.prefix}joinqueue`",
+            'massban': f"`{ctx.prefix}massban cohort:last noroles | Raid accounts`",
+            'masskick': f"`{ctx.prefix}masskick joined<10m created<1d | Raid cleanup`",
+            'tempban': f"`{ctx.prefix}tempban @user 7d Repeated spam`",
+            'mute': f"`{ctx.prefix}mute @user 2h Arguing with staff`",
+            'warnings': f"`{ctx.prefix}warnings @user`",
+            'clearwarn': f"`{ctx.prefix}clearwarn @user 12`",
+            'case': f"`{ctx.prefix}case 42`",
+            'reason': f"`{ctx.prefix}reason 42 Posting scam links`",
+            'cases': f"`{ctx.prefix}cases @user moderator`",
+            'purge': f"`{ctx.prefix}purge 200 user:@user links`"
+        }
+        
+        if command.name in examples:
             embed.add_field(name="Example", value=examples[command.name], inline=False)
         
         await ctx.send(embed=embed)
@@ -903,6 +4570,7 @@ async def announcement(ctx, channel_var: str, *, message: str):
 
 @bot.command(name='promote')
 @access_level_required(3)
+@single_flight("promote")
 async def promote(ctx, member: discord.Member, *, rank_name: str):
     """Promote a staff member to a new rank/position.
     
@@ -1141,6 +4809,7 @@ async def promote(ctx, member: discord.Member, *, rank_name: str):
 
 @bot.command(name='demote')
 @access_level_required(3)
+@single_flight("demote")
 async def demote(ctx, member: discord.Member, *, rank_name: str):
     """Demote a staff member by removing all roles for a specified rank/position.
     
@@ -1377,6 +5046,7 @@ async def demote(ctx, member: discord.Member, *, rank_name: str):
 
 @bot.command(name='kick')
 @access_level_required(1)
+@single_flight("kick")
 async def kick(ctx, member: discord.Member, *, reason: str = "No reason provided."):
     """Kick a member from the server.
     
@@ -1413,12 +5083,7 @@ async def kick(ctx, member: discord.Member, *, reason: str = "No reason provided
         return
 
     try:
-        dm_embed = EmbedTemplates.warning(
-            title="⚠️ You have been Kicked!",
-            description=f"You have been kicked from **{ctx.guild.name}**.\n\n**Reason:** {reason}\n\nIf you believe this was a mistake, please contact a staff member."
-        )
-        dm_embed.set_footer(text=f"Kicked by {ctx.author.display_name}")
-        await member.send(embed=dm_embed)
+        await member.send(embed=build_kick_dm_embed(ctx.guild, reason, ctx.author.display_name))
     except discord.Forbidden:
         embed = EmbedTemplates.warning(
             "Could Not Send DM",
@@ -1436,8 +5101,12 @@ async def kick(ctx, member: discord.Member, *, reason: str = "No reason provided
         embed.add_field(name="📋 Reason", value=reason, inline=False)
         embed.add_field(name="👮 Moderator", value=ctx.author.mention, inline=False)
         embed.set_thumbnail(url=member.avatar.url if member.avatar else None)
+        case = await CASES.open(ctx.guild.id, "kick", member.id, ctx.author.id, reason)
+        embed.set_footer(text=f"Case #{case.id}")
         await ctx.send(embed=embed)
-        await log_action(ctx, f"User {ctx.author.display_name} kicked {member.display_name} for: {reason}.", ProfessionalColors.ERROR)
+        record_moderation_action("kick")
+        log_message = await log_action(ctx, f"**Case #{case.id}** — User {ctx.author.display_name} kicked {member.display_name} for: {reason}.", ProfessionalColors.ERROR)
+        await CASES.commit(case, log_message)
     except discord.Forbidden:
         embed = EmbedTemplates.error(
             "Permission Denied",
@@ -1455,6 +5124,7 @@ async def kick(ctx, member: discord.Member, *, reason: str = "No reason provided
 
 @bot.command(name='ban')
 @access_level_required(1)
+@single_flight("ban")
 async def ban(ctx, member: discord.Member, *, reason: str = "No reason provided."):
     """Ban a member from the server and provide an appeal link.
     
@@ -1491,18 +5161,7 @@ async def ban(ctx, member: discord.Member, *, reason: str = "No reason provided.
         return
 
     try:
-        dm_embed = EmbedTemplates.primary(
-            title="Ban Form",
-            description=(
-                "You got banned from Anime Card Realms\n"
-                f"Reason : {reason}\n"
-                f"Author : {ctx.author.display_name}\n\n"
-                "You can appeal your ban here - \n"
-                f"{config.APPEAL_SERVER_INVITE_LINK}\n"
-                "use *:appeal* to start it"
-            )
-        )
-        await member.send(embed=dm_embed)
+        await member.send(embed=build_ban_dm_embed(reason, ctx.author.display_name))
     except discord.Forbidden:
         embed = EmbedTemplates.warning(
             "Could Not Send DM",
@@ -1520,8 +5179,13 @@ async def ban(ctx, member: discord.Member, *, reason: str = "No reason provided.
         embed.add_field(name="📋 Reason", value=reason, inline=False)
         embed.add_field(name="👮 Moderator", value=ctx.author.mention, inline=False)
         embed.set_thumbnail(url=member.avatar.url if member.avatar else None)
+        case = await CASES.open(ctx.guild.id, "ban", member.id, ctx.author.id, reason)
+        embed.set_footer(text=f"Case #{case.id}")
         await ctx.send(embed=embed)
-        await log_action(ctx, f"User {ctx.author.display_name} banned {member.display_name} (ID: {member.id}) for: {reason}. Appeal link sent.", ProfessionalColors.ERROR)
+        record_moderation_action("ban")
+        record_ban(ctx.guild, member, reason, source="command")
+        log_message = await log_action(ctx, f"**Case #{case.id}** — User {ctx.author.display_name} banned {member.display_name} (ID: {member.id}) for: {reason}. Appeal link sent.", ProfessionalColors.ERROR)
+        await CASES.commit(case, log_message)
     except discord.Forbidden:
         embed = EmbedTemplates.error(
             "Permission Denied",
@@ -1539,6 +5203,7 @@ async def ban(ctx, member: discord.Member, *, reason: str = "No reason provided.
 
 @bot.command(name='warn')
 @access_level_required(1)
+@single_flight("warn")
 async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided."):
     """Warn a member about their behavior.
     
@@ -1546,38 +5211,180 @@ async def warn(ctx, member: discord.Member, *, reason: str = "No reason provided
     Example: :warn @John Using inappropriate language
     
     Sends warning DM, logs action, or sends to channel if DM fails.
+    The warning is stored in the ledger and escalates once configured thresholds are reached.
     """
-    embed = EmbedTemplates.warning(
-        title="⚠️ Member Warning",
-        description=f"**{member.display_name}** has been warned."
-    )
-    embed.add_field(name="📋 Reason", value=reason, inline=False)
-    embed.add_field(name="👮 Moderator", value=ctx.author.mention, inline=False)
-    embed.set_thumbnail(url=member.avatar.url if member.avatar else None)
+    embed = build_warning_embed(member, reason, ctx.author.mention)
 
     try:
-        await member.send(embed=embed)
-        success_embed = EmbedTemplates.success(
-            "Warning Sent",
-            f"Successfully warned {member.display_name} via DM."
-        )
-        await ctx.send(embed=success_embed)
-        await log_action(ctx, f"User {ctx.author.display_name} warned {member.display_name} for: {reason}.", ProfessionalColors.WARNING)
-    except discord.Forbidden:
-        embed_warning = EmbedTemplates.warning(
-            "Could Not Send DM",
-            f"Could not DM {member.display_name} about the warning. Sending warning to current channel instead."
-        )
-        await ctx.send(embed=embed_warning)
-        await ctx.send(embed=embed)
-        await log_action(ctx, f"Warning sent to channel for {member.display_name} (DM failed) by {ctx.author.display_name} for: {reason}.", ProfessionalColors.WARNING)
+        try:
+            await member.send(embed=embed)
+            dm_sent = True
+        except discord.Forbidden:
+            dm_sent = False
+            embed_warning = EmbedTemplates.warning(
+                "Could Not Send DM",
+                f"Could not DM {member.display_name} about the warning. Sending warning to current channel instead."
+            )
+            await ctx.send(embed=embed_warning)
+            await ctx.send(embed=embed)
+        record_moderation_action("warn")
+        case = await CASES.open(ctx.guild.id, "warn", member.id, ctx.author.id, reason)
+        record, count, escalation = await issue_warning(ctx.guild, member, ctx.author, reason)
+        window = getattr(config, 'WARN_ESCALATION_WINDOW', "30d")
+        summary = f"Warning **#{record['id']}** recorded as **Case #{case.id}** — {count} warning(s) within {window}."
+        if escalation:
+            summary += f"\nEscalation: {member.display_name} was **{escalation}**."
+        if dm_sent:
+            await ctx.send(embed=EmbedTemplates.success(
+                "Warning Sent",
+                f"Successfully warned {member.display_name} via DM.\n{summary}"
+            ))
+            log_message = await log_action(ctx, f"**Case #{case.id}** — User {ctx.author.display_name} warned {member.display_name} for: {reason}. ({count} within {window})", ProfessionalColors.WARNING)
+        else:
+            await ctx.send(embed=EmbedTemplates.info("Warning Recorded", summary))
+            log_message = await log_action(ctx, f"**Case #{case.id}** — Warning sent to channel for {member.display_name} (DM failed) by {ctx.author.display_name} for: {reason}. ({count} within {window})", ProfessionalColors.WARNING)
+        await CASES.commit(case, log_message)
     except Exception as e:
         embed = EmbedTemplates.error(
             "Unexpected Error",
             f"An unexpected error occurred: {e}"
         )
-        await ctx.send(embed=embed)
-        await log_action(ctx, f"Failed warn due to unexpected error: {e}", ProfessionalColors.ERROR)
+        await ctx.send(embed=embed)
+        await log_action(ctx, f"Failed warn due to unexpected error: {e}", ProfessionalColors.ERROR)
+
+@bot.command(name='warnings')
+@access_level_required(1)
+async def warnings_command(ctx, member: discord.Member):
+    """Show a member's recorded warnings and rolling counts.
+
+    Usage: :warnings <@user>
+    Example: :warnings @John
+    """
+    entries = WARNINGS.warnings(ctx.guild.id, member.id)
+    counts = " • ".join(f"{label}: **{WARNINGS.count(ctx.guild.id, member.id, label)}**" for label in WARNINGS.windows)
+    embed = EmbedTemplates.info(
+        f"Warnings — {member.display_name}",
+        f"Total recorded: **{len(entries)}**\n{counts}"
+    )
+    for entry in reversed(entries[-10:]):
+        embed.add_field(
+            name=f"#{entry['id']} • <t:{entry['ts']}:R>",
+            value=f"{entry['reason'][:200]}\nBy <@{entry['moderator_id']}>",
+            inline=False
+        )
+    if len(entries) > 10:
+        embed.set_footer(text=f"Showing the 10 most recent of {len(entries)} warnings")
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} viewed warnings for {member.display_name}.", ProfessionalColors.INFO)
+
+@bot.command(name='clearwarn')
+@access_level_required(2)
+async def clearwarn(ctx, member: discord.Member, warning_id: Optional[int] = None):
+    """Clear all of a member's warnings, or a single warning by ID.
+
+    Usage: :clearwarn <@user> [warning ID]
+    Example: :clearwarn @John 12
+    """
+    removed = await WARNINGS.clear(ctx.guild.id, member.id, warning_id)
+    if not removed:
+        target = f"warning #{warning_id}" if warning_id is not None else "any warnings"
+        await ctx.send(embed=EmbedTemplates.warning("Nothing Cleared", f"{member.display_name} has no {target} on record."))
+        return
+    await ctx.send(embed=EmbedTemplates.success(
+        "Warnings Cleared",
+        f"Removed {removed} warning(s) from {member.display_name}."
+    ))
+    await log_action(ctx, f"User {ctx.author.display_name} cleared {removed} warning(s) from {member.display_name}"
+                     + (f" (#{warning_id})." if warning_id is not None else "."), ProfessionalColors.WARNING)
+
+@bot.command(name='case')
+@access_level_required(1)
+async def case_command(ctx, case_id: int):
+    """Show a moderation case.
+
+    Usage: :case <case ID>
+    Example: :case 42
+    """
+    case = CASES.get(case_id)
+    if case is None or case.guild_id != ctx.guild.id:
+        await ctx.send(embed=EmbedTemplates.error("Case Not Found", f"There is no case #{case_id} in this server."))
+        return
+    embed = EmbedTemplates.info(case_label(case), case.reason[:1024])
+    embed.add_field(name="🎯 Target", value=f"<@{case.target_id}> ({case.target_id})", inline=True)
+    embed.add_field(name="👮 Moderator", value=f"<@{case.moderator_id}>", inline=True)
+    embed.add_field(name="🕒 Created", value=f"<t:{case.created_at}:f>", inline=True)
+    if case.edited_by:
+        embed.add_field(name="📝 Reason Edited", value=f"By <@{case.edited_by}> <t:{case.edited_at}:R>", inline=True)
+    if case.log_url:
+        embed.add_field(name="📋 Log", value=f"[Jump to log entry]({case.log_url})", inline=True)
+    await ctx.send(embed=embed)
+
+@bot.command(name='reason')
+@access_level_required(1)
+async def reason_command(ctx, case_id: int, *, reason: str):
+    """Change the reason of a case and its log entry. Only the case's moderator or Level 3+ may edit.
+
+    Usage: :reason <case ID> <new reason>
+    Example: :reason 42 Posting scam links in #general
+    """
+    case = CASES.get(case_id)
+    if case is None or case.guild_id != ctx.guild.id:
+        await ctx.send(embed=EmbedTemplates.error("Case Not Found", f"There is no case #{case_id} in this server."))
+        return
+    if case.moderator_id != ctx.author.id and not has_access_level(ctx, 3):
+        await ctx.send(embed=EmbedTemplates.error("Access Denied", "Only the case's moderator or Level 3+ staff can edit its reason."))
+        return
+    old_reason = case.reason
+    await CASES.set_reason(case, reason[:1000], ctx.author.id)
+    log_updated = False
+    shared_log = CASES.shares_log(case)
+    log_channel = bot.get_channel(case.log_channel_id) if case.log_channel_id and not shared_log else None
+    if log_channel:
+        try:
+            log_message = await log_channel.fetch_message(case.log_message_id)
+            embed = log_message.embeds[0] if log_message.embeds else discord.Embed(title="📋 Bot Action Log")
+            value = f"{case.reason}\n*Edited by {ctx.author.display_name}*"
+            for index, field in enumerate(embed.fields):
+                if field.name == "📝 Updated Reason":
+                    embed.set_field_at(index, name=field.name, value=value, inline=False)
+                    break
+            else:
+                embed.add_field(name="📝 Updated Reason", value=value, inline=False)
+            await log_message.edit(embed=embed)
+            log_updated = True
+        except discord.HTTPException:
+            pass
+    await ctx.send(embed=EmbedTemplates.success(
+        f"Case #{case.id} Updated",
+        f"Reason changed to: {case.reason}" + (
+            "\n*The log entry covers a whole mass action, so it was left unchanged.*" if shared_log
+            else "" if log_updated else "\n*The log entry could not be updated.*"
+        )
+    ))
+    await log_action(ctx, f"User {ctx.author.display_name} changed the reason of case #{case.id} from \"{old_reason}\" to \"{case.reason}\".", ProfessionalColors.INFO)
+
+@bot.command(name='cases')
+@access_level_required(1)
+async def cases_command(ctx, user: discord.User, role: str = "target"):
+    """List cases against a user, or cases a moderator has issued.
+
+    Usage: :cases <@user|user ID> [target|moderator]
+    Example: :cases @John moderator
+    """
+    if role.lower() in ("moderator", "mod", "by"):
+        found, heading = CASES.for_moderator(ctx.guild.id, user.id), f"Cases issued by {user}"
+    else:
+        found, heading = CASES.for_target(ctx.guild.id, user.id), f"Cases against {user}"
+    if not found:
+        await ctx.send(embed=EmbedTemplates.info(heading, "No cases on record."))
+        return
+    lines = [
+        f"`#{case.id}` {CASE_ACTION_ICONS.get(case.action, '📁')} **{case.action}** <t:{case.created_at}:d> — {case.reason[:80]}"
+        for case in reversed(found[-15:])
+    ]
+    embed = EmbedTemplates.info(heading, "\n".join(lines))
+    embed.set_footer(text=f"{len(found)} case(s) total" + (" • showing the 15 most recent" if len(found) > 15 else ""))
+    await ctx.send(embed=embed)
 
 # --- New Appeal Flow (Appeal Server only) ---
 APPEAL_SESSIONS = {}
@@ -1728,6 +5535,10 @@ class AppealStaffReviewView(discord.ui.View):
         if not main_guild:
             await interaction.followup.send("Main guild not found. Ensure the bot is in the main server.", ephemeral=True)
             return
+        holder = TARGET_FLIGHTS.claim(main_guild.id, self.appealer_id, "appeal approval", interaction.user)
+        if holder is not None:
+            await interaction.followup.send(target_busy_message(holder), ephemeral=True)
+            return
         try:
             banned_user = await bot.fetch_user(self.appealer_id)
             await main_guild.unban(banned_user, reason=f"Appeal approved by {interaction.user.display_name}")
@@ -1737,16 +5548,26 @@ class AppealStaffReviewView(discord.ui.View):
                 pass
             await interaction.message.edit(content=f"Appeal Approved for {self.username}.", view=None)
             await interaction.followup.send("Unbanned and notified.", ephemeral=True)
+            case = await CASES.open(main_guild.id, "appeal-approve", self.appealer_id, interaction.user.id, "Ban appeal approved")
+            log_message = await log_action_interaction(interaction, f"**Case #{case.id}** — Appeal for {self.username} (ID: {self.appealer_id}) approved by {interaction.user.display_name}.", ProfessionalColors.SUCCESS)
+            await CASES.commit(case, log_message)
         except discord.NotFound:
             await interaction.followup.send("User not found or already unbanned.", ephemeral=True)
         except discord.Forbidden:
             await interaction.followup.send("I don't have permissions to unban in the main guild.", ephemeral=True)
         except Exception as e:
             await interaction.followup.send(f"Unexpected error during approval: {e}", ephemeral=True)
+        finally:
+            TARGET_FLIGHTS.release(main_guild.id, self.appealer_id)
 
     @discord.ui.button(label="Reject", style=discord.ButtonStyle.red, custom_id="appeal_staff_reject")
     async def reject(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.defer(ephemeral=True)
+        guild_id = getattr(config, 'MAIN_GUILD_ID', 0) or interaction.guild_id
+        holder = TARGET_FLIGHTS.claim(guild_id, self.appealer_id, "appeal rejection", interaction.user)
+        if holder is not None:
+            await interaction.followup.send(target_busy_message(holder), ephemeral=True)
+            return
         try:
             user = await bot.fetch_user(self.appealer_id)
             try:
@@ -1755,8 +5576,13 @@ class AppealStaffReviewView(discord.ui.View):
                 pass
             await interaction.message.edit(content=f"Appeal Rejected for {self.username}.", view=None)
             await interaction.followup.send("Appeal rejected and user notified.", ephemeral=True)
+            case = await CASES.open(guild_id, "appeal-decline", self.appealer_id, interaction.user.id, "Ban appeal rejected")
+            log_message = await log_action_interaction(interaction, f"**Case #{case.id}** — Appeal for {self.username} (ID: {self.appealer_id}) rejected by {interaction.user.display_name}.", ProfessionalColors.ERROR)
+            await CASES.commit(case, log_message)
         except Exception as e:
             await interaction.followup.send(f"Unexpected error during rejection: {e}", ephemeral=True)
+        finally:
+            TARGET_FLIGHTS.release(guild_id, self.appealer_id)
 
     @discord.ui.button(label="Review", style=discord.ButtonStyle.blurple, custom_id="appeal_staff_review")
     async def review(self, interaction: discord.Interaction, button: discord.ui.Button):
@@ -1815,6 +5641,7 @@ async def panel(ctx):
     Usage: :panel
     
     Displays server stats, active staff, and admin action buttons.
+    The panel refreshes itself while it is open.
     """
     panel_view = PanelView(bot)
     # Send an initial message and then update it with stats
@@ -1823,9 +5650,970 @@ async def panel(ctx):
         description="Please wait while we gather the latest server statistics."
     )
     initial_message = await ctx.send(embed=loading_embed, view=panel_view)
+    PANEL_STATE.subscribe(initial_message, panel_view)
     await panel_view.update_panel_message(initial_message)
     await log_action(ctx, f"User {ctx.author.display_name} opened the management panel.", ProfessionalColors.INFO)
 
+@bot.command(name='top')
+@access_level_required(2)
+async def top(ctx, window: str = "24h"):
+    """Show the most active users and channels.
+
+    Usage: :top [24h|7d]
+    Example: :top 7d
+
+    Counts come from a bounded Space-Saving sketch; (±n) marks the maximum overestimate.
+    """
+    window = window.lower()
+    if window not in ("24h", "7d"):
+        embed = EmbedTemplates.error("Invalid Window", "Please use `24h` or `7d`.")
+        await ctx.send(embed=embed)
+        return
+    other = "7d" if window == "24h" else "24h"
+    embed = EmbedTemplates.primary(
+        title=f"🏆 Top Activity ({window})",
+        description=f"Most active users and channels over the last **{window}** (with {other} count)."
+    )
+    embed.add_field(name=f"👥 Top Chatters ({window} / {other})", value=format_top_entries(TOP_CHATTERS.top(window, 10), "user", other, TOP_CHATTERS), inline=True)
+    embed.add_field(name=f"💬 Top Channels ({window} / {other})", value=format_top_entries(TOP_CHANNELS.top(window, 10), "channel", other, TOP_CHANNELS), inline=True)
+    embed.set_footer(text=f"Requested by {ctx.author.display_name}")
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} viewed top activity ({window}).", ProfessionalColors.INFO)
+
+@bot.command(name='growth')
+@access_level_required(2)
+async def growth(ctx):
+    """Show net member growth sparklines and early-leave retention.
+
+    Usage: :growth
+
+    Sparklines plot daily joins minus leaves over the last 30 and 90 days.
+    """
+    embed = EmbedTemplates.primary(
+        title="📈 Member Growth",
+        description="Daily net growth (joins − leaves), oldest on the left."
+    )
+    for days in (30, 90):
+        series = MEMBER_FLOW.net_series(days)
+        joins, leaves = MEMBER_FLOW.totals(days)
+        embed.add_field(
+            name=f"🗓️ Last {days} days",
+            value=(
+                f"```\n{render_sparkline(series)}\n```"
+                f"Joins: `{joins}` • Leaves: `{leaves}` • Net: `{joins - leaves:+d}`\n"
+                f"Best day: `{max(series):+d}` • Worst day: `{min(series):+d}`"
+            ),
+            inline=False
+        )
+    embed.add_field(name="🚪 Retention (7d)", value=format_retention_summary(7), inline=False)
+    embed.set_footer(text=f"Requested by {ctx.author.display_name}")
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} viewed member growth.", ProfessionalColors.INFO)
+
+@bot.group(name='stats', invoke_without_command=True)
+@access_level_required(4)
+async def stats(ctx):
+    """Statistics tools.
+
+    Usage: :stats export [days]
+    """
+    embed = EmbedTemplates.info(
+        "📊 Stats Commands",
+        f"`{ctx.prefix}stats export [days]` - Export daily joins, leaves, messages, channel heatmaps and moderation counts (gzip CSV/JSONL)."
+    )
+    await ctx.send(embed=embed)
+
+@stats.command(name='export')
+@access_level_required(4)
+async def stats_export(ctx, days: int = 30):
+    """Export activity history as gzip-compressed CSV/JSONL files.
+
+    Usage: :stats export [days]
+    Example: :stats export 90
+
+    Files are written in a worker thread straight from the history file and split to fit the upload limit.
+    """
+    if days < 1 or days > 365:
+        embed = EmbedTemplates.error("Invalid Range", "Please choose between `1` and `365` days.")
+        await ctx.send(embed=embed)
+        return
+    await flush_activity_history()
+    today = int(datetime.now(timezone.utc).timestamp()) // 86400
+    max_bytes = ctx.guild.filesize_limit if ctx.guild else 25 * 1024 * 1024
+    out_dir = os.path.join(EXPORT_DIR, f"stats_{ctx.guild.id}_{discord.utils.utcnow().strftime('%Y%m%d_%H%M%S')}")
+
+    async def work(job: Job) -> str:
+        cancel = threading.Event()
+        writer = asyncio.create_task(asyncio.to_thread(
+            write_stats_export, out_dir, ACTIVITY_HISTORY_FILE, today - days + 1, [DAILY_ACTIVITY.build_row()], max_bytes, cancel
+        ))
+        try:
+            job.report(f"Writing the last **{days}** days of activity...")
+            # Shielded: cancelling the job must not abandon the thread while it still writes into out_dir
+            paths = await asyncio.shield(writer)
+            batches = group_files_for_upload(paths, max_bytes)
+            for index, batch in enumerate(batches, start=1):
+                job.report(f"Uploading batch {index}/{len(batches)}...")
+                await ctx.send(
+                    f"📦 Stats export ({days}d) • batch {index}/{len(batches)}",
+                    files=[discord.File(path) for path in batch]
+                )
+            await log_action(ctx, f"User {ctx.author.display_name} exported {days} days of stats ({len(paths)} files).", ProfessionalColors.INFO)
+            return f"Exported **{days}** days in **{len(paths)}** file(s)."
+        finally:
+            cancel.set()
+            while not writer.done():
+                try:
+                    await asyncio.shield(writer)
+                except asyncio.CancelledError:
+                    continue  # a repeated cancel; still wait for the thread before deleting its files
+                except Exception:
+                    break  # already surfaced through the first await
+            await asyncio.to_thread(shutil.rmtree, out_dir, True)
+
+    await JOB_RUNNER.submit(f"Stats Export ({days}d)", ctx.author, ctx.channel, work)
+
+@bot.command(name='gateway')
+@access_level_required(4)
+async def gateway(ctx):
+    """Show gateway event rates and memory use to compare panel stats modes.
+
+    Usage: :gateway
+
+    Event counters need GATEWAY_EVENT_STATS = True in config.py.
+    """
+    elapsed_min = max((time.monotonic() - GATEWAY_STATS_STARTED) / 60, 1 / 60)
+    memory = process_memory_mb()
+    cached_members = sum(len(g.members) for g in bot.guilds)
+    with_presence = sum(1 for g in bot.guilds for m in g.members if m.status != discord.Status.offline)
+    embed = EmbedTemplates.info(
+        "📡 Gateway & Memory",
+        f"Presences intent: `{'On' if bot.intents.presences else 'Off'}` • Panel mode: `{panel_stats_mode()}`\n"
+        f"Memory (RSS): `{f'{memory:.1f} MB' if memory is not None else 'Unavailable'}`\n"
+        f"Cached members: `{cached_members}` • With presence data: `{with_presence}`"
+    )
+    if GATEWAY_EVENT_COUNTS:
+        total = sum(GATEWAY_EVENT_COUNTS.values())
+        top_events = sorted(GATEWAY_EVENT_COUNTS.items(), key=lambda kv: kv[1], reverse=True)[:10]
+        embed.add_field(
+            name=f"📨 Events ({total / elapsed_min:.1f}/min overall)",
+            value="\n".join(f"`{name}`: `{count}` ({count / total * 100:.1f}%, {count / elapsed_min:.1f}/min)" for name, count in top_events),
+            inline=False
+        )
+    else:
+        embed.add_field(name="📨 Events", value="Set `GATEWAY_EVENT_STATS = True` in config.py to count gateway events.", inline=False)
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} viewed gateway stats.", ProfessionalColors.INFO)
+
+@bot.command(name='pipeline')
+@access_level_required(4)
+async def pipeline(ctx, action: str = None):
+    """Show per-stage timings of the message pipeline.
+
+    Usage: :pipeline [reset]
+    """
+    global COMMAND_PRECHECK_SKIPPED
+    if action and action.lower() == "reset":
+        MESSAGE_PIPELINE.reset_stats()
+        COMMAND_PRECHECK_SKIPPED = 0
+        await ctx.send(embed=EmbedTemplates.success("Pipeline Stats Reset", "Stage counters were cleared."))
+        return
+    lines = []
+    for _, name, _, _, _ in MESSAGE_PIPELINE._stages:
+        calls, total_ns, max_ns, stops = MESSAGE_PIPELINE.stats[name]
+        avg_us = total_ns / calls / 1000 if calls else 0
+        line = f"`{name}`: `{calls}` calls • avg `{avg_us:.1f}µs` • max `{max_ns / 1000:.0f}µs`"
+        if stops:
+            line += f" • stopped `{stops}`"
+        lines.append(line)
+    embed = EmbedTemplates.info("🧵 Message Pipeline", "\n".join(lines) or "No stages registered.")
+    embed.add_field(name="Prefix Pre-check", value=f"`{COMMAND_PRECHECK_SKIPPED}` non-command messages skipped building a command context.", inline=False)
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} viewed message pipeline stats.", ProfessionalColors.INFO)
+
+@bot.group(name='filter', invoke_without_command=True)
+@access_level_required(4)
+async def filter_group(ctx):
+    """Banned word/phrase filter tools.
+
+    Usage: :filter reload | :filter test <text>
+    """
+    embed = EmbedTemplates.info(
+        "🚫 Phrase Filter",
+        f"**{len(PHRASE_FILTER.phrases)}** banned phrase(s) loaded • whole-word matching: `{'On' if PHRASE_FILTER.whole_word else 'Off'}`\n\n"
+        f"`{ctx.prefix}filter reload` - Re-read the phrase and domain list files and rebuild the filter\n"
+        f"`{ctx.prefix}filter test <text>` - Show what a message would match"
+    )
+    await ctx.send(embed=embed)
+
+@filter_group.command(name='reload')
+@access_level_required(4)
+async def filter_reload(ctx):
+    """Re-read the banned phrases and filter lists files, then rebuild the filter and link rules.
+
+    Usage: :filter reload
+    """
+    global PHRASE_FILTER, DOMAIN_RULES
+    started = time.perf_counter()
+    try:
+        lists = await asyncio.to_thread(load_filter_lists, True)
+        matcher = await asyncio.to_thread(build_phrase_matcher, lists)
+        domain_rules = build_domain_rules(lists)
+    except Exception as e:
+        await ctx.send(embed=EmbedTemplates.error("Reload Failed", f"The filter was not changed: {e}"))
+        return
+    PHRASE_FILTER = matcher
+    DOMAIN_RULES = domain_rules
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    await ctx.send(embed=EmbedTemplates.success("Filter Reloaded", f"Compiled **{len(matcher.phrases)}** phrase(s) in `{elapsed_ms:.1f} ms`."))
+    await log_action(ctx, f"User {ctx.author.display_name} reloaded the phrase filter ({len(matcher.phrases)} phrases).", ProfessionalColors.INFO)
+
+@filter_group.command(name='test')
+@access_level_required(4)
+async def filter_test(ctx, *, text: str):
+    """Check text against the filter without taking action.
+
+    Usage: :filter test <text>
+    """
+    started = time.perf_counter_ns()
+    matches = PHRASE_FILTER.find(text)
+    elapsed_us = (time.perf_counter_ns() - started) / 1000
+    if matches:
+        embed = EmbedTemplates.warning("Filter Match", f"Matched: {', '.join(f'||{m}||' for m in matches)}")
+    else:
+        embed = EmbedTemplates.success("No Match", "This text would not be filtered.")
+    embed.add_field(name="Normalized", value=f"`{normalize_for_filter(text)[:1000]}`", inline=False)
+    embed.set_footer(text=f"Checked in {elapsed_us:.0f} µs")
+    await ctx.send(embed=embed)
+
+@bot.command(name='joinqueue')
+@access_level_required(4)
+async def joinqueue(ctx):
+    """Show join queue depth, lag and shed work.
+
+    Usage: :joinqueue
+    """
+    m = JOIN_QUEUE.metrics
+    avg_lag = m["lag_total"] / m["roles_granted"] if m["roles_granted"] else 0
+    embed = EmbedTemplates.info(
+        "🚪 Join Queue",
+        f"Depth: `{JOIN_QUEUE.depth()}` • Oldest role grant waiting: `{JOIN_QUEUE.current_lag():.1f}s`\n"
+        f"Role grant lag: avg `{avg_lag:.1f}s` • max `{m['lag_max']:.1f}s`"
+    )
+    embed.add_field(name="Processed", value=f"Joins: `{m['enqueued']}`\nWelcomed: `{m['welcomed']}` in `{m['welcome_posts']}` posts\nRoles granted: `{m['roles_granted']}`", inline=True)
+    embed.add_field(name="Shed", value=f"Welcomes skipped: `{m['welcomes_shed']}`\nRole grants dropped: `{m['roles_dropped']}`\nErrors: `{m['errors']}`", inline=True)
+    await ctx.send(embed=embed)
+
+async def _get_member_snapshot(ctx) -> MemberSnapshot:
+    snapshot = MEMBER_SNAPSHOTS.get(ctx.guild.id)
+    if snapshot is None:
+        snapshot = await refresh_member_snapshot(ctx.guild)
+    return snapshot
+
+@bot.group(name='query', invoke_without_command=True)
+@access_level_required(2)
+async def query(ctx):
+    """Run aggregate queries over the member snapshot.
+
+    Usage: :query count [filters...] | :query teams [filters...] | :query refresh
+    Example: :query count joined<30d noroles
+    """
+    embed = EmbedTemplates.info(
+        "🔎 Member Queries",
+        f"`{ctx.prefix}query count [filters...]` - Count matching members\n"
+        f"`{ctx.prefix}query teams [filters...]` - Team distribution of matching members\n"
+        f"`{ctx.prefix}query refresh` - Rebuild the member snapshot now\n\n"
+        "**Filters:** `joined<30d`, `joined>30d`, `created<7d`, `created>1y`, `noroles`, `hasroles`, "
+        "`bots`, `humans`, `role:<team|rank|id>` (quote names with spaces)"
+    )
+    await ctx.send(embed=embed)
+
+@query.command(name='count')
+@access_level_required(2)
+async def query_count(ctx, *filters: str):
+    """Count members matching all filters. Example: :query count created<7d humans"""
+    snapshot = await _get_member_snapshot(ctx)
+    try:
+        conditions, labels = parse_member_filters(list(filters), snapshot)
+    except ValueError as e:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Filter", str(e)))
+        return
+    count, _ = await asyncio.to_thread(snapshot.query, conditions)
+    embed = EmbedTemplates.info(
+        "🔎 Member Query",
+        f"**{count}** of **{len(snapshot)}** members match"
+        + (f": {', '.join(labels)}." if labels else ".")
+    )
+    embed.set_footer(text=f"Snapshot taken {snapshot.taken_at.strftime('%Y-%m-%d %H:%M UTC')}")
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} ran member query: count {' '.join(filters)}", ProfessionalColors.INFO)
+
+@query.command(name='teams')
+@access_level_required(2)
+async def query_teams(ctx, *filters: str):
+    """Show how matching members are distributed across teams. Example: :query teams joined<90d"""
+    snapshot = await _get_member_snapshot(ctx)
+    try:
+        conditions, labels = parse_member_filters(list(filters), snapshot)
+    except ValueError as e:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Filter", str(e)))
+        return
+    group_masks = {
+        team.replace("_", " ").title(): snapshot.mask_for([rid])
+        for team, rid in getattr(config, 'TEAM_ROLE_IDS', {}).items()
+    }
+    count, groups = await asyncio.to_thread(snapshot.query, conditions, group_masks)
+    lines = [f"{team}: `{n}`" for team, n in sorted(groups.items(), key=lambda kv: kv[1], reverse=True)]
+    embed = EmbedTemplates.info(
+        "🔎 Team Distribution",
+        f"**{count}** members match" + (f": {', '.join(labels)}." if labels else ".") + "\n\n" + "\n".join(lines)
+    )
+    embed.set_footer(text=f"Snapshot taken {snapshot.taken_at.strftime('%Y-%m-%d %H:%M UTC')}")
+    await ctx.send(embed=embed)
+    await log_action(ctx, f"User {ctx.author.display_name} ran member query: teams {' '.join(filters)}", ProfessionalColors.INFO)
+
+@query.command(name='refresh')
+@access_level_required(2)
+async def query_refresh(ctx):
+    """Rebuild the member snapshot immediately."""
+    snapshot = await refresh_member_snapshot(ctx.guild)
+    await ctx.send(embed=EmbedTemplates.success("Snapshot Refreshed", f"Captured **{len(snapshot)}** members."))
+
+
+@bot.group(name='lockdown', invoke_without_command=True)
+@access_level_required(3)
+async def lockdown(ctx, *, reason: str = None):
+    """Lock every public channel at once.
+
+    Usage: :lockdown [reason] | :lockdown lift | :lockdown status
+    Example: :lockdown Raid in progress
+
+    Overwrites are saved to disk before anything changes; lifting restores them exactly.
+    """
+    job = await start_lockdown(ctx.guild, ctx.author, ctx.channel, reason)
+    if job is None:
+        embed = EmbedTemplates.warning("Already Locked Down", f"This server is already in lockdown. Use `{ctx.prefix}lockdown lift` to restore it.")
+        await ctx.send(embed=embed)
+        return
+    total = len(LOCKDOWN_STATE[str(ctx.guild.id)]["channels"])
+    await log_action(ctx, f"User {ctx.author.display_name} started a lockdown of {total} channels (job #{job.id}). Reason: {reason or 'No reason provided'}", ProfessionalColors.WARNING)
+
+@lockdown.command(name='lift')
+@access_level_required(3)
+async def lockdown_lift(ctx):
+    """Lift the lockdown and restore every channel's saved overwrites.
+
+    Usage: :lockdown lift
+    """
+    job = await lift_lockdown(ctx.guild, ctx.author, ctx.channel)
+    if job is None:
+        await ctx.send(embed=EmbedTemplates.info("No Lockdown", "This server is not in lockdown."))
+        return
+    await log_action(ctx, f"User {ctx.author.display_name} lifted the lockdown (job #{job.id}).", ProfessionalColors.SUCCESS)
+
+@lockdown.command(name='status')
+@access_level_required(3)
+async def lockdown_status(ctx):
+    """Show whether the server is in lockdown.
+
+    Usage: :lockdown status
+    """
+    state = LOCKDOWN_STATE.get(str(ctx.guild.id))
+    if not state:
+        await ctx.send(embed=EmbedTemplates.info("Lockdown Status", "This server is not in lockdown."))
+        return
+    labels = {"lock": "Locking", "locked": "Locked down", "lift": "Lifting"}
+    embed = EmbedTemplates.warning("Lockdown Status", f"**{labels.get(state['action'], state['action'])}** • {len(state['channels'])} channel(s)")
+    if state["action"] in ("lock", "lift"):
+        embed.add_field(name="Progress", value=f"{len(state['done'])}/{len(state['channels'])}", inline=True)
+    embed.add_field(name="Reason", value=state.get("reason") or "No reason provided", inline=True)
+    await ctx.send(embed=embed)
+
+@bot.group(name='raid', invoke_without_command=True)
+@access_level_required(3)
+async def raid(ctx):
+    """Show raid detector status and recent raid cohorts.
+
+    Usage: :raid | :raid end
+    """
+    detector = get_raid_detector(ctx.guild.id)
+    status = (
+        f"🚨 **Raid in progress** (cohort `{detector.active['id']}`, {len(detector.active['member_ids'])} members)"
+        if detector.active else "No raid in progress."
+    )
+    embed = EmbedTemplates.warning("Raid Detector", status) if detector.active else EmbedTemplates.info("Raid Detector", status)
+    embed.add_field(
+        name=f"Last {detector.window:g}s",
+        value=f"Joins: `{len(detector._joins)}` • Young: `{detector.young}` • Default avatars: `{detector.default_avatars}`\n"
+              f"Score: `{detector.score():.0f}` / `{detector.threshold:g}`",
+        inline=False
+    )
+    cohorts = [c for c in RAID_COHORTS if c["guild_id"] == ctx.guild.id][-5:]
+    if cohorts:
+        embed.add_field(
+            name="Recent Cohorts",
+            value="\n".join(
+                f"`{c['id']}` • {c['started_at'][:16].replace('T', ' ')} UTC • {len(c['member_ids'])} members • peak {c['peak_score']:.0f}"
+                + ("" if c["ended_at"] else " • active") + (" • closed at restart" if c.get("interrupted") else "")
+                for c in reversed(cohorts)
+            ),
+            inline=False
+        )
+    await ctx.send(embed=embed)
+
+@raid.command(name='end')
+@access_level_required(3)
+async def raid_end(ctx):
+    """Close the active raid cohort now.
+
+    Usage: :raid end
+    """
+    detector = get_raid_detector(ctx.guild.id)
+    if not detector.active:
+        await ctx.send(embed=EmbedTemplates.info("No Raid", "There is no raid in progress."))
+        return
+    detector.active["ended_at"] = discord.utils.utcnow().isoformat()
+    cohort_id = detector.active["id"]
+    await on_raid_ended(ctx.guild, detector)
+    await ctx.send(embed=EmbedTemplates.success("Raid Closed", f"Cohort `{cohort_id}` was closed."))
+    await log_action(ctx, f"User {ctx.author.display_name} closed raid cohort {cohort_id}.", ProfessionalColors.INFO)
+
+# --- Mass Moderation ---
+MASS_TARGET_ID = re.compile(r"<@!?(\d{15,21})>|(\d{15,21})")
+
+async def resolve_mass_targets(ctx, spec: str):
+    """Turn mentions, IDs, cohort:<id|last> and member filters into a list of user IDs.
+
+    Filters (joined<1h, created<7d, noroles, role:...) are matched against a fresh member
+    snapshot and combined with AND. With explicit targets or cohorts the filters only narrow
+    them down; on their own they select every member that matches.
+    Returns (user_ids, labels). Raises ValueError with a user-facing message.
+    """
+    ids, labels, filter_tokens = [], [], []
+    explicit = 0
+    for token in spec.split():
+        id_match = MASS_TARGET_ID.fullmatch(token)
+        if id_match:
+            ids.append(int(id_match.group(1) or id_match.group(2)))
+            explicit += 1
+        elif token.lower().startswith("cohort:"):
+            key = token[7:]
+            cohorts = [c for c in RAID_COHORTS if c["guild_id"] == ctx.guild.id]
+            cohort = cohorts[-1] if key.lower() == "last" and cohorts else (find_raid_cohort(int(key)) if key.isdigit() else None)
+            if not cohort or cohort["guild_id"] != ctx.guild.id:
+                raise ValueError(f"No raid cohort `{key}`. See `{ctx.prefix}raid` for recent cohorts.")
+            ids.extend(cohort["member_ids"])
+            labels.append(f"cohort {cohort['id']}")
+        else:
+            filter_tokens.append(token)
+    if filter_tokens:
+        snapshot = await refresh_member_snapshot(ctx.guild)
+        conditions, filter_labels = parse_member_filters(filter_tokens, snapshot)
+        matched = await asyncio.to_thread(snapshot.select_ids, conditions)
+        if ids:
+            matched = set(matched)
+            ids = [user_id for user_id in ids if user_id in matched]
+        else:
+            ids = list(matched)
+        labels.append(("only " if labels or explicit else "") + ", ".join(filter_labels))
+    if explicit:
+        labels.append(f"{explicit} listed user(s)")
+    return list(dict.fromkeys(ids)), labels
+
+def precheck_mass_targets(ctx, user_ids: list, action: str):
+    """One pass over the targets applying :ban/:kick hierarchy rules.
+
+    Returns (targets, skipped) where targets are Members or discord.Objects (for users
+    no longer in the server; bans only) and skipped maps a reason to a count.
+    """
+    guild = ctx.guild
+    author_top = ctx.author.top_role
+    bot_top = guild.me.top_role
+    is_owner = ctx.author.id == guild.owner_id
+    protected = {ctx.author.id, guild.me.id, guild.owner_id}
+    targets, skipped = [], {}
+
+    def skip(reason):
+        skipped[reason] = skipped.get(reason, 0) + 1
+
+    for user_id in user_ids:
+        if user_id in protected:
+            skip("you, the bot or the owner")
+            continue
+        member = guild.get_member(user_id)
+        if member is None:
+            if action == "ban":
+                targets.append(discord.Object(id=user_id))
+            else:
+                skip("not in the server")
+            continue
+        if is_staff_member(member):
+            skip("staff")
+        elif member.top_role >= author_top and not is_owner:
+            skip("role equal/higher than yours")
+        elif member.top_role >= bot_top:
+            skip("role equal/higher than the bot's")
+        else:
+            targets.append(member)
+    return targets, skipped
+
+async def send_mass_dms(job: Job, members: list, embed: discord.Embed) -> tuple:
+    """DM members through a bounded pool; runs before the ban so the DM can still arrive."""
+    semaphore = asyncio.Semaphore(getattr(config, 'MASS_DM_CONCURRENCY', 5))
+    sent = failed = 0
+
+    async def deliver(member):
+        nonlocal sent, failed
+        async with semaphore:
+            try:
+                await member.send(embed=embed)
+                sent += 1
+            except discord.HTTPException:
+                failed += 1
+            job.report(f"Sending DMs: {sent + failed}/{len(members)}")
+
+    await asyncio.gather(*(deliver(m) for m in members))
+    return sent, failed
+
+async def run_mass_ban(job: Job, ctx, targets: list, reason: str, send_dm: bool) -> tuple:
+    members = [t for t in targets if isinstance(t, discord.Member)]
+    dm_sent = dm_failed = 0
+    if send_dm and members:
+        dm_sent, dm_failed = await send_mass_dms(job, members, build_ban_dm_embed(reason, ctx.author.display_name))
+    banned, failed = [], []
+    chunks = [targets[i:i + 200] for i in range(0, len(targets), 200)]
+    for index, chunk in enumerate(chunks, start=1):
+        job.report(f"Banning: batch {index}/{len(chunks)} ({len(banned)} banned so far)")
+        try:
+            result = await ctx.guild.bulk_ban(
+                chunk, reason=f"Mass ban by {ctx.author}: {reason}"[:512],
+                delete_message_seconds=getattr(config, 'MASSBAN_DELETE_MESSAGE_SECONDS', 3600)
+            )
+            banned.extend(result.banned)
+            failed.extend(result.failed)
+        except discord.HTTPException as e:
+            print(f"Warning: bulk_ban batch {index} failed: {e}")
+            failed.extend(chunk)
+    for _ in banned:
+        record_moderation_action("ban")
+    cases = await CASES.open_many(ctx.guild.id, "ban", [user.id for user in banned], ctx.author.id, reason)
+    summary = f"Banned **{len(banned)}** of {len(targets)} user(s)."
+    if failed:
+        summary += f" **{len(failed)}** failed."
+    if send_dm:
+        summary += f"\nAppeal DMs: {dm_sent} sent, {dm_failed} failed."
+    return summary, cases
+
+async def run_mass_kick(job: Job, ctx, targets: list, reason: str, send_dm: bool) -> tuple:
+    dm_sent = dm_failed = 0
+    if send_dm:
+        dm_sent, dm_failed = await send_mass_dms(job, targets, build_kick_dm_embed(ctx.guild, reason, ctx.author.display_name))
+    # No bulk kick endpoint: a small pool keeps kicks moving without hogging the rate limit
+    semaphore = asyncio.Semaphore(getattr(config, 'MASS_KICK_CONCURRENCY', 3))
+    kicked, failed = [], 0
+
+    async def kick_one(member):
+        nonlocal failed
+        async with semaphore:
+            try:
+                await member.kick(reason=f"Mass kick by {ctx.author}: {reason}"[:512])
+                kicked.append(member.id)
+                record_moderation_action("kick")
+            except discord.HTTPException:
+                failed += 1
+            job.report(f"Kicking: {len(kicked) + failed}/{len(targets)}")
+
+    await asyncio.gather(*(kick_one(m) for m in targets))
+    cases = await CASES.open_many(ctx.guild.id, "kick", kicked, ctx.author.id, reason)
+    summary = f"Kicked **{len(kicked)}** of {len(targets)} member(s)."
+    if failed:
+        summary += f" **{failed}** failed."
+    if send_dm:
+        summary += f"\nDMs: {dm_sent} sent, {dm_failed} failed."
+    return summary, cases
+
+class MassActionConfirmView(discord.ui.View):
+    def __init__(self, author_id: int):
+        super().__init__(timeout=60)
+        self.author_id = author_id
+        self.confirmed = None
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("Only the moderator who ran the command can confirm it.", ephemeral=True)
+            return False
+        return True
+
+    @discord.ui.button(label="✅ Confirm", style=discord.ButtonStyle.danger)
+    async def confirm_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.confirmed = True
+        await interaction.response.edit_message(view=None)
+        self.stop()
+
+    @discord.ui.button(label="❌ Cancel", style=discord.ButtonStyle.secondary)
+    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.confirmed = False
+        await interaction.response.edit_message(view=None)
+        self.stop()
+
+async def run_mass_action(ctx, action: str, spec: str):
+    """Shared flow for :massban / :masskick: resolve, pre-check, confirm, then run as a job."""
+    permission = "ban_members" if action == "ban" else "kick_members"
+    perms = ctx.guild.me.guild_permissions
+    if not getattr(perms, permission) or (action == "ban" and not perms.manage_guild):
+        needed = "**Ban Members** and **Manage Server**" if action == "ban" else "**Kick Members**"
+        await ctx.send(embed=EmbedTemplates.error("Missing Permissions", f"I need {needed} to do this."))
+        return
+    targets_spec, _, reason = spec.partition("|")
+    reason = reason.strip() or "No reason provided."
+    tokens = targets_spec.split()
+    send_dm = "nodm" not in (t.lower() for t in tokens)
+    targets_spec = " ".join(t for t in tokens if t.lower() != "nodm")
+    try:
+        user_ids, labels = await resolve_mass_targets(ctx, targets_spec)
+    except ValueError as e:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Targets", str(e)))
+        return
+    limit = getattr(config, 'MASS_ACTION_MAX_TARGETS', 1000)
+    if len(user_ids) > limit:
+        await ctx.send(embed=EmbedTemplates.error("Too Many Targets", f"That matches **{len(user_ids)}** users; the limit is **{limit}**. Narrow the filters."))
+        return
+    targets, skipped = precheck_mass_targets(ctx, user_ids, action)
+    if not targets:
+        detail = "\n".join(f"• {reason_}: {count}" for reason_, count in skipped.items())
+        await ctx.send(embed=EmbedTemplates.warning("No Targets", "Nothing to do." + (f"\n\nSkipped:\n{detail}" if detail else "")))
+        return
+
+    verb, past = ("ban", "banned") if action == "ban" else ("kick", "kicked")
+    sample = ", ".join(getattr(t, "mention", f"<@{t.id}>") for t in targets[:15])
+    embed = EmbedTemplates.warning(
+        f"Confirm Mass {verb.title()}",
+        f"**{len(targets)}** user(s) will be {past}."
+    )
+    embed.add_field(name="Targets", value=(sample + (f" and {len(targets) - 15} more" if len(targets) > 15 else ""))[:1024], inline=False)
+    if labels:
+        embed.add_field(name="Selected By", value=", ".join(labels)[:1024], inline=False)
+    if skipped:
+        embed.add_field(name="Skipped", value="\n".join(f"• {r}: {c}" for r, c in skipped.items()), inline=False)
+    embed.add_field(name="📋 Reason", value=reason[:1024], inline=False)
+    embed.set_footer(text=f"DMs: {'on' if send_dm else 'off'} • Confirm within 60 seconds")
+    view = MassActionConfirmView(ctx.author.id)
+    prompt = await ctx.send(embed=embed, view=view)
+    await view.wait()
+    if not view.confirmed:
+        await prompt.edit(embed=EmbedTemplates.info("Cancelled", f"Mass {verb} cancelled."), view=None)
+        return
+
+    async def work(job: Job) -> str:
+        runner = run_mass_ban if action == "ban" else run_mass_kick
+        summary, cases = await runner(job, ctx, targets, reason, send_dm)
+        skipped_text = f" Skipped {sum(skipped.values())}." if skipped else ""
+        case_text = f"**Cases #{cases[0].id}–#{cases[-1].id}** — " if cases else ""
+        log_message = await log_action(
+            ctx,
+            f"{case_text}User {ctx.author.display_name} ran a mass {verb} ({', '.join(labels)}). {summary}{skipped_text} Reason: {reason}",
+            ProfessionalColors.ERROR
+        )
+        await CASES.commit_many(cases, log_message)
+        return summary
+
+    await JOB_RUNNER.submit(f"Mass {verb.title()} ({len(targets)})", ctx.author, ctx.channel, work)
+
+@bot.command(name='massban')
+@access_level_required(3)
+async def massban(ctx, *, targets: str):
+    """Ban many users at once after a confirmation.
+
+    Usage: :massban <@users | IDs | cohort:<id|last> | filters> [nodm] [| reason]
+    Example: :massban cohort:last noroles | Raid accounts
+
+    Appeal DMs are sent first, then users are banned in batches of 200.
+    """
+    await run_mass_action(ctx, "ban", targets)
+
+@bot.command(name='masskick')
+@access_level_required(3)
+async def masskick(ctx, *, targets: str):
+    """Kick many members at once after a confirmation.
+
+    Usage: :masskick <@users | IDs | cohort:<id|last> | filters> [nodm] [| reason]
+    Example: :masskick joined<10m created<1d | Raid cleanup
+    """
+    await run_mass_action(ctx, "kick", targets)
+
+def moderation_hierarchy_error(ctx, member: discord.Member, verb: str) -> Optional[str]:
+    """The :ban/:kick role checks; returns a user-facing error or None."""
+    if member.top_role >= ctx.author.top_role and ctx.author.id != ctx.guild.owner_id:
+        return f"You cannot {verb} someone with an equal or higher role than yourself."
+    if member.top_role >= ctx.guild.me.top_role:
+        return f"I cannot {verb} someone with an equal or higher role than myself."
+    return None
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return " ".join(parts) or f"{seconds}s"
+
+@bot.command(name='tempban')
+@access_level_required(1)
+@single_flight("tempban")
+async def tempban(ctx, member: discord.Member, duration: str, *, reason: str = "No reason provided."):
+    """Ban a member for a limited time; they are unbanned automatically.
+
+    Usage: :tempban <@user> <duration> [reason]
+    Example: :tempban @John 7d Repeated spam
+    """
+    seconds = parse_duration(duration)
+    if seconds is None:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Duration", "Use a duration like `12h`, `7d` or `1d12h`."))
+        return
+    if not ctx.guild.me.guild_permissions.ban_members:
+        await ctx.send(embed=EmbedTemplates.error("Missing Permissions", "I don't have the **Ban Members** permission required to ban users."))
+        return
+    error = moderation_hierarchy_error(ctx, member, "ban")
+    if error:
+        await ctx.send(embed=EmbedTemplates.error("Cannot Ban User", error))
+        await log_action(ctx, f"Failed tempban of {member.display_name}: {error}", ProfessionalColors.ERROR)
+        return
+    length = format_duration(seconds)
+    try:
+        await member.send(embed=build_ban_dm_embed(f"{reason} (temporary: {length})", ctx.author.display_name))
+    except discord.HTTPException:
+        await ctx.send(embed=EmbedTemplates.warning("Could Not Send DM", f"Could not DM {member.display_name} about the ban."))
+    try:
+        await member.ban(reason=f"Tempban ({length}): {reason}"[:512])
+    except discord.HTTPException as e:
+        await ctx.send(embed=EmbedTemplates.error("Ban Failed", f"Could not ban {member.display_name}: {e}"))
+        return
+    await PUNISHMENTS.schedule("tempban", ctx.guild.id, member.id, time.time() + seconds, reason=reason, moderator_id=ctx.author.id)
+    record_moderation_action("ban")
+    record_ban(ctx.guild, member, reason, source="command")
+    embed = EmbedTemplates.error(title="Member Temporarily Banned", description=f"**{member.display_name}** has been banned for **{length}**.")
+    embed.add_field(name="📋 Reason", value=reason, inline=False)
+    embed.add_field(name="⏰ Unbanned", value=discord.utils.format_dt(discord.utils.utcnow() + timedelta(seconds=seconds), 'R'), inline=False)
+    embed.add_field(name="👮 Moderator", value=ctx.author.mention, inline=False)
+    case = await CASES.open(ctx.guild.id, "tempban", member.id, ctx.author.id, f"{reason} ({length})")
+    embed.set_footer(text=f"Case #{case.id}")
+    await ctx.send(embed=embed)
+    log_message = await log_action(ctx, f"**Case #{case.id}** — User {ctx.author.display_name} tempbanned {member.display_name} (ID: {member.id}) for {length}: {reason}", ProfessionalColors.ERROR)
+    await CASES.commit(case, log_message)
+
+@bot.command(name='mute')
+@access_level_required(1)
+@single_flight("mute")
+async def mute(ctx, member: discord.Member, duration: str, *, reason: str = "No reason provided."):
+    """Time a member out. Mutes longer than Discord's 28-day limit are renewed automatically.
+
+    Usage: :mute <@user> <duration> [reason]
+    Example: :mute @John 2h Arguing with staff
+    """
+    seconds = parse_duration(duration)
+    if seconds is None:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Duration", "Use a duration like `30m`, `2h` or `60d`."))
+        return
+    if not ctx.guild.me.guild_permissions.moderate_members:
+        await ctx.send(embed=EmbedTemplates.error("Missing Permissions", "I don't have the **Timeout Members** permission required to mute users."))
+        return
+    error = moderation_hierarchy_error(ctx, member, "mute")
+    if error:
+        await ctx.send(embed=EmbedTemplates.error("Cannot Mute User", error))
+        await log_action(ctx, f"Failed mute of {member.display_name}: {error}", ProfessionalColors.ERROR)
+        return
+    length = format_duration(seconds)
+    until = discord.utils.utcnow() + timedelta(seconds=min(seconds, MAX_TIMEOUT_SECONDS))
+    try:
+        await member.timeout(until, reason=f"Mute ({length}): {reason}"[:512])
+    except discord.HTTPException as e:
+        await ctx.send(embed=EmbedTemplates.error("Mute Failed", f"Could not mute {member.display_name}: {e}"))
+        return
+    if seconds > MAX_TIMEOUT_SECONDS:
+        await PUNISHMENTS.schedule("mute", ctx.guild.id, member.id, time.time() + seconds, wake_at=until.timestamp(), reason=reason, moderator_id=ctx.author.id)
+    else:
+        await PUNISHMENTS.cancel("mute", ctx.guild.id, member.id)
+    embed = EmbedTemplates.warning(title="Member Muted", description=f"**{member.display_name}** has been muted for **{length}**.")
+    embed.add_field(name="📋 Reason", value=reason, inline=False)
+    embed.add_field(name="⏰ Ends", value=discord.utils.format_dt(discord.utils.utcnow() + timedelta(seconds=seconds), 'R'), inline=False)
+    embed.add_field(name="👮 Moderator", value=ctx.author.mention, inline=False)
+    case = await CASES.open(ctx.guild.id, "mute", member.id, ctx.author.id, f"{reason} ({length})")
+    embed.set_footer(text=f"Case #{case.id}")
+    await ctx.send(embed=embed)
+    log_message = await log_action(ctx, f"**Case #{case.id}** — User {ctx.author.display_name} muted {member.display_name} (ID: {member.id}) for {length}: {reason}", ProfessionalColors.WARNING)
+    await CASES.commit(case, log_message)
+
+@bot.command(name='unmute')
+@access_level_required(1)
+async def unmute(ctx, member: discord.Member):
+    """Remove a member's mute early.
+
+    Usage: :unmute <@user>
+    """
+    try:
+        await member.timeout(None, reason=f"Unmuted by {ctx.author}")
+    except discord.HTTPException as e:
+        await ctx.send(embed=EmbedTemplates.error("Unmute Failed", f"Could not unmute {member.display_name}: {e}"))
+        return
+    # Only drop the scheduled long mute once the timeout is actually gone
+    await PUNISHMENTS.cancel("mute", ctx.guild.id, member.id)
+    await ctx.send(embed=EmbedTemplates.success("Member Unmuted", f"**{member.display_name}** can talk again."))
+    await log_action(ctx, f"User {ctx.author.display_name} unmuted {member.display_name} (ID: {member.id}).", ProfessionalColors.SUCCESS)
+
+# --- Purge ---
+BULK_DELETE_MAX_AGE = timedelta(days=14) - timedelta(minutes=5)  # margin so a batch never ages past the cutoff mid-request
+
+def parse_purge_filters(text: str):
+    """Turn `user:@x contains:"free nitro" links bots after:<id>` into (predicate, after, description)."""
+    user_ids, needles, after = set(), [], None
+    links = bots = False
+    for token in shlex.split(text or ""):
+        key, _, value = token.partition(":")
+        key = key.lower()
+        if key == "user" and value:
+            match = re.search(r"\d{15,20}", value)
+            if not match:
+                raise commands.BadArgument(f"`{token}` is not a user mention or ID.")
+            user_ids.add(int(match.group()))
+        elif key == "contains" and value:
+            needles.append(value.casefold())
+        elif key == "after" and value.isdigit():
+            after = discord.Object(id=int(value))
+        elif key == "links" and not value:
+            links = True
+        elif key == "bots" and not value:
+            bots = True
+        else:
+            raise commands.BadArgument(f"Unknown purge filter `{token}`.")
+
+    def predicate(message: discord.Message) -> bool:
+        if message.pinned:
+            return False
+        if user_ids and message.author.id not in user_ids:
+            return False
+        if bots and not message.author.bot:
+            return False
+        if needles:
+            content = message.content.casefold()
+            if not any(needle in content for needle in needles):
+                return False
+        if links and not (URL_PATTERN.search(message.content) or INVITE_PATTERN.search(message.content)):
+            return False
+        return True
+
+    parts = []
+    if user_ids:
+        parts.append("from " + ", ".join(f"<@{user_id}>" for user_id in user_ids))
+    if bots:
+        parts.append("from bots")
+    if needles:
+        parts.append("containing " + " or ".join(f"\"{needle}\"" for needle in needles))
+    if links:
+        parts.append("with links")
+    if after:
+        parts.append(f"after message {after.id}")
+    return predicate, after, ", ".join(parts) or "any messages"
+
+async def purge_job(job: Job, channel: discord.TextChannel, before: discord.abc.Snowflake, after, predicate, amount: int) -> str:
+    """Stream the channel's history newest-first and delete matches: recent ones 100 at a time
+    via bulk delete, messages older than 14 days one by one at a throttled pace."""
+    scan_limit = getattr(config, 'PURGE_SCAN_LIMIT', 5000)
+    single_interval = getattr(config, 'PURGE_SINGLE_DELETE_INTERVAL', 1.0)
+    bulk_cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE
+    scanned = bulk_deleted = single_deleted = failed = 0
+    batch = []
+
+    def progress() -> str:
+        return (f"Scanned **{short_count(scanned)}** message(s) in {channel.mention}\n"
+                f"Deleted **{bulk_deleted + single_deleted}**/{amount} (bulk {bulk_deleted}, single {single_deleted})")
+
+    async def flush():
+        nonlocal bulk_deleted, failed
+        try:
+            await channel.delete_messages(batch)
+            bulk_deleted += len(batch)
+        except discord.NotFound:
+            # Someone removed one of them first; bulk delete is all-or-nothing, so retry individually.
+            for message in batch:
+                try:
+                    await message.delete()
+                    bulk_deleted += 1
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException:
+                    failed += 1
+        except discord.HTTPException as e:
+            print(f"Warning: Bulk delete of {len(batch)} messages in #{channel} failed: {e}")
+            failed += len(batch)
+        batch.clear()
+        job.report(progress())
+
+    async for message in channel.history(limit=scan_limit, before=before, after=after, oldest_first=False):
+        scanned += 1
+        if scanned % 500 == 0:
+            job.report(progress())
+        if not predicate(message):
+            continue
+        if message.created_at > bulk_cutoff:
+            batch.append(message)
+            if len(batch) == 100:
+                await flush()
+        else:
+            # History is newest-first, so everything from here on is too old for bulk delete.
+            if batch:
+                await flush()
+            try:
+                await message.delete()
+                single_deleted += 1
+            except discord.NotFound:
+                pass
+            except discord.HTTPException:
+                failed += 1
+            job.report(progress())
+            await asyncio.sleep(single_interval)
+        if bulk_deleted + single_deleted + len(batch) >= amount:
+            break
+    if batch:
+        await flush()
+    summary = (f"Deleted **{bulk_deleted + single_deleted}** message(s) in {channel.mention} after scanning "
+               f"{short_count(scanned)} (bulk {bulk_deleted}, single {single_deleted}).")
+    if failed:
+        summary += f"\n{failed} message(s) could not be deleted."
+    return summary
+
+@bot.command(name='purge')
+@access_level_required(1)
+async def purge(ctx, amount: int, *, filters: str = ""):
+    """Delete up to <amount> recent messages in this channel, optionally filtered. Pinned messages are kept.
+
+    Usage: :purge <amount> [user:@user] [contains:"text"] [links] [bots] [after:<message ID>]
+    Example: :purge 200 user:@John links
+    """
+    max_amount = getattr(config, 'PURGE_MAX_MESSAGES', 1000)
+    if not 1 <= amount <= max_amount:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Amount", f"Choose an amount between 1 and {max_amount}."))
+        return
+    if not ctx.channel.permissions_for(ctx.guild.me).manage_messages:
+        await ctx.send(embed=EmbedTemplates.error("Missing Permissions", "I need **Manage Messages** in this channel to purge."))
+        return
+    try:
+        predicate, after, description = parse_purge_filters(filters)
+    except (commands.BadArgument, ValueError) as e:
+        await ctx.send(embed=EmbedTemplates.error("Invalid Filter", str(e)))
+        return
+    channel = ctx.channel
+    try:
+        await ctx.message.delete()
+    except discord.HTTPException:
+        pass
+
+    async def work(job: Job) -> str:
+        summary = await purge_job(job, channel, ctx.message, after, predicate, amount)
+        await log_action(ctx, f"User {ctx.author.display_name} purged {channel.mention} ({description}): {summary}", ProfessionalColors.WARNING)
+        return summary
+
+    await JOB_RUNNER.submit(f"Purge #{channel.name}", ctx.author, channel, work)
 
 # --- Profile Command ---
 @bot.command(name='profile')
@@ -1923,7 +6711,10 @@ async def profile(ctx, member: discord.Member = None):
     # Live presence/activity
     presence_desc = []
     try:
-        presence_desc.append(f"Status: `{str(target.status).title()}`")
+        if bot.intents.presences:
+            presence_desc.append(f"Status: `{str(target.status).title()}`")
+        else:
+            presence_desc.append("Status: `Unknown (presence tracking off)`")
         if target.activity and getattr(target.activity, 'name', None):
             presence_desc.append(f"Activity: `{target.activity.name}`")
     except Exception:
@@ -2001,28 +6792,28 @@ class HelpCommandsView(discord.ui.View):
         # Level 1 - Moderation Team
         embed.add_field(
             name="🔧 Level 1 - Moderation Team",
-            value="`ping` - Check bot latency\n`commands` - Show this help menu\n`help` - Interactive help system\n`kick` - Kick a member from server\n`warn` - Warn a member about behavior\n`ban` - Ban a member from server\n`profile [@user]` - Show staff profile",
+            value="`ping` - Check bot latency\n`commands` - Show this help menu\n`help` - Interactive help system\n`kick` - Kick a member from server\n`warn` - Warn a member about behavior\n`ban` - Ban a member from server\n`tempban` - Ban a member for a set time\n`mute` / `unmute` - Time a member out\n`warnings @user` - Show recorded warnings\n`case` / `cases` / `reason` - Moderation cases\n`purge` - Bulk delete messages with filters\n`profile [@user]` - Show staff profile",
             inline=False
         )
         
         # Level 2 - Admin Team
         embed.add_field(
             name="👨‍💼 Level 2 - Admin Team",
-            value="`test_access` - Test your access level\n`announcement` - Send announcements to channels",
+            value="`test_access` - Test your access level\n`announcement` - Send announcements to channels\n`top [24h|7d]` - Most active users & channels\n`growth` - Member growth & retention\n`query` - Member aggregate queries\n`clearwarn @user [id]` - Clear warnings",
             inline=False
         )
         
         # Level 3 - Head Team
         embed.add_field(
             name="🎯 Level 3 - Head Team",
-            value="`promote` - Promote a staff member\n`demote` - Demote a staff member",
+            value="`promote` - Promote a staff member\n`demote` - Demote a staff member\n`lockdown [reason]` / `lockdown lift` - Lock or restore all public channels\n`raid` - Raid detector status & cohorts\n`massban` / `masskick` - Ban or kick many users at once",
             inline=False
         )
         
         # Level 4-5 - Management & Ownership Team
         embed.add_field(
             name="👑 Level 4-5 - Management & Ownership Team",
-            value="`panel` - Open system management panel\n*Plus all panel features: Bot restart, Channel backup*",
+            value="`panel` - Open system management panel\n`stats export [days]` - Export activity stats\n`gateway` - Gateway events & memory\n`pipeline` - Message pipeline timings\n`filter reload` - Reload the banned phrase filter\n`joinqueue` - Join queue metrics\n*Plus all panel features: Bot restart, Channel backup*",
             inline=False
         )
         
@@ -2075,21 +6866,21 @@ class HelpAccessLevelsView(discord.ui.View):
         # Level 3 - Head Team
         embed.add_field(
             name="🎯 Access Level 3",
-            value="**Assigned Rank:** Head Team\n**Assigned Commands:** All Level 1-2 commands + Promote, Demote",
+            value="**Assigned Rank:** Head Team\n**Assigned Commands:** All Level 1-2 commands + Promote, Demote, Lockdown, Raid, Massban, Masskick",
             inline=False
         )
         
         # Level 2 - Admin Team
         embed.add_field(
             name="👨‍💼 Access Level 2",
-            value="**Assigned Rank:** Admin Team\n**Assigned Commands:** All Level 1 commands + Test Access, Announcements",
+            value="**Assigned Rank:** Admin Team\n**Assigned Commands:** All Level 1 commands + Test Access, Announcements, Top, Growth, Query, Clearwarn",
             inline=False
         )
         
         # Level 1 - Moderation Team
         embed.add_field(
             name="🔧 Access Level 1",
-            value="**Assigned Rank:** Moderation Team\n**Assigned Commands:** Ping, Commands, Help, Kick, Warn, Ban",
+            value="**Assigned Rank:** Moderation Team\n**Assigned Commands:** Ping, Commands, Help, Kick, Warn, Warnings, Ban, Tempban, Mute, Unmute, Case, Cases, Reason, Purge",
             inline=False
         )
         
@@ -2121,21 +6912,21 @@ class HelpUsageGuideView(discord.ui.View):
         # Level 1 - Moderation commands
         embed.add_field(
             name="🔧 Level 1 - Moderation Commands",
-            value="`kick @user [reason]`\n`kick @itsmelotex Spamming in general chat`\n\n`warn @user [reason]`\n`warn @itsmelotex Using inappropriate language`\n\n`ban @user [reason]`\n`ban @itsmelotex Breaking server rules repeatedly`",
+            value="`kick @user [reason]`\n`kick @itsmelotex Spamming in general chat`\n\n`warn @user [reason]`\n`warn @itsmelotex Using inappropriate language`\n\n`ban @user [reason]`\n`ban @itsmelotex Breaking server rules repeatedly`\n\n`tempban @user [duration] [reason]`\n`tempban @itsmelotex 7d Repeated spam`\n\n`mute @user [duration] [reason]`\n`mute @itsmelotex 2h Arguing with staff`\n\n`warnings @user`\n`warnings @itsmelotex`\n\n`case [id]` / `reason [id] [text]`\n`reason 42 Posting scam links`\n\n`cases @user [target|moderator]`\n`cases @itsmelotex moderator`\n\n`purge [amount] [user:@user] [contains:\"text\"] [links] [bots] [after:id]`\n`purge 200 user:@itsmelotex links`",
             inline=False
         )
         
         # Level 2 - Admin commands
         embed.add_field(
             name="👨‍💼 Level 2 - Admin Commands",
-            value="`test_access`\n*No arguments required*\n\n`announcement [channel_var] [message]`\n`announcement ann-main Server maintenance scheduled`\n\n**Available channels:** ann-main, ann-sub, ann-staff, ann-tester, ann-trello, updates, sneak-peaks",
+            value="`test_access`\n*No arguments required*\n\n`announcement [channel_var] [message]`\n`announcement ann-main Server maintenance scheduled`\n\n`clearwarn @user [warning ID]`\n`clearwarn @itsmelotex 12`\n\n**Available channels:** ann-main, ann-sub, ann-staff, ann-tester, ann-trello, updates, sneak-peaks",
             inline=False
         )
         
         # Level 3 - Head commands
         embed.add_field(
             name="🎯 Level 3 - Head Commands",
-            value="`promote @user [rank]`\n`promote @itsmelotex Moderator`\n\n`demote @user [rank]`\n`demote @itsmelotex Moderator`\n\n**Available ranks:** Moderator, Senior Moderator, Administrator, Senior Administrator, Junior Administrator, Head Administrator, Head Moderator, Head Helper, Staff Supervisor, Developer, Senior Developer, Server Manager, Community Manager, Project Lead, Server Lead, Team Lead",
+            value="`promote @user [rank]`\n`promote @itsmelotex Moderator`\n\n`demote @user [rank]`\n`demote @itsmelotex Moderator`\n\n**Available ranks:** Moderator, Senior Moderator, Administrator, Senior Administrator, Junior Administrator, Head Administrator, Head Moderator, Head Helper, Staff Supervisor, Developer, Senior Developer, Server Manager, Community Manager, Project Lead, Server Lead, Team Lead\n\n`lockdown [reason]`\n`lockdown Raid in progress`\n`lockdown lift`",
             inline=False
         )
         
@@ -2244,7 +7035,26 @@ class CustomHelpCommand(commands.HelpCommand):
             'announcement': f"`{self.context.prefix}announcement ann-main Message`",
             'appeal': f"`{self.context.prefix}appeal 123456789`",
             'panel': f"`{self.context.prefix}panel`",
-            'profile': f"`{self.context.prefix}profile @user`"
+            'profile': f"`{self.context.prefix}profile @user`",
+            'top': f"`{self.context.prefix}top 7d`",
+            'growth': f"`{self.context.prefix}growth`",
+            'stats': f"`{self.context.prefix}stats export 90`",
+            'query': f"`{self.context.prefix}query count joined<30d noroles`",
+            'lockdown': f"`{self.context.prefix}lockdown Raid in progress`",
+            'pipeline': f"`{self.context.prefix}pipeline reset`",
+            'filter': f"`{self.context.prefix}filter test some message`",
+            'raid': f"`{self.context.prefix}raid`",
+            'joinqueue': f"`{self.context.prefix}joinqueue`",
+            'massban': f"`{self.context.prefix}massban cohort:last noroles | Raid accounts`",
+            'masskick': f"`{self.context.prefix}masskick joined<10m created<1d | Raid cleanup`",
+            'tempban': f"`{self.context.prefix}tempban @user 7d Repeated spam`",
+            'mute': f"`{self.context.prefix}mute @user 2h Arguing with staff`",
+            'warnings': f"`{self.context.prefix}warnings @user`",
+            'clearwarn': f"`{self.context.prefix}clearwarn @user 12`",
+            'case': f"`{self.context.prefix}case 42`",
+            'reason': f"`{self.context.prefix}reason 42 Posting scam links`",
+            'cases': f"`{self.context.prefix}cases @user moderator`",
+            'purge': f"`{self.context.prefix}purge 200 user:@user links`"
         }
         
         if command.name in examples:
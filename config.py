@@ -211,3 +211,171 @@ PANEL_LED_GIF_URL = ""
 # Optional: If set, panel will mention Sapphire when sending s!lock/s!unlock
 SAPPHIRE_BOT_ID = 678344927997853742
 
+
+# Activity tracking: number of keys each top-k sketch keeps (per hour/day bucket).
+# Reported counts overestimate by at most (messages in window / TOPK_CAPACITY).
+TOPK_CAPACITY = 100
+
+# Persistent data (activity stats, etc.) is stored in this directory.
+DATA_DIR = "data"
+# How often in-memory activity stats are flushed to disk.
+ACTIVITY_PERSIST_MINUTES = 5
+# How often the columnar member snapshot used by :query is rebuilt.
+MEMBER_SNAPSHOT_MINUTES = 30
+
+# Live panel: stats are recomputed at most every PANEL_STATS_MIN_INTERVAL seconds,
+# open panels refresh every PANEL_REFRESH_SECONDS, and edits to the same panel
+# message are spaced at least PANEL_EDIT_DEBOUNCE seconds apart.
+PANEL_STATS_MIN_INTERVAL = 30
+PANEL_REFRESH_SECONDS = 60
+PANEL_EDIT_DEBOUNCE = 5
+PANEL_TIMEOUT_SECONDS = 1800
+
+# Panel statistics mode:
+#   "presence"    - count online members/staff from presence data (needs the presences intent)
+#   "approximate" - poll fetch_guild(with_counts=True) for approximate_presence_count and
+#                   estimate online staff from recent messages and voice channels
+# Presence updates are usually the largest share of gateway traffic on a big guild, and the
+# presences intent also makes discord.py cache status/activities for every member. Setting
+# ENABLE_PRESENCES_INTENT = False removes both; the panel then uses "approximate" mode.
+# Compare the two modes with :gateway after running each for a while (GATEWAY_EVENT_STATS = True).
+PANEL_STATS_MODE = "presence"
+ENABLE_PRESENCES_INTENT = True
+APPROX_COUNTS_TTL_SECONDS = 60
+STAFF_ACTIVE_WINDOW_MINUTES = 15
+GATEWAY_EVENT_STATS = False
+
+# Background jobs (channel backups, stats exports, bulk moderation) run at most
+# JOB_MAX_CONCURRENT at a time; their progress messages are edited at most once
+# every JOB_PROGRESS_INTERVAL seconds.
+JOB_MAX_CONCURRENT = 2
+JOB_PROGRESS_INTERVAL = 3
+
+# :lockdown locks every public text channel (visible to and writable by @everyone)
+# except these, using up to LOCKDOWN_CONCURRENCY channel edits in parallel.
+LOCKDOWN_EXCLUDED_CHANNEL_IDS = []
+LOCKDOWN_CONCURRENCY = 4
+
+# Adaptive slowmode: when enabled, a channel's slowmode is raised to the highest level
+# whose message threshold it reaches within SLOWMODE_WINDOW_SECONDS, and lowered again
+# once the rate drops below SLOWMODE_RELEASE_RATIO of the current level's threshold.
+# Levels are (messages per window, slowmode seconds). A channel is edited at most once
+# per SLOWMODE_MIN_EDIT_INTERVAL seconds. Setting slowmode by hand hands the channel back to
+# staff for at least SLOWMODE_MANUAL_COOLDOWN_SECONDS and until its rate drops below the lowest level.
+SLOWMODE_AUTO_ENABLED = False
+SLOWMODE_WINDOW_SECONDS = 10
+SLOWMODE_LEVELS = [(20, 5), (40, 15), (80, 30)]
+SLOWMODE_RELEASE_RATIO = 0.5
+SLOWMODE_MIN_EDIT_INTERVAL = 60
+SLOWMODE_MANUAL_COOLDOWN_SECONDS = 900
+SLOWMODE_EXCLUDED_CHANNEL_IDS = []
+
+# Anti-spam: each user may send ANTISPAM_BURST messages at once, refilling at ANTISPAM_RATE
+# messages per second; sending the same text ANTISPAM_DUPLICATE_LIMIT times within their last
+# ANTISPAM_HISTORY messages also counts. Each violation is a strike (strikes reset after
+# ANTISPAM_STRIKE_WINDOW quiet seconds) and ANTISPAM_ACTIONS maps the strike count at which
+# each tier starts: delete the message, time the user out, escalate to the log channel.
+# Staff are exempt. At most ANTISPAM_MAX_TRACKED_USERS users are tracked (least recent evicted).
+ANTISPAM_ENABLED = True
+ANTISPAM_RATE = 1.0
+ANTISPAM_BURST = 8
+ANTISPAM_DUPLICATE_LIMIT = 3
+ANTISPAM_HISTORY = 8
+ANTISPAM_STRIKE_WINDOW = 300
+ANTISPAM_ACTIONS = {"delete": 1, "timeout": 3, "escalate": 5}
+ANTISPAM_TIMEOUT_MINUTES = 10
+ANTISPAM_MAX_TRACKED_USERS = 10000
+
+# Banned words/phrases, matched case-insensitively after normalizing fullwidth letters,
+# look-alike characters, common leetspeak (0->o, 1->i, 3->e, @->a, $->s, ...) and zero-width
+# characters. Add more in BANNED_PHRASES_FILE (one per line, # for comments) or under "phrases"
+# in data/filter_lists.json. With whole-word matching a phrase only matches between word
+# boundaries. :filter reload re-reads those two files; edits to this file need a restart.
+BANNED_PHRASES = []
+BANNED_PHRASES_FILE = ""
+BANNED_PHRASES_WHOLE_WORD = True
+
+# Link scanner: links to LINK_BLOCKED_DOMAINS (and all their subdomains) are removed and the
+# author gets an automatic warning. A more specific LINK_ALLOWED_DOMAINS entry overrides a block
+# (e.g. allow "cdn.example.com" under a blocked "example.com"). With LINK_BLOCK_UNLISTED = True
+# only allow-listed domains may be posted. Invites to servers other than this one (or
+# INVITE_ALLOWED_GUILD_IDS) are removed too; resolved invites are cached for INVITE_CACHE_TTL_SECONDS.
+# Extra domains can go under "blocked_domains" / "allowed_domains" in data/filter_lists.json,
+# which :filter reload re-reads without a restart.
+LINK_BLOCKED_DOMAINS = []
+LINK_ALLOWED_DOMAINS = ["discord.com", "discord.gg", "tenor.com", "youtube.com", "youtu.be"]
+LINK_BLOCK_UNLISTED = False
+BLOCK_FOREIGN_INVITES = True
+INVITE_ALLOWED_GUILD_IDS = []
+INVITE_CACHE_TTL_SECONDS = 3600
+
+# Raid detection: joins in the last RAID_WINDOW_SECONDS are scored as
+#   joins + young accounts * RAID_YOUNG_ACCOUNT_WEIGHT + default avatars * RAID_DEFAULT_AVATAR_WEIGHT
+#   + largest group of look-alike names (3+) * RAID_SIMILAR_NAME_WEIGHT
+# Reaching RAID_SCORE_THRESHOLD alerts the log channel (pinging RAID_ALERT_ROLE_ID if set) and
+# records the joiners as a cohort in data/raid_cohorts.json for :massban / :masskick. Optionally
+# raise the verification level to High and/or start a :lockdown automatically.
+RAID_DETECTION_ENABLED = True
+RAID_WINDOW_SECONDS = 60
+RAID_SCORE_THRESHOLD = 25
+RAID_YOUNG_ACCOUNT_DAYS = 7
+RAID_YOUNG_ACCOUNT_WEIGHT = 1.0
+RAID_DEFAULT_AVATAR_WEIGHT = 0.5
+RAID_SIMILAR_NAME_WEIGHT = 1.0
+RAID_ALERT_ROLE_ID = 0
+RAID_RAISE_VERIFICATION = False
+RAID_AUTO_LOCKDOWN = False
+RAID_COHORTS_KEPT = 20
+
+# Alt-account detection: every join is compared against an in-memory index of banned users
+# (synced from the ban list at startup and updated on every ban). Name similarity, identical
+# avatars and account creation within ALT_CREATION_WINDOW_HOURS of a banned account add up
+# using ALT_MATCH_WEIGHTS; matches scoring at least ALT_MATCH_THRESHOLD (0-1) are flagged
+# in the log channel.
+ALT_DETECTION_ENABLED = True
+ALT_MATCH_THRESHOLD = 0.6
+ALT_MATCH_WEIGHTS = {"name": 0.7, "avatar": 0.6, "created": 0.2}
+ALT_CREATION_WINDOW_HOURS = 24
+
+# Join side effects are queued instead of running inside on_member_join. Welcomes are posted
+# to WELCOME_CHANNEL_ID (0 = off) as one combined message per WELCOME_BATCH_SECONDS or
+# WELCOME_BATCH_SIZE joins; WELCOME_MESSAGE may use {guild}, {mentions} and {count}.
+# AUTO_ROLE_IDS are granted at most JOIN_ROLE_GRANTS_PER_SECOND. Welcomes are skipped during a
+# raid or once JOIN_QUEUE_SHED_DEPTH grants are waiting; grants beyond JOIN_QUEUE_MAX_DEPTH are dropped.
+WELCOME_CHANNEL_ID = 0
+WELCOME_MESSAGE = "Welcome to **{guild}**, {mentions}!"
+WELCOME_BATCH_SECONDS = 5
+WELCOME_BATCH_SIZE = 20
+AUTO_ROLE_IDS = []
+JOIN_ROLE_GRANTS_PER_SECOND = 2
+JOIN_QUEUE_SHED_DEPTH = 200
+JOIN_QUEUE_MAX_DEPTH = 2000
+
+# :massban / :masskick accept at most MASS_ACTION_MAX_TARGETS users. DMs go out
+# MASS_DM_CONCURRENCY at a time before the action, kicks run MASS_KICK_CONCURRENCY at a
+# time, and mass bans delete the last MASSBAN_DELETE_MESSAGE_SECONDS of each user's messages.
+MASS_ACTION_MAX_TARGETS = 1000
+MASS_DM_CONCURRENCY = 5
+MASS_KICK_CONCURRENCY = 3
+MASSBAN_DELETE_MESSAGE_SECONDS = 3600
+
+# Tempban/mute expiries are kept in data/punishments.jsonl; after downtime, overdue ones are
+# processed PUNISHMENT_BATCH_SIZE at a time.
+PUNISHMENT_BATCH_SIZE = 50
+
+# Warning ledger: rolling windows shown by :warnings, and automatic escalation once a
+# member's warning count within WARN_ESCALATION_WINDOW reaches a threshold.
+# Each step is (action, duration) where action is "timeout", "kick" or "ban".
+WARN_WINDOWS = ["24h", "7d", "30d"]
+WARN_ESCALATION_WINDOW = "30d"
+WARN_ESCALATION = {
+    3: ("timeout", "1h"),
+    5: ("kick", None),
+}
+
+# :purge limits. At most PURGE_MAX_MESSAGES are deleted and PURGE_SCAN_LIMIT scanned per run;
+# messages older than 14 days cannot be bulk deleted and are removed one every
+# PURGE_SINGLE_DELETE_INTERVAL seconds.
+PURGE_MAX_MESSAGES = 1000
+PURGE_SCAN_LIMIT = 5000
+PURGE_SINGLE_DELETE_INTERVAL = 1.0